@@ -1,7 +1,9 @@
 // src/routes/events.routes.ts
 import { Router } from "express";
+import axios from "axios";
 import { authenticateToken } from "../middleware/authentication.middleware";
 const r = Router();
+const ML_BASE = process.env.ML_BASE || "http://localhost:8000";
 
 r.post("/", authenticateToken, async (req, res) => {
   const db = (req as any).db; // nếu dùng mongoose thuần: mongoose.connection.db
@@ -23,6 +25,8 @@ r.post("/", authenticateToken, async (req, res) => {
     score,
     createdAt: new Date(),
   });
+  // xoá kết quả gợi ý đã cache của user bên ml-service (không chặn response)
+  axios.post(`${ML_BASE}/cache/invalidate`, { userIds: [String(userId)] }).catch(() => {});
   res.json({ ok: true });
 });
 
@@ -0,0 +1,124 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # faiss-cpu là tuỳ chọn, không có thì luôn brute force
+    faiss = None
+
+# Index ANN (faiss, inner product) cho vector bài dạng dense (LSA).
+# - ANN_INDEX: none | flat | ivf | hnsw (mặc định none = brute force như cũ)
+# - catalog < ANN_MIN_ITEMS bài: không dựng index, nhân ma trận trực tiếp nhanh hơn
+# - ANN chỉ lấy ứng viên; điểm cuối luôn tính lại chính xác trên doc_matrix (re-rank)
+
+ANN_INDEX = os.environ.get("ANN_INDEX", "none").lower()
+ANN_KINDS = ("none", "flat", "ivf", "hnsw")
+ANN_MIN_ITEMS = int(os.environ.get("ANN_MIN_ITEMS", "20000"))
+ANN_CANDIDATES = int(os.environ.get("ANN_CANDIDATES", "200"))
+ANN_NLIST = int(os.environ.get("ANN_NLIST", "0"))          # 0 = tự chọn ~ 4*sqrt(n)
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "16"))
+ANN_HNSW_M = int(os.environ.get("ANN_HNSW_M", "32"))
+ANN_EF_SEARCH = int(os.environ.get("ANN_EF_SEARCH", "128"))
+ANN_EF_CONSTRUCTION = int(os.environ.get("ANN_EF_CONSTRUCTION", "80"))
+
+
+def available() -> bool:
+    return faiss is not None
+
+
+class AnnIndex:
+    """ Bọc 1 index faiss (METRIC_INNER_PRODUCT) trên ma trận float32 (n x d). """
+    def __init__(self, index, kind: str):
+        self.index = index
+        self.kind = kind
+
+    @property
+    def ntotal(self) -> int:
+        return int(self.index.ntotal)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, kind: str) -> "AnnIndex":
+        X = np.ascontiguousarray(vectors, dtype=np.float32)
+        n, d = X.shape
+        if kind == "flat":
+            index = faiss.IndexFlatIP(d)
+        elif kind == "ivf":
+            nlist = ANN_NLIST or max(1, min(n // 39, int(4 * np.sqrt(n))))
+            quantizer = faiss.IndexFlatIP(d)
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.train(X)
+            index.nprobe = min(ANN_NPROBE, nlist)
+        elif kind == "hnsw":
+            index = faiss.IndexHNSWFlat(d, ANN_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = ANN_EF_CONSTRUCTION
+            index.hnsw.efSearch = ANN_EF_SEARCH
+        else:
+            raise ValueError("unknown ANN index kind: %s" % kind)
+        index.add(X)
+        return cls(index, kind)
+
+    def search(self, queries: np.ndarray, n: int) -> np.ndarray:
+        """ → (n_queries x n) index ứng viên, -1 nếu thiếu. """
+        Q = np.ascontiguousarray(queries, dtype=np.float32)
+        n = max(1, min(int(n), self.ntotal))
+        _, idx = self.index.search(Q, n)
+        return idx
+
+    def save(self, path: str):
+        faiss.write_index(self.index, path)
+
+    @classmethod
+    def read(cls, path: str, kind: str) -> "AnnIndex":
+        index = faiss.read_index(path)
+        if kind == "ivf":
+            index.nprobe = min(ANN_NPROBE, index.nlist)
+        elif kind == "hnsw":
+            index.hnsw.efSearch = ANN_EF_SEARCH
+        return cls(index, kind)
+
+
+def build_index(vectors, kind: Optional[str] = None, min_items: Optional[int] = None) -> Optional[AnnIndex]:
+    """ Dựng index nếu được bật, có faiss, vectors dense và đủ lớn; không thì None (brute force). """
+    kind = (kind or ANN_INDEX).lower()
+    min_items = ANN_MIN_ITEMS if min_items is None else min_items
+    if kind == "none" or faiss is None or vectors is None:
+        return None
+    if not isinstance(vectors, np.ndarray) or vectors.ndim != 2 or vectors.shape[0] < max(1, min_items):
+        return None
+    return AnnIndex.build(vectors, kind)
+
+
+def load_or_build(model_path: str, vectors, kind: Optional[str] = None,
+                  min_items: Optional[int] = None) -> Optional[AnnIndex]:
+    """ Đọc ann-<kind>.index trong thư mục version nếu có, không thì dựng rồi ghi lại (best effort). """
+    kind = (kind or ANN_INDEX).lower()
+    if kind == "none" or faiss is None:
+        return None
+    path = os.path.join(model_path, "ann-%s.index" % kind)
+    if os.path.exists(path):
+        try:
+            ann = AnnIndex.read(path, kind)
+            if ann.ntotal == getattr(vectors, "shape", (0,))[0]:
+                return ann
+        except Exception:
+            pass
+    ann = build_index(vectors, kind, min_items)
+    if ann is not None:
+        try:
+            ann.save(path)
+        except Exception:
+            pass
+    return ann
+
+
+def exact_top_k(vectors: np.ndarray, query: np.ndarray, cand: np.ndarray, k: int):
+    """ Re-rank chính xác: điểm = vectors[cand] @ query, trả (idx, score) top-k giảm dần. """
+    if len(cand) == 0 or k <= 0:
+        return cand[:0], np.zeros(0, dtype=np.float32)
+    scores = np.asarray(vectors[cand] @ query, dtype=np.float32).ravel()
+    k = min(k, len(cand))
+    part = np.argpartition(-scores, k - 1)[:k] if k < len(cand) else np.arange(len(cand))
+    order = part[np.lexsort((cand[part], -scores[part]))]
+    return cand[order], scores[order]
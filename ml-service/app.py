@@ -1,19 +1,41 @@
+import time
+_T_IMPORT = time.perf_counter()     # đo thời gian import của service (sklearn/joblib chỉ import khi load model)
 import os
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import List, Literal, Optional
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from pymongo import MongoClient
 
-from tfidf_service import TfidfReco
+from db import init_pool, close_all, pool_stats, io_limit
+from data_loader import load_user_contexts, load_user_context_async
+import compute
+from tfidf_service import TfidfReco, goal_key
+from training import TrainManager
+from cache import ResultCache
+import metrics
+from metrics import REQUEST_SECONDS, stage
 from questions import DEFAULT_QUESTIONS, answers_to_goals, infer_max_level
 
+IMPORT_SECONDS = time.perf_counter() - _T_IMPORT
+
 APP_TITLE = os.environ.get("APP_TITLE", "Guitar TF-IDF Recommender")
 MODEL_DIR = os.environ.get("MODEL_DIR", "model_store")
 
 MONGODB_URI_FULL = os.environ.get("MONGODB_URI")
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DB = os.environ.get("MONGO_DB", "chorddb")
+MAX_BATCH_USERS = int(os.environ.get("MAX_BATCH_USERS", "5000"))
+
+# cache kết quả /recommend theo (userId, k, maxLevel, goals, model version)
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "100000"))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "300"))
+
+# load model nền sau khi mở port (/ready báo xong); =0 để load đồng bộ trong startup như cũ
+MODEL_LOAD_BACKGROUND = os.environ.get("MODEL_LOAD_BACKGROUND", "1") != "0"
 
 app = FastAPI(title=APP_TITLE)
 app.add_middleware(
@@ -24,13 +46,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+
+@app.middleware("http")
+async def _time_request(request: Request, call_next):
+    t0 = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(time.perf_counter() - t0, getattr(route, "path", "unmatched"))
+
+
 ENGINE: Optional[TfidfReco] = None
+TRAINER = TrainManager()
+RESULTS = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+# trạng thái khởi động: starting → loading → ready | failed, thời gian từng bước (giây)
+STARTUP = {"state": "starting", "import_s": IMPORT_SECONDS, "meta_s": None, "load_s": None,
+           "ready_s": None, "error": None}
+_T_STARTUP = time.perf_counter()
 
 
 class TrainReq(BaseModel):
     mongo_uri: Optional[str] = None
     db_name: Optional[str] = None
     use_lsa: bool = True
+    vectorizer: Literal["tfidf", "hashing"] = "tfidf"   # hashing: RAM không phụ thuộc kích thước vocab
 
 
 class RecReq(BaseModel):
@@ -40,23 +82,157 @@ class RecReq(BaseModel):
     goals: Optional[List[str]] = None
 
 
+class BatchUserReq(BaseModel):
+    userId: str
+    k: Optional[int] = None
+    maxLevel: Optional[int] = None
+    goals: Optional[List[str]] = None
+
+
+class BatchRecReq(BaseModel):
+    userIds: List[str] = []            # dùng k mặc định
+    users: List[BatchUserReq] = []     # k/maxLevel/goals riêng từng user
+    k: int = 5
+
+
+class FoldInReq(BaseModel):
+    lessonId: str
+
+
+class EventReq(BaseModel):
+    userId: str
+    lessonId: Optional[str] = None
+    lessonSlug: Optional[str] = None
+    type: str = "view"
+    progress: float = 0
+    score: float = 1
+    createdAt: Optional[datetime] = None
+
+
+class EventsReq(BaseModel):
+    events: List[EventReq]
+
+
+class InvalidateReq(BaseModel):
+    userIds: List[str]
+
+
 class SaveAnswersReq(BaseModel):
     userId: str
     answers: dict  # {questionKey: optionKey or [optionKey,...]}
 
 
+def _load_model():
+    """ item_meta trước (cold-start phục vụ được ngay), rồi model đầy đủ (sklearn, doc_matrix, ANN, goal cache). """
+    t0 = time.perf_counter()
+    try:
+        ENGINE.load_meta()
+        STARTUP["meta_s"] = time.perf_counter() - t0
+        t1 = time.perf_counter()
+        ENGINE.load_current()
+        STARTUP["load_s"] = time.perf_counter() - t1
+        STARTUP["state"] = "ready"
+    except Exception as e:
+        STARTUP["state"], STARTUP["error"] = "failed", str(e)
+    STARTUP["ready_s"] = time.perf_counter() - _T_STARTUP
+
+
 @app.on_event("startup")
 def _startup():
-    global ENGINE
+    global ENGINE, _T_STARTUP
+    _T_STARTUP = time.perf_counter()
     ENGINE = TfidfReco(model_dir=MODEL_DIR, mongo_uri=MONGO_URI, db_name=MONGO_DB)
     if MONGODB_URI_FULL:
         ENGINE.set_mongodb_uri_full(MONGODB_URI_FULL)
-    ENGINE.load()
+    init_pool(ENGINE.mongo_uri)
+    STARTUP.update(state="loading", meta_s=None, load_s=None, ready_s=None, error=None)
+    if MODEL_LOAD_BACKGROUND:
+        threading.Thread(target=_load_model, name="model-load", daemon=True).start()
+    else:
+        _load_model()
+
+
+@app.on_event("shutdown")
+def _shutdown():
+    TRAINER.shutdown()
+    compute.shutdown()
+    close_all()
 
 
 @app.get("/health")
 def health():
-    return {"ok": True, "model_loaded": ENGINE.is_loaded()}
+    """ Liveness: process còn chạy (kể cả khi model đang load). """
+    snap = ENGINE.snapshot()
+    return {"ok": True, "model_loaded": snap.is_loaded, "model_version": snap.version,
+            "ann_index": snap.ann.kind if snap.ann is not None else None,
+            "vectorizer": snap.vectorizer_kind, "startup": STARTUP["state"]}
+
+
+@app.get("/ready")
+def ready():
+    """
+    Readiness: 200 khi đã load xong model (hoặc chưa có model nào để load), 503 khi đang load / lỗi.
+    Trong lúc chưa ready, /recommend trả cold-start theo goals.
+    """
+    body = {"ready": STARTUP["state"] == "ready", **STARTUP,
+            "model_version": ENGINE.model_version if ENGINE else None,
+            "sklearn_imported": "sklearn" in sys.modules}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+
+@app.get("/diagnostics/db")
+def diagnostics_db():
+    """ Thống kê connection pool Mongo: số kết nối đang checkout, thời gian chờ. """
+    return pool_stats()
+
+
+@app.get("/diagnostics/compute")
+def diagnostics_compute():
+    """ Executor chấm điểm: số luồng, đang chạy, đang chờ. """
+    return compute.stats()
+
+
+@app.get("/diagnostics/cache")
+def diagnostics_cache():
+    """ Bộ đếm hit/miss/eviction của cache kết quả và cache goal vector. """
+    return {"results": RESULTS.stats(), "goals": ENGINE.goal_cache.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_text():
+    """ Prometheus text format: histogram theo stage/endpoint + model, cache, executor. """
+    snap = ENGINE.snapshot()
+    caches = {"results": RESULTS.stats(), "goals": ENGINE.goal_cache.stats()}
+    comp = compute.stats()
+    extra = [
+        metrics.sample("mlsvc_model_info", "gauge", "Active model version",
+                       [({"version": snap.version or "", "vectorizer_version": snap.vectorizer_version or "",
+                          "vectorizer": snap.vectorizer_kind or "none",
+                          "ann_index": snap.ann.kind if snap.ann is not None else "none"}, 1)]),
+        metrics.sample("mlsvc_model_loaded", "gauge", "1 if a trained model is loaded", [({}, int(snap.is_loaded))]),
+        metrics.sample("mlsvc_model_items", "gauge", "Number of items in the active model", [({}, snap.store.n)]),
+        metrics.sample("mlsvc_doc_matrix_bytes", "gauge", "Bytes of doc_matrix arrays", [({}, snap.doc_matrix_bytes)]),
+        metrics.sample("mlsvc_ready", "gauge", "1 once the startup model load finished",
+                       [({}, int(STARTUP["state"] == "ready"))]),
+        metrics.sample("mlsvc_startup_seconds", "gauge", "Startup phase durations in seconds",
+                       [({"phase": p}, STARTUP[p + "_s"]) for p in ("import", "meta", "load", "ready")
+                        if STARTUP[p + "_s"] is not None]),
+        metrics.sample("mlsvc_fold_in_items", "gauge", "Items folded in since last full train",
+                       [({}, ENGINE.drift().get("items", 0))]),
+    ]
+    for name, doc in (("hits", "Cache hits"), ("misses", "Cache misses"), ("evictions", "Cache evictions")):
+        extra.append(metrics.sample("mlsvc_cache_%s_total" % name, "counter", doc,
+                                    [({"cache": c}, st[name]) for c, st in caches.items()]))
+    extra.append(metrics.sample("mlsvc_cache_invalidations_total", "counter", "Result cache entries invalidated",
+                                [({"cache": "results"}, caches["results"]["invalidations"])]))
+    extra.append(metrics.sample("mlsvc_cache_stale_puts_total", "counter",
+                                "Results not cached because the user was invalidated while computing",
+                                [({"cache": "results"}, caches["results"]["stale_puts"])]))
+    extra.append(metrics.sample("mlsvc_cache_size", "gauge", "Cache entries",
+                                [({"cache": c}, st["size"]) for c, st in caches.items()]))
+    extra.append(metrics.sample("mlsvc_compute_tasks", "gauge", "Compute executor tasks",
+                                [({"state": "running"}, comp["running"]), ({"state": "waiting"}, comp["waiting"])]))
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.get("/questions")
@@ -65,7 +241,7 @@ def get_questions():
 
 
 @app.post("/save-answers")
-def save_answers(req: SaveAnswersReq):
+async def save_answers(req: SaveAnswersReq):
     """
     Lưu câu trả lời:
     - Tự động tách "đã biết" (known_topics) từ phần basic
@@ -80,20 +256,21 @@ def save_answers(req: SaveAnswersReq):
         if "basic" in req.answers:
             basic_known = [x for x in req.answers["basic"] if isinstance(x, str)]
 
-        db = ENGINE._db()
-        db.learning_states.update_one(
-            {"userId": req.userId},
-            {
-                "$set": {
-                    "userId": req.userId,
-                    "answers": req.answers,
-                    "goals": goals,
-                    "levelHint": level_hint,
-                    "known_topics": basic_known
-                }
-            },
-            upsert=True
-        )
+        async with io_limit():
+            await ENGINE._adb().learning_states.update_one(
+                {"userId": req.userId},
+                {
+                    "$set": {
+                        "userId": req.userId,
+                        "answers": req.answers,
+                        "goals": goals,
+                        "levelHint": level_hint,
+                        "known_topics": basic_known
+                    }
+                },
+                upsert=True
+            )
+        RESULTS.invalidate_user(req.userId)
         return {"ok": True, "goals": goals, "levelHint": level_hint, "known": basic_known}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -101,67 +278,141 @@ def save_answers(req: SaveAnswersReq):
 
 @app.post("/train")
 def train(req: TrainReq):
+    """
+    Train chạy nền: trả job_id ngay, theo dõi ở /train/status.
+    Model mới chỉ được swap vào khi train xong.
+    """
+    if req.mongo_uri and req.db_name:
+        ENGINE.set_mongo(req.mongo_uri, req.db_name)
+    job, created = TRAINER.submit(ENGINE, use_lsa=req.use_lsa, vectorizer_mode=req.vectorizer)
+    if not created:
+        raise HTTPException(status_code=409, detail=f"training job {job.job_id} is already {job.state}")
+    return {"ok": True, "job_id": job.job_id, "state": job.state}
+
+
+@app.get("/train/status")
+def train_status(job_id: Optional[str] = None):
+    job = TRAINER.get(job_id)
+    if job_id and job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return {"job": job.to_dict() if job else None, "active_version": ENGINE.model_version,
+            "drift": ENGINE.drift()}
+
+
+@app.post("/fold-in")
+def fold_in(req: FoldInReq):
+    """
+    Thêm/cập nhật 1 bài (mới publish/sửa) vào model hiện tại không cần train lại.
+    drift.refit_recommended = true → nên gọi /train.
+    """
+    try:
+        return {"ok": True, **ENGINE.fold_in(req.lessonId)}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="lesson not found")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/events")
+async def ingest_events(req: EventsReq):
+    """
+    Ghi events (view/complete/...) và xóa kết quả gợi ý đã cache của các user liên quan.
+    """
+    now = datetime.now(timezone.utc)
+    docs = [{**e.model_dump(), "createdAt": e.createdAt or now} for e in req.events]
     try:
-        if req.mongo_uri and req.db_name:
-            ENGINE.set_mongo(req.mongo_uri, req.db_name)
-        path = ENGINE.train_and_save(use_lsa=req.use_lsa)
-        ENGINE.load()
-        return {"ok": True, "model_path": path}
+        if docs:
+            async with io_limit():
+                await ENGINE._adb().events.insert_many(docs)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    invalidated = sum(RESULTS.invalidate_user(u) for u in {e.userId for e in req.events})
+    return {"ok": True, "inserted": len(docs), "invalidated": invalidated}
+
+
+@app.post("/cache/invalidate")
+def invalidate_cache(req: InvalidateReq):
+    """ Hook cho nơi khác tự ghi events/learning_states (Server Node): xóa cache của user. """
+    return {"ok": True, "invalidated": sum(RESULTS.invalidate_user(u) for u in set(req.userIds))}
 
 
 @app.post("/recommend")
-def recommend(req: RecReq):
+async def recommend(req: RecReq):
     """
     Gợi ý bài học, bỏ qua những topic/tags nằm trong 'known_topics'.
+    Đọc context bằng motor trên event loop, chấm điểm trên compute executor.
+    Lần gọi lặp lại (chưa có event/answers mới, cùng model) trả từ RESULTS, không đụng Mongo.
     """
+    key = (req.userId, req.k, req.maxLevel, goal_key(req.goals), ENGINE.model_version)
+    items = RESULTS.get(key)
+    if items is not None:
+        return {"items": items}
+    token = RESULTS.token()     # /save-answers, /events đến trong lúc tính → không cache kết quả này
     try:
+        with stage("context_fetch"):
+            ctx = await load_user_context_async(ENGINE._adb(), req.userId)
         max_level = req.maxLevel
-        db = ENGINE._db()
-        st = db.learning_states.find_one({"userId": req.userId}, {"levelHint": 1, "known_topics": 1})
-
-        known = set(st.get("known_topics", [])) if st else set()
-        if max_level is None and st:
-            max_level = st.get("levelHint")
+        if max_level is None:
+            max_level = ctx.level_hint
 
-        items = ENGINE.recommend(
+        # engine đã lọc bỏ những bài thuộc known_topics
+        items = await compute.run_compute(
+            ENGINE.recommend,
             user_id=req.userId,
             k=req.k,
             max_level=max_level,
-            goals=req.goals or []
+            goals=req.goals or [],
+            ctx=ctx,
         )
+        RESULTS.put(key, items, token=token)
+
+        return {"items": items}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # ❌ Lọc bỏ những bài user đã biết
-        filtered = []
-        for it in items:
-            meta = ENGINE.items_meta.get(it["id"], {})
-            tags = set(meta.get("tags", [])) | {meta.get("topic")}
-            if not (tags & known):
-                filtered.append(it)
 
-        return {"items": filtered}
+@app.post("/recommend/batch")
+def recommend_batch(req: BatchRecReq):
+    """
+    Gợi ý cho nhiều user trong 1 call (email hằng đêm, prefetch home feed):
+    context đọc bằng $in, điểm tính bằng nhân ma trận.
+    """
+    users = [BatchUserReq(userId=u) for u in req.userIds] + list(req.users)
+    if len(users) > MAX_BATCH_USERS:
+        raise HTTPException(status_code=400, detail=f"too many users (max {MAX_BATCH_USERS})")
+    try:
+        with stage("context_fetch"):
+            ctxs = load_user_contexts(ENGINE._db(), [u.userId for u in users])
+        results = ENGINE.recommend_many(
+            [ctxs[u.userId] for u in users],
+            [u.k or req.k for u in users],
+            [u.maxLevel if u.maxLevel is not None else ctxs[u.userId].level_hint for u in users],
+            [u.goals or [] for u in users],
+        )
+        return {"results": [{"userId": u.userId, "items": items} for u, items in zip(users, results)]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/known")
-def get_known(userId: str):
+async def get_known(userId: str):
     """
     Trả về danh sách bài tương ứng với known_topics để hiển thị "Ôn tập".
     """
     try:
-        db = ENGINE._db()
-        st = db.learning_states.find_one({"userId": userId}, {"known_topics": 1})
+        async with io_limit():
+            st = await ENGINE._adb().learning_states.find_one({"userId": userId}, {"known_topics": 1})
         if not st or not st.get("known_topics"):
             return {"items": []}
 
-        known = set(st["known_topics"])
+        # posting list tag/topic → index item, không duyệt toàn bộ items_meta
+        snap = ENGINE.snapshot()
         items = []
-        for iid, meta in ENGINE.items_meta.items():
-            tags = set(meta.get("tags", [])) | {meta.get("topic")}
-            if tags & known:
-                items.append({"id": iid, **meta})
+        for idx in snap.store.indices_any(st["known_topics"]):
+            iid = snap.store.ids[idx]
+            items.append({"id": iid, **snap.items_meta.get(iid, {})})
         return {"items": items}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,177 @@
+import json
+import os
+import shutil
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from lean_vectorizer import LEAN_FILES, LeanVectorizer
+from scoring import row_norms
+
+# Định dạng model trên đĩa (mỗi thư mục version):
+# - manifest.json       : kind (dense|csr), shape, số item
+# - vectorizer.pkl      : chỉ vectorizer (joblib), không kèm ma trận
+# - doc_matrix.npy      : float32, LSA (dense)    | doc_data/doc_indices/doc_indptr.npy: CSR float32/int32
+# - ids.npy             : id theo thứ tự dòng (bytes utf-8)
+# - ids_sorted.npy + ids_order.npy : tra id → idx bằng searchsorted, không dựng dict
+# - doc_norms.npy       : norm L2 từng dòng doc_matrix (float32), cho kernel chấm điểm (scoring.py)
+# - vectorizer_lean.json + vectorizer_*.npy : bản inference không cần sklearn (lean_vectorizer.py), nếu export được
+# Mảng được mở bằng mmap_mode="r" → N worker uvicorn dùng chung 1 bản trong page cache.
+
+MANIFEST_NAME = "manifest.json"
+VECTORIZER_NAME = "vectorizer.pkl"
+FORMAT_VERSION = 2
+
+# serving dùng bản lean nếu version có (mặc định); =0 để luôn unpickle vectorizer.pkl
+LEAN_VECTORIZER = os.environ.get("LEAN_VECTORIZER", "1") != "0"
+
+
+class IdList:
+    """ idx → id trên mảng ids (có thể là mmap). """
+    def __init__(self, ids: np.ndarray):
+        self._ids = ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __getitem__(self, idx: int) -> str:
+        return self._ids[idx].decode("utf-8")
+
+    def __iter__(self):
+        for raw in self._ids:
+            yield raw.decode("utf-8")
+
+
+class IdIndex:
+    """ id → idx: searchsorted trên ids đã sort + hoán vị về thứ tự dòng. """
+    def __init__(self, sorted_ids: np.ndarray, order: np.ndarray):
+        self._sorted = sorted_ids
+        self._order = order
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+    def get(self, iid: str, default: Optional[int] = None) -> Optional[int]:
+        if not len(self._sorted):
+            return default
+        try:
+            key = iid.encode("utf-8")
+        except AttributeError:
+            return default
+        pos = int(np.searchsorted(self._sorted, key))
+        if pos < len(self._sorted) and self._sorted[pos] == key:
+            return int(self._order[pos])
+        return default
+
+    def __contains__(self, iid: str) -> bool:
+        return self.get(iid) is not None
+
+    def __getitem__(self, iid: str) -> int:
+        idx = self.get(iid)
+        if idx is None:
+            raise KeyError(iid)
+        return idx
+
+
+def _encode_ids(ids: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    arr = np.array([i.encode("utf-8") for i in ids], dtype=bytes) if ids else np.zeros(0, dtype="S1")
+    order = np.argsort(arr, kind="stable").astype(np.int32)
+    return arr, arr[order], order
+
+
+def build_id_maps(ids: List[str]) -> Tuple[IdList, IdIndex]:
+    """ Dựng IdList/IdIndex trong RAM (model cũ dạng dict, hoặc vừa fold-in). """
+    arr, sorted_ids, order = _encode_ids(ids)
+    return IdList(arr), IdIndex(sorted_ids, order)
+
+
+def save_model(path: str, vectorizer, doc_matrix, ids: List[str],
+               extra: Optional[dict] = None, vectorizer_from: Optional[str] = None,
+               lean: Optional[LeanVectorizer] = None) -> dict:
+    """
+    Ghi 1 version. vectorizer_from: thư mục version có sẵn vectorizer.pkl (+ bản lean) giống hệt
+    (fold-in) → link/copy file thay vì pickle lại. lean: bản inference không cần sklearn.
+    """
+    if vectorizer_from:
+        for name in (VECTORIZER_NAME,) + LEAN_FILES:
+            src = os.path.join(vectorizer_from, name)
+            if not os.path.exists(src):
+                continue
+            try:
+                os.link(src, os.path.join(path, name))
+            except OSError:
+                shutil.copy2(src, os.path.join(path, name))
+    else:
+        from joblib import dump
+        dump(vectorizer, os.path.join(path, VECTORIZER_NAME))
+        if lean is not None:
+            lean.save(path)
+    if sparse.issparse(doc_matrix):
+        X = sparse.csr_matrix(doc_matrix, dtype=np.float32)
+        index_dtype = np.int32 if X.nnz < np.iinfo(np.int32).max else np.int64
+        np.save(os.path.join(path, "doc_data.npy"), X.data)
+        np.save(os.path.join(path, "doc_indices.npy"), X.indices.astype(index_dtype))
+        np.save(os.path.join(path, "doc_indptr.npy"), X.indptr.astype(index_dtype))
+        kind = "csr"
+    else:
+        np.save(os.path.join(path, "doc_matrix.npy"), np.ascontiguousarray(doc_matrix, dtype=np.float32))
+        kind = "dense"
+
+    np.save(os.path.join(path, "doc_norms.npy"), row_norms(doc_matrix))
+
+    arr, sorted_ids, order = _encode_ids(ids)
+    np.save(os.path.join(path, "ids.npy"), arr)
+    np.save(os.path.join(path, "ids_sorted.npy"), sorted_ids)
+    np.save(os.path.join(path, "ids_order.npy"), order)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "kind": kind,
+        "shape": [int(x) for x in doc_matrix.shape],
+        "n_items": len(ids),
+    }
+    manifest.update(extra or {})
+    with open(os.path.join(path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def has_model(path: str) -> bool:
+    return os.path.exists(os.path.join(path, MANIFEST_NAME))
+
+
+def load_model(path: str, mmap: bool = True):
+    """ → (vectorizer, doc_matrix, IdList, IdIndex, manifest); mảng mở bằng mmap. """
+    with open(os.path.join(path, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    mode = "r" if mmap else None
+
+    def _npy(name):
+        return np.load(os.path.join(path, name), mmap_mode=mode)
+
+    if manifest["kind"] == "csr":
+        doc_matrix = sparse.csr_matrix(
+            (_npy("doc_data.npy"), _npy("doc_indices.npy"), _npy("doc_indptr.npy")),
+            shape=tuple(manifest["shape"]), copy=False,
+        )
+    else:
+        doc_matrix = _npy("doc_matrix.npy")
+
+    vectorizer = LeanVectorizer.read(path, mmap=mmap) if LEAN_VECTORIZER else None
+    if vectorizer is None:
+        from joblib import load     # kéo theo sklearn khi unpickle vectorizer → chỉ import lúc load model
+        vectorizer = load(os.path.join(path, VECTORIZER_NAME))
+    ids = IdList(_npy("ids.npy"))
+    index = IdIndex(_npy("ids_sorted.npy"), _npy("ids_order.npy"))
+    return vectorizer, doc_matrix, ids, index, manifest
+
+
+def load_norms(path: str, doc_matrix) -> np.ndarray:
+    """ doc_norms.npy nếu có (mmap), không thì tính lại (model cũ / định dạng cũ). """
+    p = os.path.join(path, "doc_norms.npy")
+    if os.path.exists(p):
+        norms = np.load(p, mmap_mode="r")
+        if len(norms) == doc_matrix.shape[0]:
+            return norms
+    return row_norms(doc_matrix)
@@ -0,0 +1,124 @@
+"""
+Benchmark recall@k / latency của ANN (ann.py) so với brute force.
+
+    python -m bench.ann --sizes 10000 100000 --kinds flat ivf hnsw --out ann.json
+
+Dữ liệu tổng hợp 2 dạng:
+- lsa: vector 256 chiều theo cụm, chuẩn hóa L2 (giống doc_matrix khi use_lsa)
+- als: item factors 64 chiều không chuẩn hóa (giống V của ml-suite Recommender)
+recall@k = tỉ lệ top-k brute force có trong top-k sau ANN + re-rank chính xác.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+import ann
+
+
+def make_vectors(kind: str, n: int, rng: np.random.Generator):
+    """ → (X, cluster của từng item); cụm ~ chủ đề bài học. """
+    d = 256 if kind == "lsa" else 64
+    n_clusters = max(16, int(np.sqrt(n)))
+    centers = rng.normal(size=(n_clusters, d)).astype(np.float32)
+    assign = rng.integers(0, n_clusters, size=n)
+    X = centers[assign] + 0.5 * rng.normal(size=(n, d)).astype(np.float32)
+    if kind == "lsa":
+        X /= np.linalg.norm(X, axis=1, keepdims=True)
+    return np.ascontiguousarray(X, dtype=np.float32), assign
+
+
+def make_queries(X: np.ndarray, assign: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    # query = trung bình 5 bài cùng chủ đề (giống profile từ bài đã xem) + nhiễu
+    seeds = rng.integers(0, X.shape[0], size=n)
+    Q = np.empty((n, X.shape[1]), dtype=np.float32)
+    for i, s in enumerate(seeds):
+        same = np.flatnonzero(assign == assign[s])
+        Q[i] = X[rng.choice(same, size=5)].mean(axis=0)
+    Q += 0.05 * rng.normal(size=Q.shape).astype(np.float32)
+    return Q
+
+
+def _pct(xs, p) -> float:
+    return float(np.percentile(np.asarray(xs) * 1000.0, p))
+
+
+def run_one(data: str, X: np.ndarray, Q: np.ndarray, kind: str, k: int, candidates: int) -> dict:
+    truth, brute_t = [], []
+    for q in Q:
+        t0 = time.perf_counter()
+        s = X @ q
+        top = np.argpartition(-s, k - 1)[:k]
+        brute_t.append(time.perf_counter() - t0)
+        truth.append(set(top.tolist()))
+
+    row = {"data": data, "n": int(X.shape[0]), "d": int(X.shape[1]), "index": kind, "k": k,
+           "candidates": candidates,
+           "brute_p50_ms": _pct(brute_t, 50), "brute_p95_ms": _pct(brute_t, 95)}
+    if kind == "brute":
+        row.update({"recall": 1.0, "build_s": 0.0, "p50_ms": row["brute_p50_ms"],
+                    "p95_ms": row["brute_p95_ms"], "p99_ms": _pct(brute_t, 99)})
+        return row
+
+    t0 = time.perf_counter()
+    index = ann.AnnIndex.build(X, kind)
+    row["build_s"] = time.perf_counter() - t0
+
+    hits, lat = 0, []
+    for q, want in zip(Q, truth):
+        t0 = time.perf_counter()
+        cand = index.search(q[None, :], candidates)[0]
+        idx, _ = ann.exact_top_k(X, q, cand[cand >= 0], k)
+        lat.append(time.perf_counter() - t0)
+        hits += len(want & set(idx.tolist()))
+    row.update({"recall": hits / float(k * len(Q)),
+                "p50_ms": _pct(lat, 50), "p95_ms": _pct(lat, 95), "p99_ms": _pct(lat, 99)})
+    return row
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--data", nargs="+", default=["lsa", "als"], choices=["lsa", "als"])
+    ap.add_argument("--sizes", nargs="+", type=int, default=[10000, 100000])
+    ap.add_argument("--kinds", nargs="+", default=["brute", "flat", "ivf", "hnsw"])
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--candidates", type=int, default=ann.ANN_CANDIDATES)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--nprobe", type=int, default=ann.ANN_NPROBE)
+    ap.add_argument("--ef-search", type=int, default=ann.ANN_EF_SEARCH)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", help="ghi kết quả JSON ra file (mặc định stdout)")
+    args = ap.parse_args(argv)
+
+    if not ann.available() and any(k != "brute" for k in args.kinds):
+        print("faiss chưa cài (pip install faiss-cpu): chỉ chạy brute", file=sys.stderr)
+        args.kinds = ["brute"]
+
+    ann.ANN_NPROBE, ann.ANN_EF_SEARCH = args.nprobe, args.ef_search
+    rows = []
+    for data in args.data:
+        for n in args.sizes:
+            rng = np.random.default_rng(args.seed)
+            X, assign = make_vectors(data, n, rng)
+            Q = make_queries(X, assign, args.queries, rng)
+            for kind in args.kinds:
+                row = run_one(data, X, Q, kind, args.k, args.candidates)
+                rows.append(row)
+                print("%-4s n=%-7d %-5s recall@%d=%.3f p50=%.3fms p95=%.3fms build=%.2fs"
+                      % (data, n, kind, args.k, row["recall"], row["p50_ms"], row["p95_ms"], row["build_s"]),
+                      file=sys.stderr)
+
+    result = {"bench": "ann", "params": vars(args), "results": rows}
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
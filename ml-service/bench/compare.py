@@ -0,0 +1,53 @@
+"""
+So 2 file JSON của bench.run (vd. commit trước / sau):
+
+    python -m bench.compare base.json new.json [--threshold 1.1]
+
+In mọi số đo (timings_s, latency *_ms, peak_rss_mb) kèm tỉ lệ new/base;
+exit 1 nếu có số đo chậm hơn ngưỡng.
+"""
+import argparse
+import json
+import sys
+from typing import Dict
+
+
+def _flatten(scale_res: dict) -> Dict[str, float]:
+    out = {}
+    for name, v in scale_res.get("timings_s", {}).items():
+        out["timings_s." + name] = v
+    for mode, lat in scale_res.get("latency", {}).items():
+        for scen, stats in lat.items():
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                out["%s.%s.%s" % (mode, scen, key)] = stats[key]
+    if "peak_rss_mb" in scale_res:
+        out["peak_rss_mb"] = scale_res["peak_rss_mb"]
+    return out
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("base")
+    ap.add_argument("new")
+    ap.add_argument("--threshold", type=float, default=1.1, help="new/base lớn hơn ngưỡng → regression")
+    args = ap.parse_args(argv)
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print("base=%s new=%s" % (base.get("git"), new.get("git")))
+    worse = 0
+    for scale in sorted(set(base["scales"]) & set(new["scales"])):
+        a, b = _flatten(base["scales"][scale]), _flatten(new["scales"][scale])
+        for key in sorted(set(a) & set(b)):
+            ratio = b[key] / a[key] if a[key] else float("inf")
+            flag = "  <-- regression" if ratio > args.threshold else ""
+            worse += bool(flag)
+            print("%-5s %-40s %12.3f %12.3f  x%.2f%s" % (scale, key, a[key], b[key], ratio, flag))
+    return 1 if worse else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
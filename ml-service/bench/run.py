@@ -0,0 +1,174 @@
+"""
+Benchmark TfidfReco trên dữ liệu giả (bench/synth.py) ở quy mô 1k / 10k / 100k bài.
+
+    python -m bench.run --scale 1k 10k --out results.json
+    python -m bench.compare base.json results.json
+
+Mặc định dùng Mongo giả trong RAM (mongomock + mongomock-motor, chỉ cần cho benchmark);
+--mongo-uri để chạy trên Mongo thật (db --db-name sẽ bị xóa và ghi lại).
+Đo: populate, train_and_save (TF-IDF / LSA), load, p50/p95/p99 của recommend
+(engine: đọc context + chấm điểm; chỉ chấm điểm) và HTTP /recommend, /known (cache kết quả tắt).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+import db as dbmod
+from bench.synth import SCALES, populate
+
+BENCH_URI = "mongodb://bench-standin"
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def _latency(fn: Callable[[str], object], user_ids: List[str]) -> Dict[str, float]:
+    times = []
+    for uid in user_ids:
+        t0 = time.perf_counter()
+        fn(uid)
+        times.append(time.perf_counter() - t0)
+    ms = np.asarray(times) * 1000.0
+    return {
+        "n": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def _timed(fn: Callable[[], object]):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def _standin_db(db_name: str):
+    """ Mongo giả trong RAM, đăng ký vào db.py để engine/app dùng như Mongo thật. """
+    import mongomock
+    cli = mongomock.MongoClient()
+    dbmod._clients[BENCH_URI] = cli
+    try:
+        import mongomock_motor
+        dbmod._async_clients[BENCH_URI] = mongomock_motor.AsyncMongoMockClient(mock_mongo_client=cli)
+    except ImportError:
+        pass
+    return BENCH_URI, cli[db_name]
+
+
+def run_scale(scale: str, args) -> dict:
+    from tfidf_service import TfidfReco
+    from cache import ResultCache
+
+    n_lessons = SCALES[scale]
+    n_users = args.users or min(10000, max(100, n_lessons // 10))
+    if args.mongo_uri:
+        uri = args.mongo_uri
+        dbmod.get_client(uri).drop_database(args.db_name)
+        db = dbmod.get_db(uri, args.db_name)
+    else:
+        uri, db = _standin_db(args.db_name)
+
+    res: dict = {"n_lessons": n_lessons, "n_users": n_users, "timings_s": {}, "latency": {}}
+    counts, res["timings_s"]["populate"] = _timed(lambda: populate(db, n_lessons, n_users, seed=args.seed))
+    res["counts"] = counts
+
+    rng = random.Random(args.seed)
+    sample = [rng.choice(range(n_users)) for _ in range(args.requests)]
+    user_ids = ["U%d" % u for u in sample]
+
+    engine = TfidfReco(model_dir=tempfile.mkdtemp(prefix="bench-model-"), mongo_uri=uri, db_name=args.db_name)
+    client = None
+    if not args.no_http:
+        from fastapi.testclient import TestClient
+        import app as appmod
+        appmod.ENGINE = engine
+        appmod.RESULTS = ResultCache(0, 0)     # đo đường tính thật, không đo cache
+        client = TestClient(appmod.app)
+
+    for mode in args.modes:
+        use_lsa = mode == "lsa"
+        path, res["timings_s"]["train_" + mode] = _timed(lambda: engine.train_and_save(use_lsa=use_lsa))
+        _, res["timings_s"]["load_" + mode] = _timed(lambda: engine.load(os.path.basename(path)))
+        snap = engine.snapshot()
+        res["doc_matrix_" + mode] = {"shape": [int(x) for x in snap.doc_matrix.shape], "bytes": snap.doc_matrix_bytes}
+
+        def rec_full(uid):
+            ctx = engine.load_context(uid)
+            return engine.recommend(uid, args.k, ctx.level_hint, [], ctx=ctx)
+
+        ctxs = {uid: engine.load_context(uid) for uid in set(user_ids)}
+
+        def rec_score(uid):
+            ctx = ctxs[uid]
+            return engine.recommend(uid, args.k, ctx.level_hint, [], ctx=ctx)
+
+        lat = {"recommend": _latency(rec_full, user_ids), "recommend_score": _latency(rec_score, user_ids)}
+        if client is not None:
+            lat["http_recommend"] = _latency(
+                lambda uid: client.post("/recommend", json={"userId": uid, "k": args.k}), user_ids)
+            lat["http_known"] = _latency(lambda uid: client.get("/known", params={"userId": uid}), user_ids)
+        res["latency"][mode] = lat
+
+    if client is not None:
+        client.close()
+    res["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    dbmod._clients.pop(BENCH_URI, None)
+    dbmod._async_clients.pop(BENCH_URI, None)
+    return res
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scale", nargs="+", default=["1k", "10k"], choices=sorted(SCALES))
+    ap.add_argument("--modes", nargs="+", default=["tfidf", "lsa"], choices=["tfidf", "lsa"])
+    ap.add_argument("--users", type=int, default=0, help="số user (mặc định n_lessons/10, tối đa 10000)")
+    ap.add_argument("--requests", type=int, default=300, help="số request mỗi kịch bản latency")
+    ap.add_argument("--k", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--mongo-uri", default=None)
+    ap.add_argument("--db-name", default="chorddb_bench")
+    ap.add_argument("--no-http", action="store_true", help="bỏ đo qua HTTP (TestClient)")
+    ap.add_argument("--out", help="ghi JSON ra file (mặc định stdout)")
+    args = ap.parse_args(argv)
+
+    result = {
+        "bench": "tfidf",
+        "git": _git_rev(),
+        "python": platform.python_version(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": vars(args),
+        "scales": {},
+    }
+    for scale in args.scale:
+        print("[bench] scale=%s ..." % scale, file=sys.stderr)
+        result["scales"][scale] = run_scale(scale, args)
+        print(json.dumps(result["scales"][scale]["timings_s"]), file=sys.stderr)
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
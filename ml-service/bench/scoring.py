@@ -0,0 +1,102 @@
+"""
+Micro-benchmark kernel chấm điểm (scoring.py) so với đường cũ dùng sklearn cosine_similarity.
+
+    python -m bench.scoring --sizes 10000 100000 --users 1 256 --out scoring.json
+
+- dense: doc_matrix LSA float32 (n x 256), dòng đã chuẩn hóa L2
+- sparse: doc_matrix TF-IDF CSR float32 (n x vocab), ~nnz_per_row term mỗi bài
+Đường cũ: cosine_similarity(goals) + cosine_similarity(profile) rồi trộn 0.8/0.2.
+Đường mới: scoring.blend → scoring.similarity (1 phép nhân, không chuẩn hóa lại doc_matrix).
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+import scoring
+
+
+def make_docs(kind: str, n: int, rng: np.random.Generator, vocab: int, nnz: int):
+    if kind == "dense":
+        X = rng.normal(size=(n, 256)).astype(np.float32)
+        return np.ascontiguousarray(normalize(X))
+    X = sparse.random(n, vocab, density=nnz / vocab, format="csr", dtype=np.float32, random_state=rng)
+    return normalize(X).astype(np.float32).tocsr()
+
+
+def make_queries(X, m: int, rng: np.random.Generator):
+    # profile = trung bình 10 bài, goals = 1 bài (giống vector vài tag)
+    A = sparse.csr_matrix((np.full(m * 10, 0.1, dtype=np.float32),
+                           (np.repeat(np.arange(m), 10), rng.integers(0, X.shape[0], m * 10))),
+                          shape=(m, X.shape[0]))
+    prof = A @ X
+    goals = X[rng.integers(0, X.shape[0], m)]
+    return prof, goals, np.ones(m, dtype=bool)
+
+
+def old_path(X, prof, goals, has_prof):
+    gs = cosine_similarity(goals, X)
+    ps = cosine_similarity(prof, X)
+    return np.where(has_prof[:, None], 0.8 * ps + 0.2 * gs, gs)
+
+
+def new_path(X, prof, goals, has_prof, inv):
+    return scoring.similarity(X, scoring.blend(prof, goals, has_prof), inv)
+
+
+def _time(fn, repeat: int):
+    fn()
+    ts = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        ts.append(time.perf_counter() - t0)
+    ms = np.asarray(ts) * 1000.0
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)), "min_ms": float(ms.min())}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--kinds", nargs="+", default=["dense", "sparse"], choices=["dense", "sparse"])
+    ap.add_argument("--sizes", nargs="+", type=int, default=[10000, 100000])
+    ap.add_argument("--users", nargs="+", type=int, default=[1, 256], help="số dòng query mỗi lần (1 = /recommend)")
+    ap.add_argument("--vocab", type=int, default=50000)
+    ap.add_argument("--nnz", type=int, default=120)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out")
+    args = ap.parse_args(argv)
+
+    rows = []
+    for kind in args.kinds:
+        for n in args.sizes:
+            rng = np.random.default_rng(args.seed)
+            X = make_docs(kind, n, rng, args.vocab, args.nnz)
+            inv = scoring.inverse_norms(scoring.row_norms(X))
+            for m in args.users:
+                prof, goals, has_prof = make_queries(X, m, rng)
+                diff = float(np.abs(old_path(X, prof, goals, has_prof) - new_path(X, prof, goals, has_prof, inv)).max())
+                old = _time(lambda: old_path(X, prof, goals, has_prof), args.repeat)
+                new = _time(lambda: new_path(X, prof, goals, has_prof, inv), args.repeat)
+                row = {"kind": kind, "n": n, "users": m, "old": old, "new": new,
+                       "speedup_p50": old["p50_ms"] / new["p50_ms"], "max_abs_diff": diff}
+                rows.append(row)
+                print("%-6s n=%-7d users=%-4d old p50=%.3fms new p50=%.3fms x%.1f diff=%.1e"
+                      % (kind, n, m, old["p50_ms"], new["p50_ms"], row["speedup_p50"], diff), file=sys.stderr)
+
+    text = json.dumps({"bench": "scoring", "params": vars(args), "results": rows}, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Sinh dữ liệu giả theo schema Lesson / events / learning_states của Server (src/models).
+
+- lessons: markdown, blocks (heading/paragraph/list/table/code...), prereqs, quiz_pool
+- learning_states: từ câu trả lời ngẫu nhiên của DEFAULT_QUESTIONS (answers_to_goals / infer_max_level)
+- events: mỗi user vài chục lượt view/complete, lesson chọn lệch về cùng topic
+
+Cùng seed + cùng scale → cùng dữ liệu, để so kết quả benchmark giữa các commit.
+"""
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+from bson import ObjectId
+
+from questions import ANSWER_GOALS_MAP, DEFAULT_QUESTIONS, answers_to_goals, infer_max_level
+
+SCALES = {"1k": 1000, "10k": 10000, "100k": 100000}
+
+TOPICS = ["chord", "technique", "theory", "ear", "rhythm", "practice"]
+TAGS = sorted({t for m in ANSWER_GOALS_MAP.values() for goals in m.values() for t in goals})
+CHORDS = ["C", "G", "Am", "Em", "D", "A", "E", "F", "Dm", "Bm", "G7", "Cmaj7", "Fmaj7", "E7", "A7", "B7"]
+WORDS = (
+    "ngón tay phím dây bấm quạt nhịp phách đàn hợp âm chuyển luyện tập chậm đều tay phải tay trái "
+    "metronome tempo cảm âm giai điệu nốt quãng cung thăng giáng trưởng thứ bè đệm hát solo "
+    "bend slide hammer pull vibrato pentatonic blues scale arpeggio fingerstyle strumming "
+    "capo tuning dây buông tư thế cổ tay cần đàn ngăn phím âm sắc chặn barre"
+).split()
+BLOCK_TYPES = ["heading", "paragraph", "paragraph", "list", "table", "code", "callout", "image"]
+
+
+def _sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def _blocks(rng: random.Random, tags: List[str]) -> List[Dict]:
+    out = []
+    for i in range(rng.randint(3, 10)):
+        kind = rng.choice(BLOCK_TYPES)
+        b: Dict = {"id": "b%d" % i, "type": kind}
+        if kind == "heading":
+            b.update(text=_sentence(rng, 4), level=rng.randint(1, 3))
+        elif kind in ("paragraph", "callout"):
+            b["text"] = _sentence(rng, rng.randint(20, 60)) + " " + " ".join(tags)
+            if kind == "callout":
+                b["caption"] = _sentence(rng, 3)
+        elif kind == "list":
+            b.update(ordered=rng.random() < 0.5, items=[_sentence(rng, 6) for _ in range(rng.randint(2, 6))])
+        elif kind == "table":
+            b["rows"] = [rng.sample(CHORDS, 3) for _ in range(rng.randint(2, 5))]
+        elif kind == "code":
+            b.update(text="e|--0--3--|\nB|--1--0--|\nG|--0--0--|", language="tab")
+        else:
+            b.update(src="https://example.com/img/%d.png" % i, alt=_sentence(rng, 3), caption=_sentence(rng, 5))
+        out.append(b)
+    return out
+
+
+def gen_lessons(n: int, seed: int = 0) -> Iterator[Dict]:
+    rng = random.Random(seed)
+    slugs: List[str] = []
+    for i in range(n):
+        topic = TOPICS[i % len(TOPICS)] if rng.random() < 0.7 else rng.choice(TOPICS)
+        tags = rng.sample(TAGS, rng.randint(2, 5))
+        slug = "%s-%d" % (topic, i)
+        doc = {
+            "_id": ObjectId(("%024x" % (seed * 10 ** 7 + i))[-24:]),
+            "slug": slug,
+            "title": "%s %s %d" % (topic.title(), " ".join(tags[:2]), i),
+            "topic": topic,
+            "level": rng.randint(1, 4),
+            "tags": tags,
+            "summary": _sentence(rng, 15),
+            "markdown": "# %s\n\n%s\n\n- %s\n- %s\n" % (
+                topic, _sentence(rng, rng.randint(40, 150)), _sentence(rng, 8), " ".join(tags)),
+            "blocks": _blocks(rng, tags),
+            "prereqs": rng.sample(slugs[-50:], min(len(slugs[-50:]), rng.randint(0, 3))),
+            "quiz_pool": [{"id": "q%d-%d" % (i, j), "difficulty": rng.randint(1, 5),
+                           "tags": rng.sample(tags, 1)} for j in range(rng.randint(0, 4))],
+            "createdAt": datetime(2024, 1, 1) + timedelta(minutes=i),
+            "updatedAt": datetime(2024, 1, 1) + timedelta(minutes=i),
+        }
+        slugs.append(slug)
+        yield doc
+
+
+def _answers(rng: random.Random) -> Dict:
+    answers = {}
+    for q in DEFAULT_QUESTIONS:
+        keys = [o["key"] for o in q["options"]]
+        if q.get("multi"):
+            answers[q["key"]] = rng.sample(keys, rng.randint(0, 3))
+        elif rng.random() < 0.9:
+            answers[q["key"]] = rng.choice(keys)
+    return answers
+
+
+def gen_learning_states(n_users: int, seed: int = 0) -> Iterator[Dict]:
+    rng = random.Random(seed + 1)
+    for u in range(n_users):
+        answers = _answers(rng)
+        yield {
+            "userId": "U%d" % u,
+            "answers": answers,
+            "goals": answers_to_goals(answers),
+            "levelHint": infer_max_level(answers),
+            "known_topics": [x for x in answers.get("basic", [])],
+        }
+
+
+def gen_events(n_users: int, lesson_ids: List[str], per_user: int = 30, seed: int = 0) -> Iterator[Dict]:
+    rng = random.Random(seed + 2)
+    n = len(lesson_ids)
+    t0 = datetime(2024, 6, 1)
+    for u in range(n_users):
+        # mỗi user xem quanh 1 vùng catalog (topic xếp theo i % len(TOPICS)) + vài bài ngẫu nhiên
+        center = rng.randrange(n)
+        for j in range(rng.randint(0, per_user)):
+            i = (center + len(TOPICS) * rng.randint(-20, 20)) % n if rng.random() < 0.8 else rng.randrange(n)
+            yield {
+                "userId": "U%d" % u,
+                "lessonId": lesson_ids[i],
+                "type": rng.choice(["view", "view", "complete"]),
+                "progress": rng.random(),
+                "score": 1,
+                "createdAt": t0 + timedelta(minutes=u * per_user + j),
+            }
+
+
+def populate(db, n_lessons: int, n_users: int, seed: int = 0, chunk: int = 5000) -> Dict[str, int]:
+    """ Ghi lessons / learning_states / events vào db (pymongo hoặc mongomock), theo khối. """
+    def _insert(coll, docs):
+        buf, total = [], 0
+        for d in docs:
+            buf.append(d)
+            if len(buf) == chunk:
+                coll.insert_many(buf)
+                total += len(buf)
+                buf = []
+        if buf:
+            coll.insert_many(buf)
+            total += len(buf)
+        return total
+
+    ids: List[str] = []
+
+    def _lessons():
+        for doc in gen_lessons(n_lessons, seed):
+            ids.append(str(doc["_id"]))
+            yield doc
+
+    counts = {"lessons": _insert(db.lessons, _lessons())}
+    counts["learning_states"] = _insert(db.learning_states, gen_learning_states(n_users, seed))
+    counts["events"] = _insert(db.events, gen_events(n_users, ids, seed=seed))
+    db.learning_states.create_index("userId")
+    db.events.create_index([("userId", 1), ("createdAt", -1)])
+    return counts
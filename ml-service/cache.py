@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+
+class LRUCache:
+    """
+    LRU có giới hạn số phần tử, an toàn đa luồng, kèm bộ đếm hit/miss/eviction.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = max(0, int(maxsize))
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class ResultCache:
+    """
+    Cache kết quả gợi ý cuối: LRU + TTL, khóa là tuple bắt đầu bằng user_id
+    → xóa được mọi khóa của 1 user (đổi answers, có event mới) mà không duyệt cả cache.
+    Kết quả tính xong sau 1 lần invalidate của user đó không được ghi vào (token() lấy trước khi tính).
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = max(0, int(maxsize))
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[tuple, Tuple[float, Any]]" = OrderedDict()
+        self._by_user: Dict[Hashable, Set[tuple]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+        # seq của lần invalidate gần nhất theo user (giữ tối đa _max_tracked user, cũ hơn thì dồn vào _floor)
+        self._seq = 0
+        self._floor = 0
+        self._invalidated: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._max_tracked = max(1024, self.maxsize)
+
+    def _drop(self, key: tuple):
+        self._data.pop(key, None)
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def get(self, key: tuple, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def token(self) -> int:
+        """ Lấy trước khi tính kết quả, truyền lại cho put(). """
+        with self._lock:
+            return self._seq
+
+    def put(self, key: tuple, value: Any, token: Optional[int] = None):
+        if self.maxsize == 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            if token is not None and (token < self._floor or self._invalidated.get(key[0], 0) > token):
+                # user bị invalidate trong lúc tính → kết quả có thể đã cũ
+                self.stale_puts += 1
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            self._by_user.setdefault(key[0], set()).add(key)
+            while len(self._data) > self.maxsize:
+                old = next(iter(self._data))
+                self._drop(old)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: Hashable) -> int:
+        """ Xóa mọi kết quả đã cache của user; trả số khóa bị xóa. """
+        with self._lock:
+            self._seq += 1
+            self._invalidated[user_id] = self._seq
+            self._invalidated.move_to_end(user_id)
+            while len(self._invalidated) > self._max_tracked:
+                _, seq = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, seq)
+            keys = self._by_user.pop(user_id, None) or ()
+            for key in keys:
+                self._data.pop(key, None)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_user.clear()
+            self._seq += 1
+            self._floor = self._seq
+            self._invalidated.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "users": len(self._by_user),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "stale_puts": self.stale_puts,
+        }
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Executor riêng cho phần chấm điểm (numpy/scipy nhả GIL khi nhân ma trận):
+# endpoint async đẩy việc CPU vào đây để event loop không bị chặn.
+# COMPUTE_WORKERS luồng chạy song song, tối đa COMPUTE_QUEUE việc chờ — vượt quá thì
+# request chờ ở semaphore (không dồn vô hạn vào hàng đợi executor).
+
+COMPUTE_WORKERS = int(os.environ.get("COMPUTE_WORKERS", str(os.cpu_count() or 2)))
+COMPUTE_QUEUE = int(os.environ.get("COMPUTE_QUEUE", str(4 * COMPUTE_WORKERS)))
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, COMPUTE_WORKERS), thread_name_prefix="compute")
+_slots = None
+_lock = threading.Lock()
+_running = 0
+
+
+def _slot() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(max(1, COMPUTE_WORKERS + COMPUTE_QUEUE))
+    return _slots
+
+
+def _call(fn, *args, **kwargs):
+    global _running
+    with _lock:
+        _running += 1
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        with _lock:
+            _running -= 1
+
+
+async def run_compute(fn, *args, **kwargs):
+    """ Chạy fn(*args, **kwargs) trên compute executor, await kết quả. """
+    async with _slot():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_EXECUTOR, partial(_call, fn, *args, **kwargs))
+
+
+def stats() -> dict:
+    pending = (COMPUTE_WORKERS + COMPUTE_QUEUE - _slots._value) if _slots is not None else 0
+    return {
+        "workers": COMPUTE_WORKERS,
+        "queue": COMPUTE_QUEUE,
+        "running": _running,
+        "waiting": max(0, pending - _running),
+    }
+
+
+def shutdown():
+    _EXECUTOR.shutdown(wait=False)
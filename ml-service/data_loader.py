@@ -1,24 +1,41 @@
-from typing import Tuple, List, Dict
-from pymongo import MongoClient
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Tuple, List, Dict, Iterator, Optional
+from bson import ObjectId
+from db import get_db, io_limit
 
 # Schema mong đợi:
-# lessons: {_id, title, summary, topic, tags[], level, markdown?, blocks?, prereqs?, quiz_pool?, slug?}
+# lessons: {_id, title, summary, topic, tags[], level, markdown?, blocks?, prereqs?, quiz_pool?, slug?, updatedAt?}
 # events:  {userId, lessonId?, lessonSlug?, type, score, createdAt}
 # learning_states: {userId, goals[], answers?, levelHint?, known_topics?}
 
+RECENT_LIMIT = int(os.environ.get("RECENT_LIMIT", "20"))
+LESSON_BATCH = int(os.environ.get("LESSON_BATCH", "500"))
+
+LESSON_PROJ = {
+    "_id": 1, "title": 1, "summary": 1, "topic": 1, "tags": 1, "level": 1,
+    "markdown": 1, "blocks": 1, "prereqs": 1, "quiz_pool": 1, "slug": 1, "updatedAt": 1
+}
+
+STATE_PROJ = {"goals": 1, "levelHint": 1, "known_topics": 1}
+EVENT_PROJ = {"lessonId": 1, "lessonSlug": 1, "createdAt": 1}
+
+# Pool nhỏ để bắn song song learning_states + events cho 1 request
+_IO_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("USER_CONTEXT_IO_WORKERS", "8")),
+    thread_name_prefix="user-ctx",
+)
+
+
 def load_lessons_events(mongo_uri: str, db_name: str) -> Tuple[List[Dict], List[Dict]]:
-    cli = MongoClient(mongo_uri)
-    db = cli[db_name]
+    db = get_db(mongo_uri, db_name)
 
     # Thử 'lessons' trước, fallback 'lesson'
-    proj = {
-        "_id": 1, "title": 1, "summary": 1, "topic": 1, "tags": 1, "level": 1,
-        "markdown": 1, "blocks": 1, "prereqs": 1, "quiz_pool": 1, "slug": 1
-    }
-
-    lessons = list(db.lessons.find({}, proj))
+    lessons = list(db.lessons.find({}, LESSON_PROJ))
     if not lessons:
-        lessons = list(db.lesson.find({}, proj))
+        lessons = list(db.lesson.find({}, LESSON_PROJ))
 
     events = list(db.events.find(
         {}, {"userId": 1, "lessonId": 1, "lessonSlug": 1, "type": 1, "score": 1, "createdAt": 1}
@@ -27,21 +44,157 @@ def load_lessons_events(mongo_uri: str, db_name: str) -> Tuple[List[Dict], List[
     return lessons, events
 
 
+def iter_lessons(mongo_uri: str, db_name: str, batch_size: int = LESSON_BATCH) -> Iterator[Dict]:
+    """
+    Stream lessons bằng cursor (mỗi lần lấy batch_size doc) cho training nội dung:
+    không đọc events, không giữ cả collection trong RAM.
+    """
+    db = get_db(mongo_uri, db_name)
+    # Thử 'lessons' trước, fallback 'lesson'
+    coll = db.lessons if db.lessons.find_one({}, {"_id": 1}) is not None else db.lesson
+    cursor = coll.find({}, LESSON_PROJ, batch_size=batch_size).sort("_id", 1)
+    try:
+        for doc in cursor:
+            yield doc
+    finally:
+        cursor.close()
+
+
+def load_lesson(mongo_uri: str, db_name: str, lesson_id: str) -> Optional[Dict]:
+    """ Đọc 1 lesson theo _id (ObjectId hoặc chuỗi) hoặc slug. """
+    db = get_db(mongo_uri, db_name)
+    q: List[Dict] = [{"_id": lesson_id}, {"slug": lesson_id}]
+    if ObjectId.is_valid(lesson_id):
+        q.insert(0, {"_id": ObjectId(lesson_id)})
+    for coll in (db.lessons, db.lesson):
+        doc = coll.find_one({"$or": q}, LESSON_PROJ)
+        if doc:
+            return doc
+    return None
+
+
 def load_user_recent(mongo_uri: str, db_name: str, user_id: str, limit: int = 20) -> List[str]:
     """
     Trả về danh sách id/slug của lesson mà user tương tác gần đây (ưu tiên ObjectId).
     """
-    cli = MongoClient(mongo_uri)
-    db = cli[db_name]
+    db = get_db(mongo_uri, db_name)
     ev = list(db.events.find(
-        {"userId": user_id},
-        {"lessonId": 1, "lessonSlug": 1, "createdAt": 1}
+        {"userId": user_id}, EVENT_PROJ
     ).sort("createdAt", -1).limit(limit))
 
+    return recent_ids_from_events(ev)
+
+
+def recent_ids_from_events(events: List[Dict]) -> List[str]:
     out: List[str] = []
-    for r in ev:
+    for r in events:
         if r.get("lessonId"):
             out.append(str(r["lessonId"]))    # ưu tiên ObjectId vì meta dùng _id
         elif r.get("lessonSlug"):
             out.append(str(r["lessonSlug"]))  # fallback slug
     return out
+
+
+@dataclass
+class UserContext:
+    """
+    Mọi thứ /recommend cần về 1 user, đọc 1 lần rồi dùng chung cho endpoint + engine.
+    """
+    user_id: str
+    goals: List[str] = field(default_factory=list)
+    level_hint: Optional[int] = None
+    known_topics: List[str] = field(default_factory=list)
+    recent_ids: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_docs(cls, user_id: str, state: Optional[Dict], events: List[Dict]) -> "UserContext":
+        st = state or {}
+        return cls(
+            user_id=user_id,
+            goals=list(st.get("goals") or []),
+            level_hint=st.get("levelHint"),
+            known_topics=list(st.get("known_topics") or []),
+            recent_ids=recent_ids_from_events(events),
+        )
+
+
+def load_user_context(db, user_id: str, recent_limit: int = RECENT_LIMIT) -> UserContext:
+    """
+    1 lần đọc learning_states + 1 lần đọc events (projection), chạy song song
+    → độ trễ DB ~ 1 round trip thay vì 4 query nối tiếp.
+    """
+    def _state():
+        return db.learning_states.find_one({"userId": user_id}, STATE_PROJ)
+
+    def _events():
+        return list(db.events.find({"userId": user_id}, EVENT_PROJ)
+                    .sort("createdAt", -1).limit(recent_limit))
+
+    f_state = _IO_POOL.submit(_state)
+    f_events = _IO_POOL.submit(_events)
+    return UserContext.from_docs(user_id, f_state.result(), f_events.result())
+
+
+async def load_user_context_async(adb, user_id: str, recent_limit: int = RECENT_LIMIT) -> UserContext:
+    """ Bản async (motor) của load_user_context: 2 query chạy đồng thời trên event loop. """
+    async def _state():
+        async with io_limit():
+            return await adb.learning_states.find_one({"userId": user_id}, STATE_PROJ)
+
+    async def _events():
+        async with io_limit():
+            cur = adb.events.find({"userId": user_id}, EVENT_PROJ).sort("createdAt", -1).limit(recent_limit)
+            return await cur.to_list(length=recent_limit)
+
+    state, events = await asyncio.gather(_state(), _events())
+    return UserContext.from_docs(user_id, state, events)
+
+
+_TOPN_SUPPORT: Dict[int, bool] = {}
+
+
+def _supports_topn(db) -> bool:
+    """ $topN có từ MongoDB 5.2; kết quả nhớ theo client. """
+    key = id(db.client)
+    if key not in _TOPN_SUPPORT:
+        try:
+            version = tuple(int(x) for x in db.client.server_info()["version"].split(".")[:2])
+        except Exception:
+            version = (0, 0)
+        _TOPN_SUPPORT[key] = version >= (5, 2)
+    return _TOPN_SUPPORT[key]
+
+
+def load_user_contexts(db, user_ids: List[str], recent_limit: int = RECENT_LIMIT) -> Dict[str, UserContext]:
+    """
+    Bản batch của load_user_context: 1 query $in trên learning_states
+    + N event gần nhất mỗi user (aggregate $topN, Mongo < 5.2: find từng user), chạy song song.
+    """
+    ids = list(dict.fromkeys(user_ids))
+    if not ids:
+        return {}
+
+    def _states():
+        proj = dict(STATE_PROJ, userId=1)
+        return {st["userId"]: st for st in db.learning_states.find({"userId": {"$in": ids}}, proj)}
+
+    def _events():
+        if not _supports_topn(db):
+            # Mongo < 5.2: mỗi user 1 find().sort().limit() trên index (userId, createdAt)
+            return {uid: list(db.events.find({"userId": uid}, EVENT_PROJ).sort("createdAt", -1).limit(recent_limit))
+                    for uid in ids}
+        # $topN giữ tối đa recent_limit event mỗi user ngay trong $group (không gom cả lịch sử rồi mới cắt)
+        pipeline = [
+            {"$match": {"userId": {"$in": ids}}},
+            {"$group": {"_id": "$userId", "events": {"$topN": {
+                "n": recent_limit,
+                "sortBy": {"createdAt": -1},
+                "output": {"lessonId": "$lessonId", "lessonSlug": "$lessonSlug"},
+            }}}},
+        ]
+        return {r["_id"]: r["events"] for r in db.events.aggregate(pipeline)}
+
+    f_states = _IO_POOL.submit(_states)
+    f_events = _IO_POOL.submit(_events)
+    states, events = f_states.result(), f_events.result()
+    return {uid: UserContext.from_docs(uid, states.get(uid), events.get(uid, [])) for uid in ids}
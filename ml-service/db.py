@@ -0,0 +1,206 @@
+import asyncio
+import os
+import threading
+from typing import Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from pymongo import monitoring
+
+# Lớp kết nối Mongo dùng chung cho cả process:
+# - mỗi URI chỉ có đúng 1 MongoClient (1 connection pool), tạo lúc startup
+# - app.py, tfidf_service.py, data_loader.py đều lấy client từ đây
+# - thống kê pool (đang checkout, thời gian chờ) cho /diagnostics/db
+# - bản async (motor) cho các endpoint async: cũng 1 client / URI, cùng cấu hình pool,
+#   số thao tác Mongo đồng thời giới hạn bởi MONGO_IO_CONCURRENCY (semaphore)
+
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_MS = int(os.environ.get("MONGO_MAX_IDLE_MS", "60000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+MONGO_IO_CONCURRENCY = int(os.environ.get("MONGO_IO_CONCURRENCY", str(MONGO_MAX_POOL_SIZE)))
+
+
+def client_options() -> Dict[str, int]:
+    return {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    }
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Đếm số kết nối đang checkout / đang mở và thời gian chờ checkout theo từng server.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_addr: Dict[str, Dict[str, float]] = {}
+
+    def _row(self, address) -> Dict[str, float]:
+        key = "%s:%s" % address if isinstance(address, tuple) else str(address)
+        row = self._by_addr.get(key)
+        if row is None:
+            row = self._by_addr[key] = {
+                "open": 0, "checked_out": 0, "checkouts": 0, "checkout_failed": 0,
+                "wait_ms_total": 0.0, "wait_ms_max": 0.0,
+            }
+        return row
+
+    def _wait(self, row: Dict[str, float], duration: Optional[float]):
+        if duration is None:
+            return
+        ms = duration * 1000.0
+        row["wait_ms_total"] += ms
+        if ms > row["wait_ms_max"]:
+            row["wait_ms_max"] = ms
+
+    def pool_created(self, event):
+        with self._lock:
+            self._row(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            row = self._row(event.address)
+            row["open"] = 0
+            row["checked_out"] = 0
+
+    def connection_created(self, event):
+        with self._lock:
+            self._row(event.address)["open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            row = self._row(event.address)
+            row["open"] = max(0, row["open"] - 1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            row = self._row(event.address)
+            row["checkout_failed"] += 1
+            self._wait(row, getattr(event, "duration", None))
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            row = self._row(event.address)
+            row["checked_out"] += 1
+            row["checkouts"] += 1
+            self._wait(row, getattr(event, "duration", None))
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            row = self._row(event.address)
+            row["checked_out"] = max(0, row["checked_out"] - 1)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            out = {}
+            for addr, row in self._by_addr.items():
+                n = row["checkouts"] + row["checkout_failed"]
+                out[addr] = {
+                    "open": int(row["open"]),
+                    "checked_out": int(row["checked_out"]),
+                    "checkouts": int(row["checkouts"]),
+                    "checkout_failed": int(row["checkout_failed"]),
+                    "wait_ms_avg": (row["wait_ms_total"] / n) if n else 0.0,
+                    "wait_ms_max": row["wait_ms_max"],
+                }
+            return out
+
+
+POOL_STATS = PoolStats()
+
+_clients: Dict[str, MongoClient] = {}
+_async_clients: Dict[str, AsyncIOMotorClient] = {}
+_lock = threading.Lock()
+_io_sem: Optional[asyncio.Semaphore] = None
+
+
+def get_client(uri: str) -> MongoClient:
+    """ Lấy MongoClient dùng chung cho URI (tạo 1 lần, tái sử dụng cho mọi request). """
+    cli = _clients.get(uri)
+    if cli is not None:
+        return cli
+    with _lock:
+        cli = _clients.get(uri)
+        if cli is None:
+            cli = MongoClient(uri, event_listeners=[POOL_STATS], **client_options())
+            _clients[uri] = cli
+        return cli
+
+
+def get_db(uri: str, db_name: str):
+    return get_client(uri)[db_name]
+
+
+def get_async_client(uri: str) -> AsyncIOMotorClient:
+    """ Client motor dùng chung cho URI; tạo trong event loop của app. """
+    cli = _async_clients.get(uri)
+    if cli is not None:
+        return cli
+    with _lock:
+        cli = _async_clients.get(uri)
+        if cli is None:
+            cli = AsyncIOMotorClient(uri, event_listeners=[POOL_STATS], **client_options())
+            _async_clients[uri] = cli
+        return cli
+
+
+def get_async_db(uri: str, db_name: str):
+    return get_async_client(uri)[db_name]
+
+
+def io_limit() -> asyncio.Semaphore:
+    """ Semaphore giới hạn số thao tác Mongo async đang chạy: `async with io_limit(): ...` """
+    global _io_sem
+    if _io_sem is None:
+        _io_sem = asyncio.Semaphore(max(1, MONGO_IO_CONCURRENCY))
+    return _io_sem
+
+
+def init_pool(uri: str) -> MongoClient:
+    """ Gọi ở startup để pool được dựng trước request đầu tiên. """
+    return get_client(uri)
+
+
+def close_all():
+    with _lock:
+        for cli in list(_clients.values()) + list(_async_clients.values()):
+            try:
+                cli.close()
+            except Exception:
+                pass
+        _clients.clear()
+        _async_clients.clear()
+
+
+def pool_stats() -> dict:
+    return {
+        "clients": len(_clients),
+        "async_clients": len(_async_clients),
+        "options": client_options(),
+        "io": {
+            "limit": MONGO_IO_CONCURRENCY,
+            "in_use": (MONGO_IO_CONCURRENCY - _io_sem._value) if _io_sem is not None else 0,
+        },
+        "servers": POOL_STATS.snapshot(),
+    }
@@ -0,0 +1,149 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+from scipy import sparse
+
+LEVEL_UNKNOWN = -1
+
+
+class ItemStore:
+    """
+    items_meta dạng cột, dòng i ứng với dòng i của doc_matrix:
+    - levels: int8 (LEVEL_UNKNOWN nếu bài không có level)
+    - topic_codes: int32 → topic_names
+    - tag_matrix: CSR (n_items x n_labels), label = tags + topic (filter coi topic như 1 tag)
+    - postings: label → mảng index item có label đó
+    - cold_order: index item sắp sẵn theo (level, index) cho cold-start; cold_by_level: như trên, đã lọc level <= L
+    Lọc known_topics / level = phép mask trên mảng, không duyệt dict từng item.
+    """
+    def __init__(self, ids: Sequence[str], items_meta: Dict[str, dict]):
+        n = len(ids)
+        self.ids = ids
+        self.levels = np.full(n, LEVEL_UNKNOWN, dtype=np.int8)
+        self.topic_codes = np.full(n, -1, dtype=np.int32)
+        self.topic_names: List[str] = []
+        self.label_index: Dict[str, int] = {}
+
+        topic_index: Dict[str, int] = {}
+        indptr = [0]
+        indices: List[int] = []
+        for i, iid in enumerate(self.ids):
+            meta = items_meta.get(iid) or {}
+            lvl = meta.get("level")
+            if lvl is not None:
+                self.levels[i] = int(lvl)
+            topic = meta.get("topic")
+            labels = list(meta.get("tags") or [])
+            if topic:
+                if topic not in topic_index:
+                    topic_index[topic] = len(self.topic_names)
+                    self.topic_names.append(topic)
+                self.topic_codes[i] = topic_index[topic]
+                labels.append(topic)
+            row = {self.label_index.setdefault(t, len(self.label_index)) for t in labels if t}
+            indices.extend(sorted(row))
+            indptr.append(len(indices))
+
+        self.tag_matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32),
+             np.asarray(indices, dtype=np.int32),
+             np.asarray(indptr, dtype=np.int32)),
+            shape=(n, len(self.label_index)),
+        )
+        csc = self.tag_matrix.tocsc()
+        self.postings: Dict[str, np.ndarray] = {
+            t: csc.indices[csc.indptr[j]:csc.indptr[j + 1]]
+            for t, j in self.label_index.items()
+        }
+
+        # bảng cold-start dựng 1 lần lúc load: level thấp trước, hòa thì theo thứ tự gốc
+        idx = np.arange(n, dtype=np.int32)
+        self.cold_order = idx[np.lexsort((idx, np.maximum(self.levels, 0)))]
+        self.cold_rank = np.empty(n, dtype=np.int32)
+        self.cold_rank[self.cold_order] = idx
+        self.cold_by_level: Dict[int, np.ndarray] = {}
+        lv = self.levels[self.cold_order]
+        for lvl in np.unique(self.levels[self.levels != LEVEL_UNKNOWN]):
+            self.cold_by_level[int(lvl)] = self.cold_order[(lv <= lvl) | (lv == LEVEL_UNKNOWN)]
+
+    @property
+    def n(self) -> int:
+        return len(self.ids)
+
+    def mask_any(self, labels: Iterable[str]) -> np.ndarray:
+        """ True cho item có ít nhất 1 tag/topic thuộc labels. """
+        mask = np.zeros(self.n, dtype=bool)
+        for t in labels:
+            p = self.postings.get(t)
+            if p is not None:
+                mask[p] = True
+        return mask
+
+    def indices_any(self, labels: Iterable[str]) -> np.ndarray:
+        return np.flatnonzero(self.mask_any(labels))
+
+    def level_mask(self, max_level: Optional[int]) -> np.ndarray:
+        """ True cho item có level <= max_level (bài không rõ level luôn được giữ). """
+        if max_level is None:
+            return np.ones(self.n, dtype=bool)
+        return (self.levels <= int(max_level)) | (self.levels == LEVEL_UNKNOWN)
+
+    def label_overlap(self, labels: Iterable[str]) -> np.ndarray:
+        """ Số tag/topic của mỗi item trùng với labels (1 phép nhân CSR x vector). """
+        cols = sorted({self.label_index[t] for t in labels if t in self.label_index})
+        if not cols:
+            return np.zeros(self.n, dtype=np.float32)
+        v = np.zeros(len(self.label_index), dtype=np.float32)
+        v[cols] = 1.0
+        return self.tag_matrix @ v
+
+    def cold_candidates(self, max_level: Optional[int]) -> np.ndarray:
+        """ Item có level <= max_level, đã sắp theo (level, index); không sort lại mỗi request. """
+        if max_level is None:
+            return self.cold_order
+        lvl = int(max_level)
+        known = [v for v in self.cold_by_level if v <= lvl]
+        if not known:
+            return self.cold_order[self.levels[self.cold_order] == LEVEL_UNKNOWN]
+        return self.cold_by_level[max(known)]
+
+    def cold_start(self, labels: Iterable[str], max_level: Optional[int], k: int,
+                   exclude: Optional[np.ndarray] = None, block: int = 4096) -> np.ndarray:
+        """
+        Top-k cold-start: số tag/topic trùng labels giảm dần, hòa thì theo cold_order.
+        Item có trùng: 1 phép nhân CSR x vector + argpartition; còn thiếu thì lấy tiếp
+        theo thứ tự cold_candidates, chỉ duyệt tới khi đủ k.
+        """
+        if k <= 0 or self.n == 0:
+            return np.zeros(0, dtype=np.int32)
+        overlap = self.label_overlap(labels)
+        hits = np.flatnonzero(overlap > 0)
+        if hits.size:
+            if max_level is not None:
+                lv = self.levels[hits]
+                hits = hits[(lv <= int(max_level)) | (lv == LEVEL_UNKNOWN)]
+            if exclude is not None:
+                hits = hits[~exclude[hits]]
+        if hits.size:
+            # khóa duy nhất: overlap trước, rồi vị trí trong cold_order
+            key = overlap[hits].astype(np.int64) * (self.n + 1) - self.cold_rank[hits]
+            if hits.size > k:
+                part = np.argpartition(-key, k - 1)[:k]
+                hits, key = hits[part], key[part]
+            hits = hits[np.argsort(-key)]
+        if hits.size >= k:
+            return hits.astype(np.int32, copy=False)
+
+        out = [hits]
+        need = k - hits.size
+        order = self.cold_candidates(max_level)
+        for lo in range(0, order.size, block):
+            part = order[lo:lo + block]
+            keep = overlap[part] == 0
+            if exclude is not None:
+                keep &= ~exclude[part]
+            part = part[keep][:need]
+            out.append(part)
+            need -= part.size
+            if need == 0:
+                break
+        return np.concatenate(out).astype(np.int32, copy=False)
@@ -0,0 +1,189 @@
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+# Bản inference chỉ cần NumPy/SciPy của pipeline TfidfVectorizer (→ TruncatedSVD → Normalizer):
+# - vectorizer_lean.json      : cài đặt tokenizer (lowercase, strip_accents, token_pattern, ngram_range...) + vocab theo cột
+# - vectorizer_idf.npy        : idf_ (float32)
+# - vectorizer_components.npy : components_ của SVD (k x n_terms, float32), chỉ có với LSA
+# Serving đọc bộ này thay cho vectorizer.pkl (không unpickle, không import sklearn).
+# Mode hashing không export (HashingVectorizer không có vocab) → vẫn dùng vectorizer.pkl.
+
+LEAN_NAME = "vectorizer_lean.json"
+IDF_NAME = "vectorizer_idf.npy"
+COMPONENTS_NAME = "vectorizer_components.npy"
+LEAN_FILES = (LEAN_NAME, IDF_NAME, COMPONENTS_NAME)
+
+# sai lệch tối đa cho phép so với pipeline sklearn trên tập văn bản kiểm tra lúc train
+LEAN_TOL = float(os.environ.get("LEAN_TOL", "1e-4"))
+
+
+def _strip_accents_unicode(s: str) -> str:
+    # giống sklearn strip_accents_unicode: NFKD rồi bỏ dấu kết hợp
+    try:
+        s.encode("ASCII", errors="strict")
+        return s
+    except UnicodeEncodeError:
+        normalized = unicodedata.normalize("NFKD", s)
+        return "".join(c for c in normalized if not unicodedata.combining(c))
+
+
+def _strip_accents_ascii(s: str) -> str:
+    nkfd = unicodedata.normalize("NFKD", s)
+    return nkfd.encode("ASCII", "ignore").decode("ASCII")
+
+
+_ACCENTS = {None: None, "unicode": _strip_accents_unicode, "ascii": _strip_accents_ascii}
+
+
+def _l2(X):
+    """ Chuẩn hóa L2 từng dòng (dòng 0 giữ nguyên), dense hoặc CSR. """
+    if sparse.issparse(X):
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1), dtype=np.float64).ravel())
+        norms[norms == 0] = 1.0
+        X.data /= np.repeat(norms, np.diff(X.indptr)).astype(X.dtype)
+        return X
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return X / norms
+
+
+class LeanVectorizer:
+    """ transform(texts) như pipeline sklearn gốc: CSR float32 (TF-IDF) hoặc dense float32 (LSA). """
+
+    def __init__(self, settings: dict, terms: List[str], idf: np.ndarray, components: Optional[np.ndarray] = None):
+        self.settings = settings
+        self.terms = terms
+        self.vocabulary_: Dict[str, int] = {t: i for i, t in enumerate(terms)}
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.components = components
+        self._pattern = re.compile(settings["token_pattern"])
+        self._accents = _ACCENTS[settings["strip_accents"]]
+
+    @classmethod
+    def from_sklearn(cls, vectorizer) -> Optional["LeanVectorizer"]:
+        """ None nếu pipeline có bước/cài đặt không tái hiện được (hashing, analyzer tùy biến...). """
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.preprocessing import Normalizer
+
+        steps = [s for _, s in vectorizer.steps] if hasattr(vectorizer, "steps") else [vectorizer]
+        tfidf = steps[0]
+        if not isinstance(tfidf, TfidfVectorizer):
+            return None
+        if (tfidf.analyzer != "word" or tfidf.input != "content" or tfidf.preprocessor is not None
+                or tfidf.tokenizer is not None or tfidf.stop_words is not None
+                or tfidf.strip_accents not in _ACCENTS or tfidf.norm not in ("l2", None)):
+            return None
+        components = None
+        if len(steps) > 1:
+            if (len(steps) != 3 or not isinstance(steps[1], TruncatedSVD)
+                    or not isinstance(steps[2], Normalizer) or steps[2].norm != "l2"):
+                return None
+            components = np.asarray(steps[1].components_, dtype=np.float32)
+
+        terms = [""] * len(tfidf.vocabulary_)
+        for t, i in tfidf.vocabulary_.items():
+            terms[i] = t
+        settings = {
+            "lowercase": bool(tfidf.lowercase),
+            "strip_accents": tfidf.strip_accents,
+            "token_pattern": tfidf.token_pattern,
+            "ngram_range": list(tfidf.ngram_range),
+            "binary": bool(tfidf.binary),
+            "use_idf": bool(tfidf.use_idf),
+            "sublinear_tf": bool(tfidf.sublinear_tf),
+            "norm": tfidf.norm,
+        }
+        idf = tfidf.idf_ if tfidf.use_idf else np.ones(len(terms))
+        return cls(settings, terms, idf, components)
+
+    # ==== tokenizer (cùng thứ tự bước với sklearn: lowercase → strip_accents → token_pattern → n-gram) ====
+    def build_analyzer(self):
+        return self._analyze
+
+    def _analyze(self, doc: str) -> List[str]:
+        if self.settings["lowercase"]:
+            doc = doc.lower()
+        if self._accents is not None:
+            doc = self._accents(doc)
+        tokens = self._pattern.findall(doc)
+        min_n, max_n = self.settings["ngram_range"]
+        if max_n == 1:
+            return tokens
+        out = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n, len(tokens)) + 1):
+            out.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return out
+
+    def transform(self, texts: Iterable[str]):
+        indptr, indices, data = [0], [], []
+        vocab = self.vocabulary_
+        for doc in texts:
+            counts = Counter(j for j in map(vocab.get, self._analyze(doc)) if j is not None)
+            cols = sorted(counts)
+            indices.extend(cols)
+            data.extend(counts[c] for c in cols)
+            indptr.append(len(indices))
+        X = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+            shape=(len(indptr) - 1, len(self.terms)),
+        )
+        if self.settings["binary"]:
+            X.data[:] = 1.0
+        if self.settings["sublinear_tf"]:
+            X.data = np.log(X.data) + 1.0
+        X.data *= self.idf[X.indices]
+        if self.settings["norm"] == "l2":
+            X = _l2(X)
+        if self.components is None:
+            return X
+        return _l2(np.asarray(X @ self.components.T, dtype=np.float32))
+
+    def max_abs_diff(self, vectorizer, texts: List[str]) -> float:
+        """ Sai lệch tuyệt đối lớn nhất so với vectorizer sklearn trên texts. """
+        if not texts:
+            return 0.0
+        ref, out = vectorizer.transform(texts), self.transform(texts)
+        if sparse.issparse(ref):
+            diff = abs(sparse.csr_matrix(ref, dtype=np.float64) - sparse.csr_matrix(out, dtype=np.float64))
+            return float(diff.max()) if diff.nnz else 0.0
+        return float(np.abs(np.asarray(ref, dtype=np.float64) - out).max())
+
+    # ==== đọc/ghi ====
+    def save(self, path: str):
+        with open(os.path.join(path, LEAN_NAME), "w", encoding="utf-8") as f:
+            json.dump({"settings": self.settings, "terms": self.terms}, f, ensure_ascii=False)
+        np.save(os.path.join(path, IDF_NAME), self.idf)
+        if self.components is not None:
+            np.save(os.path.join(path, COMPONENTS_NAME), np.ascontiguousarray(self.components))
+
+    @classmethod
+    def read(cls, path: str, mmap: bool = True) -> Optional["LeanVectorizer"]:
+        try:
+            with open(os.path.join(path, LEAN_NAME), "r", encoding="utf-8") as f:
+                spec = json.load(f)
+        except OSError:
+            return None
+        mode = "r" if mmap else None
+        comp_path = os.path.join(path, COMPONENTS_NAME)
+        components = np.load(comp_path, mmap_mode=mode) if os.path.exists(comp_path) else None
+        return cls(spec["settings"], spec["terms"], np.load(os.path.join(path, IDF_NAME)), components)
+
+
+def export(vectorizer, probe_texts: List[str]) -> Tuple[Optional[LeanVectorizer], Optional[float]]:
+    """
+    (bản lean, sai lệch max trên probe_texts). Bản lean = None nếu không tái hiện được
+    pipeline hoặc sai lệch > LEAN_TOL → serving dùng vectorizer.pkl.
+    """
+    lean = LeanVectorizer.from_sklearn(vectorizer)
+    if lean is None:
+        return None, None
+    diff = lean.max_abs_diff(vectorizer, probe_texts)
+    return (lean if diff <= LEAN_TOL else None), diff
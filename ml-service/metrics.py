@@ -0,0 +1,88 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# Metrics dạng text của Prometheus (exposition format 0.0.4), không cần prometheus_client:
+# - STAGE_SECONDS{stage=...}: thời gian từng bước trong recommend (context_fetch, goal_vectorize,
+#   profile, similarity, known_filter, ranking, cold_start)
+# - REQUEST_SECONDS{endpoint=...}: thời gian cả request theo route
+# Gauge/counter khác (model, cache...) do app.py đưa vào render() lúc scrape.
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    esc = [str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in values]
+    return "{" + ",".join('%s="%s"' % (n, v) for n, v in zip(names, esc)) + "}"
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}   # labels → [count mỗi bucket..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            row = self._series.get(labels)
+            if row is None:
+                row = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = ["# HELP %s %s" % (self.name, self.doc), "# TYPE %s histogram" % self.name]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labels, row in sorted(series.items()):
+            acc = 0
+            for b, n in zip(self.buckets, row):
+                acc += n
+                lines.append("%s_bucket%s %d" % (self.name, _labels(self.labelnames + ("le",), labels + (_num(b),)), acc))
+            lines.append("%s_bucket%s %d" % (self.name, _labels(self.labelnames + ("le",), labels + ("+Inf",)), row[-1]))
+            lines.append("%s_sum%s %s" % (self.name, _labels(self.labelnames, labels), repr(row[-2])))
+            lines.append("%s_count%s %d" % (self.name, _labels(self.labelnames, labels), row[-1]))
+        return lines
+
+
+STAGE_SECONDS = Histogram("mlsvc_stage_seconds", "Duration of recommend pipeline stages in seconds", ("stage",))
+REQUEST_SECONDS = Histogram("mlsvc_request_seconds", "Request duration by endpoint in seconds", ("endpoint",))
+
+
+@contextmanager
+def stage(name: str):
+    """ with stage("similarity"): ... → ghi vào STAGE_SECONDS. """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - t0, name)
+
+
+def sample(name: str, kind: str, doc: str, values: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """ 1 metric gauge/counter: values = [(labels, giá trị), ...]. """
+    lines = ["# HELP %s %s" % (name, doc), "# TYPE %s %s" % (name, kind)]
+    for labels, v in values:
+        lines.append("%s%s %s" % (name, _labels(list(labels), list(labels.values())), _num(v)))
+    return lines
+
+
+def render(extra: Iterable[List[str]] = ()) -> str:
+    lines = STAGE_SECONDS.render() + REQUEST_SECONDS.render()
+    for block in extra:
+        lines.extend(block)
+    return "\n".join(lines) + "\n"
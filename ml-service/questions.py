@@ -1,5 +1,6 @@
 # Bộ câu hỏi mở rộng – thân thiện cho người mới,
 # cho phép đánh dấu "đã biết" để loại khỏi gợi ý (đưa sang Ôn tập).
+from itertools import combinations, product
 
 DEFAULT_QUESTIONS = [
   {
@@ -140,3 +141,25 @@ def infer_max_level(answers: dict) -> int:
         level = max(level, 2)
 
     return max(1, min(level, 3))
+
+
+def reachable_goal_sets():
+    """
+    Duyệt mọi tổ hợp câu trả lời của DEFAULT_QUESTIONS (câu đơn có thể bỏ trống,
+    câu 'multi' lấy mọi tập con) → yield từng list goals đúng thứ tự answers_to_goals trả về, không lặp.
+    """
+    choices = []
+    for q in DEFAULT_QUESTIONS:
+        keys = [o["key"] for o in q["options"]]
+        if q.get("multi"):
+            choices.append([list(c) for r in range(len(keys) + 1) for c in combinations(keys, r)])
+        else:
+            choices.append([None] + keys)
+
+    seen = set()
+    for combo in product(*choices):
+        answers = {q["key"]: v for q, v in zip(DEFAULT_QUESTIONS, combo) if v is not None}
+        key = tuple(answers_to_goals(answers))
+        if key not in seen:
+            seen.add(key)
+            yield list(key)
@@ -0,0 +1,80 @@
+from typing import Optional
+
+import numpy as np
+from scipy import sparse
+
+# Kernel chấm điểm cosine trên hot path, thay cho sklearn cosine_similarity
+# (hàm đó validate + chuẩn hóa lại cả doc_matrix ở mỗi lần gọi):
+# - doc_matrix lưu float32 (dense C-contiguous hoặc CSR), norm từng dòng tính sẵn lúc train (doc_norms.npy)
+# - dòng TF-IDF / LSA vốn đã chuẩn hóa L2 → inv_norms = None, bỏ luôn phép nhân
+# - query chuẩn hóa (vài dòng) rồi nhân 1 lần: GEMM/GEMV (dense) hoặc CSR x dense (sparse)
+
+UNIT_TOL = 1e-3
+# doc_matrix CSR: query được dense hóa theo khối (tối đa ngần này phần tử float32) để nhân CSR x dense
+DENSE_QUERY_MAX = 1 << 24
+# nhiều query hơn ngưỡng này (batch) thì CSR x CSR^T lại nhanh hơn (đo bằng bench/scoring.py)
+SPMM_MAX_ROWS = 96
+
+
+def row_norms(X) -> np.ndarray:
+    """ Norm L2 từng dòng (float32), dense hoặc CSR. """
+    if sparse.issparse(X):
+        sq = np.asarray(X.multiply(X).sum(axis=1), dtype=np.float32).ravel()
+        return np.sqrt(sq)
+    return np.linalg.norm(np.asarray(X, dtype=np.float32), axis=1).astype(np.float32)
+
+
+def inverse_norms(norms: np.ndarray) -> Optional[np.ndarray]:
+    """ 1/norm (0 cho dòng rỗng); None nếu mọi dòng khác 0 đã có norm ~1 (dòng rỗng tự cho điểm 0). """
+    norms = np.asarray(norms, dtype=np.float32)
+    nonzero = norms > 0
+    if np.all(np.abs(norms[nonzero] - 1.0) <= UNIT_TOL):
+        return None
+    inv = np.zeros_like(norms)
+    inv[nonzero] = 1.0 / norms[nonzero]
+    return inv
+
+
+def l2_rows(Q):
+    """ Chuẩn hóa L2 từng dòng query (dòng 0 giữ nguyên 0), giữ dạng dense/CSR, float32. """
+    norms = row_norms(Q)
+    scale = np.where(norms > 0, 1.0 / np.where(norms > 0, norms, 1.0), 0.0).astype(np.float32)
+    if sparse.issparse(Q):
+        return sparse.diags(scale) @ Q.tocsr().astype(np.float32)
+    return np.asarray(Q, dtype=np.float32) * scale[:, None]
+
+
+def blend(prof, goals, has_prof: np.ndarray, w_prof: float = 0.8):
+    """
+    Query gộp: w*p/|p| + (1-w)*g/|g| cho user có profile, g/|g| cho user không có.
+    Vì doc đã chuẩn hóa: doc·query = w*cos(p, doc) + (1-w)*cos(g, doc) → 1 phép nhân thay vì 2.
+    """
+    wp = np.where(has_prof, w_prof, 0.0).astype(np.float32)
+    wg = np.where(has_prof, 1.0 - w_prof, 1.0).astype(np.float32)
+    P, G = l2_rows(prof), l2_rows(goals)
+    if sparse.issparse(P) or sparse.issparse(G):
+        return (sparse.diags(wp) @ sparse.csr_matrix(P) + sparse.diags(wg) @ sparse.csr_matrix(G)).tocsr()
+    return wp[:, None] * P + wg[:, None] * G
+
+
+def similarity(X, Q, inv_norms: Optional[np.ndarray] = None) -> np.ndarray:
+    """ (n_query x n_items) = Q @ X^T (x inv_norms), Q đã chuẩn hóa; không copy doc_matrix. """
+    if sparse.issparse(X) and sparse.issparse(Q) and Q.shape[0] > SPMM_MAX_ROWS:
+        # X CSR giữ nguyên (X.T ở vế phải bắt scipy đổi cả doc_matrix sang CSR mỗi lần gọi)
+        S = (X @ Q.T.tocsc()).T.toarray()
+    elif sparse.issparse(X):
+        # ít query: CSR x dense (SpMM) nhanh hơn hẳn CSR x CSR^T
+        S = np.empty((Q.shape[0], X.shape[0]), dtype=np.float32)
+        step = max(1, DENSE_QUERY_MAX // max(1, X.shape[1]))
+        for lo in range(0, Q.shape[0], step):
+            q = Q[lo:lo + step]
+            q = q.toarray() if sparse.issparse(q) else np.asarray(q)
+            S[lo:lo + step] = (X @ q.astype(np.float32, copy=False).T).T
+    else:
+        if sparse.issparse(Q):
+            Q = Q.toarray()
+        S = Q @ X.T
+    S = S.astype(np.float32, copy=False)
+    if inv_norms is not None:
+        S *= inv_norms
+    return S
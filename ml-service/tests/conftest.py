@@ -0,0 +1,5 @@
+import os
+import sys
+
+# module của service import phẳng (from cache import ...) như khi chạy uvicorn trong ml-service/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,82 @@
+import pytest
+
+import cache
+from cache import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_ttl_expiry(clock):
+    c = ResultCache(maxsize=10, ttl=5)
+    c.put(("u1", 6), ["a"])
+    clock[0] += 4.9
+    assert c.get(("u1", 6)) == ["a"]
+    clock[0] += 0.2
+    assert c.get(("u1", 6)) is None
+    assert c.stats()["expirations"] == 1 and len(c) == 0
+
+
+def test_lru_eviction(clock):
+    c = ResultCache(maxsize=2, ttl=60)
+    c.put(("u1",), 1)
+    c.put(("u2",), 2)
+    c.get(("u1",))
+    c.put(("u3",), 3)
+    assert c.get(("u2",)) is None
+    assert c.get(("u1",)) == 1 and c.get(("u3",)) == 3
+    assert c.stats()["evictions"] == 1
+
+
+def test_invalidate_user_drops_only_that_user(clock):
+    c = ResultCache(maxsize=10, ttl=60)
+    c.put(("u1", 6, None), 1)
+    c.put(("u1", 3, "chord"), 2)
+    c.put(("u2", 6, None), 3)
+    assert c.invalidate_user("u1") == 2
+    assert c.get(("u1", 6, None)) is None and c.get(("u1", 3, "chord")) is None
+    assert c.get(("u2", 6, None)) == 3
+    assert c.invalidate_user("unknown") == 0
+
+
+def test_put_after_invalidate_is_skipped(clock):
+    c = ResultCache(maxsize=10, ttl=60)
+    token = c.token()
+    c.invalidate_user("u1")          # event mới tới trong lúc đang tính
+    c.put(("u1", 6), "stale", token=token)
+    c.put(("u2", 6), "fresh", token=token)
+    assert c.get(("u1", 6)) is None
+    assert c.get(("u2", 6)) == "fresh"
+    assert c.stats()["stale_puts"] == 1
+    c.put(("u1", 6), "new", token=c.token())
+    assert c.get(("u1", 6)) == "new"
+
+
+def test_clear_rejects_tokens_taken_before(clock):
+    c = ResultCache(maxsize=10, ttl=60)
+    token = c.token()
+    c.clear()
+    c.put(("u1",), 1, token=token)
+    assert len(c) == 0
+    c.put(("u1",), 1, token=c.token())
+    assert c.get(("u1",)) == 1
+
+
+def test_untracked_users_fall_back_to_floor(clock):
+    c = ResultCache(maxsize=1, ttl=60)
+    token = c.token()
+    for i in range(c._max_tracked + 1):
+        c.invalidate_user(f"u{i}")
+    # u0 đã bị đẩy khỏi bảng theo dõi nhưng vẫn không được ghi kết quả cũ
+    c.put(("u0",), 1, token=token)
+    assert len(c) == 0
+
+
+def test_disabled_cache():
+    c = ResultCache(maxsize=0, ttl=60)
+    c.put(("u1",), 1)
+    assert c.get(("u1",)) is None
@@ -0,0 +1,75 @@
+import os
+import threading
+
+import pytest
+
+import ann
+import tfidf_service
+from tfidf_service import TfidfReco
+
+WORDS = ["hợp", "âm", "giai", "nhịp", "quãng", "đảo", "tiến", "trình", "khóa", "cảm"]
+
+
+def _lesson(i):
+    text = " ".join(WORDS[(i * k) % len(WORDS)] for k in range(1, 8))
+    return {"_id": f"l{i}", "title": f"Bài {i} {text}", "summary": text, "level": 1 + i % 3}
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    lessons = {f"l{i}": _lesson(i) for i in range(60)}
+    monkeypatch.setattr(tfidf_service, "iter_lessons", lambda uri, db: iter(list(lessons.values())))
+    monkeypatch.setattr(tfidf_service, "load_lesson", lambda uri, db, lid: lessons.get(lid))
+    monkeypatch.setattr(tfidf_service, "GOAL_WARM_MAX", 0)
+    monkeypatch.setattr(ann, "ANN_INDEX", "flat")
+    monkeypatch.setattr(ann, "ANN_MIN_ITEMS", 1)
+    eng = TfidfReco(model_dir=str(tmp_path))
+    eng.activate(os.path.basename(eng.train_and_save(use_lsa=True)))
+    lessons["l60"] = _lesson(60)
+    return eng
+
+
+def test_version_ann_is_built_before_activation(engine):
+    snap = engine._snap
+    assert snap.ann is not None and snap.ann.ntotal == 60
+    assert os.path.exists(os.path.join(engine.model_dir, snap.version, "ann-flat.index"))
+    out = engine.fold_in("l60")
+    assert engine._snap.version == out["version"] and engine._snap.ann.ntotal == 61
+
+
+def test_fold_in_builds_outside_model_lock(engine, monkeypatch):
+    held = []
+    build = tfidf_service.load_or_build
+
+    def spy(path, vectors, *a, **kw):
+        held.append(engine._model_lock.locked())
+        return build(path, vectors, *a, **kw)
+
+    monkeypatch.setattr(tfidf_service, "load_or_build", spy)
+    engine.fold_in("l60")
+    assert held and not any(held)
+
+
+def test_fold_in_redone_when_model_swapped_mid_build(engine, monkeypatch):
+    trained = engine.train_and_save(use_lsa=True)
+    fold = engine._fold_in_version
+    calls, built = [], []
+
+    def racing(snap, doc):
+        calls.append(snap.version)
+        if len(calls) == 1:
+            # /train activate chen vào giữa lúc fold-in đang dựng version
+            t = threading.Thread(target=engine.activate, args=(os.path.basename(trained),))
+            t.start()
+            t.join()
+        version, result = fold(snap, doc)
+        built.append(version)
+        return version, result
+
+    monkeypatch.setattr(engine, "_fold_in_version", racing)
+    out = engine.fold_in("l60")
+    assert calls[1] == os.path.basename(trained) != calls[0]
+    assert engine._snap.version == out["version"]
+    assert engine._snap.manifest["base_version"] == os.path.basename(trained)
+    # bản dựng trên model cũ bị bỏ
+    assert not os.path.exists(os.path.join(engine.model_dir, built[0]))
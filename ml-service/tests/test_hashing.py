@@ -0,0 +1,35 @@
+import pickle
+
+import numpy as np
+
+import tfidf_service
+from tfidf_service import HashedColumns, _fit_vectorizer
+
+DOCS = [
+    "Hợp âm Cmaj7 và tiến trình ii-V-I",
+    "Âm giai trưởng, âm giai thứ tự nhiên",
+    "Nhịp 3/4 và nhịp 6/8 trong valse",
+    "Quãng ba trưởng, quãng ba thứ, quãng năm đúng",
+    "Đảo hợp âm: thế đảo 1, thế đảo 2",
+    "Tiến trình I-vi-IV-V và vòng hòa âm",
+]
+
+
+def test_hashing_lsa_artifact_does_not_grow_with_hash_features(monkeypatch):
+    monkeypatch.setattr(tfidf_service, "HASH_FEATURES", 2 ** 20)
+    vec, X = _fit_vectorizer(DOCS, use_lsa=True, mode="hashing")
+    cols = next(s for _, s in vec.steps if isinstance(s, HashedColumns))
+    svd = vec.named_steps["truncatedsvd"]
+    assert svd.components_.shape[1] == len(cols.columns) < 200
+    # trước đây components_ 2^20 x 5 float64 ≈ 40 MB
+    assert len(pickle.dumps(vec)) < 1 << 20
+    np.testing.assert_allclose(vec.transform(DOCS), X, atol=1e-6)
+    q = vec.transform(["hợp âm chưa gặp xyz"])
+    assert q.shape == (1, X.shape[1]) and np.isfinite(q).all()
+
+
+def test_hashing_without_lsa_keeps_all_columns(monkeypatch):
+    monkeypatch.setattr(tfidf_service, "HASH_FEATURES", 2 ** 12)
+    vec, X = _fit_vectorizer(DOCS, use_lsa=False, mode="hashing")
+    assert X.shape == (len(DOCS), 2 ** 12)
+    assert not any(isinstance(s, HashedColumns) for _, s in vec.steps)
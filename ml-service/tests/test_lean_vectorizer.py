@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from lean_vectorizer import LeanVectorizer, export
+from tfidf_service import _fit_vectorizer
+
+DOCS = [
+    "Hợp âm Cmaj7 và tiến trình ii-V-I",
+    "Âm giai trưởng, âm giai thứ tự nhiên",
+    "Nhịp 3/4 và nhịp 6/8 trong valse",
+    "Quãng ba trưởng, quãng ba thứ, quãng năm đúng",
+    "Đảo hợp âm: thế đảo 1, thế đảo 2",
+    "Tiến trình I-vi-IV-V và vòng hòa âm",
+    "Đọc khóa Sol, khóa Fa, dòng kẻ phụ",
+    "Cảm âm và giai điệu ngũ cung",
+]
+PROBES = DOCS + ["Hợp âm CMAJ7 thế đảo", "từ chưa gặp hoàn toàn", "", "âm âm âm giai giai"]
+
+
+@pytest.mark.parametrize("use_lsa", [False, True])
+def test_matches_sklearn(use_lsa):
+    vec, _ = _fit_vectorizer(DOCS, use_lsa=use_lsa)
+    lean = LeanVectorizer.from_sklearn(vec)
+    assert lean is not None
+    ref, out = vec.transform(PROBES), lean.transform(PROBES)
+    assert sparse.issparse(out) == sparse.issparse(ref)
+    if sparse.issparse(ref):
+        assert out.dtype == np.float32
+        np.testing.assert_allclose(out.toarray(), ref.toarray(), atol=1e-6)
+    else:
+        np.testing.assert_allclose(out, ref, atol=1e-5)
+
+
+def test_save_read_roundtrip(tmp_path):
+    vec, _ = _fit_vectorizer(DOCS, use_lsa=True)
+    lean, diff = export(vec, PROBES)
+    assert lean is not None and diff <= 1e-4
+    lean.save(str(tmp_path))
+    back = LeanVectorizer.read(str(tmp_path))
+    np.testing.assert_array_equal(back.transform(PROBES), lean.transform(PROBES))
+
+
+def test_hashing_not_exported():
+    vec, _ = _fit_vectorizer(DOCS, use_lsa=False, mode="hashing")
+    assert LeanVectorizer.from_sklearn(vec) is None
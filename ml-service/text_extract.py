@@ -0,0 +1,191 @@
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Trích text của lesson cho TF-IDF (chạy trước vectorizer khi train):
+# - build_text: 1 bài → 1 chuỗi (thuần Python, không phụ thuộc sklearn → worker spawn nhẹ)
+# - lessons đọc theo khối TEXT_EXTRACT_CHUNK, bài chưa có trong cache chia cho process pool,
+#   kết quả ghép lại đúng thứ tự cursor → output giống hệt chạy tuần tự
+# - TextCache (sqlite trong model_dir): khóa _id + updatedAt, train lại chỉ trích bài đã đổi
+
+TEXT_WORKERS = int(os.environ.get("TEXT_WORKERS", str(os.cpu_count() or 1)))
+TEXT_EXTRACT_CHUNK = int(os.environ.get("TEXT_EXTRACT_CHUNK", "2000"))
+TEXT_PARALLEL_MIN = int(os.environ.get("TEXT_PARALLEL_MIN", "500"))   # ít bài cần trích hơn → chạy tại chỗ
+TEXT_CACHE_NAME = "text_cache.sqlite"
+
+
+def build_text(doc: Dict) -> str:
+    """
+    Gom tối đa nội dung để TF-IDF 'hiểu bài':
+    - title, summary, topic, tags
+    - markdown
+    - blocks: text/caption/items/rows/language
+    - prereqs (tên/slug)
+    - quiz_pool.tags
+    """
+    title = doc.get("title") or ""
+    summary = doc.get("summary") or ""
+    topic = doc.get("topic") or ""
+    tags = doc.get("tags") or []
+
+    markdown = doc.get("markdown") or ""
+    prereqs = " ".join(doc.get("prereqs") or [])
+
+    blocks = doc.get("blocks") or []
+    block_texts = []
+    for b in blocks:
+        t = []
+        if b.get("text"): t.append(str(b["text"]))
+        if b.get("caption"): t.append(str(b["caption"]))
+        if b.get("items"):
+            try:
+                t.extend([str(x) for x in b["items"]])
+            except Exception:
+                pass
+        if b.get("rows"):
+            try:
+                for row in b["rows"]:
+                    t.extend([str(x) for x in row])
+            except Exception:
+                pass
+        if b.get("language"): t.append(str(b["language"]))
+        block_texts.append(" ".join(t))
+    blocks_join = " ".join(block_texts)
+
+    qp = doc.get("quiz_pool") or []
+    quiz_tags = []
+    for it in qp:
+        quiz_tags.extend(it.get("tags") or [])
+    quiz_tags_join = " ".join(quiz_tags)
+
+    return " ".join([
+        title, summary, topic, " ".join(tags),
+        prereqs, markdown, blocks_join, quiz_tags_join
+    ])
+
+
+
+def build_texts(docs: List[Dict]) -> List[str]:
+    return [build_text(d) for d in docs]
+
+
+def cache_key(doc: Dict) -> Tuple[str, Optional[str]]:
+    """ (id, updatedAt) — bài không có updatedAt thì không cache được (luôn trích lại). """
+    iid = str(doc.get("_id") or doc.get("id") or doc.get("slug"))
+    updated = doc.get("updatedAt")
+    return iid, (updated.isoformat() if hasattr(updated, "isoformat") else (str(updated) if updated else None))
+
+
+class TextCache:
+    """ Bảng sqlite id → (updatedAt, text). Chỉ dùng trong 1 thread (thread train). """
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS texts (id TEXT PRIMARY KEY, updated TEXT NOT NULL, text TEXT NOT NULL)")
+
+    def get_many(self, keys: List[Tuple[str, Optional[str]]]) -> Dict[str, str]:
+        ids = [iid for iid, upd in keys if upd is not None]
+        out: Dict[str, str] = {}
+        want = dict(k for k in keys if k[1] is not None)
+        for lo in range(0, len(ids), 900):   # giới hạn số tham số của sqlite
+            part = ids[lo:lo + 900]
+            q = "SELECT id, updated, text FROM texts WHERE id IN (%s)" % ",".join("?" * len(part))
+            for iid, upd, text in self._conn.execute(q, part):
+                if want.get(iid) == upd:
+                    out[iid] = text
+        return out
+
+    def put_many(self, rows: List[Tuple[str, str, str]]):
+        if rows:
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO texts (id, updated, text) VALUES (?, ?, ?)", rows)
+
+    def retain(self, ids: Iterable[str]):
+        """ Xóa bài không còn trong catalog (gọi sau khi đã duyệt hết lessons). """
+        with self._conn:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (id TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM keep")
+            self._conn.executemany("INSERT OR IGNORE INTO keep (id) VALUES (?)", ((i,) for i in ids))
+            self._conn.execute("DELETE FROM texts WHERE id NOT IN (SELECT id FROM keep)")
+
+    def close(self):
+        self._conn.close()
+
+
+class TextExtractor:
+    """
+    extract(lessons) → yield (doc, text) đúng thứ tự đầu vào. Khối tiếp theo được đọc
+    từ cursor trong lúc worker còn trích khối trước. stats: hits (lấy từ cache), extracted.
+    """
+    def __init__(self, cache: Optional[TextCache] = None, workers: int = TEXT_WORKERS,
+                 chunk: int = TEXT_EXTRACT_CHUNK, parallel_min: int = TEXT_PARALLEL_MIN):
+        self.cache = cache
+        self.workers = max(1, workers)
+        self.chunk = max(1, chunk)
+        self.parallel_min = parallel_min
+        self.stats = {"hits": 0, "extracted": 0}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._seen: List[str] = []
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: không fork process đang có nhiều thread (uvicorn, executor)
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _submit(self, docs: List[Dict]):
+        keys = [cache_key(d) for d in docs]
+        cached = self.cache.get_many(keys) if self.cache is not None else {}
+        miss = [i for i, (iid, _) in enumerate(keys) if iid not in cached]
+        if self.workers > 1 and len(miss) >= self.parallel_min:
+            size = -(-len(miss) // self.workers)
+            parts = [miss[lo:lo + size] for lo in range(0, len(miss), size)]
+            pool = self._get_pool()
+            futures = [(part, pool.submit(build_texts, [docs[i] for i in part])) for part in parts]
+        else:
+            futures = [(miss, None)]
+        return docs, keys, cached, futures
+
+    def _collect(self, job) -> Iterator[Tuple[Dict, str]]:
+        docs, keys, cached, futures = job
+        texts: List[Optional[str]] = [cached.get(iid) for iid, _ in keys]
+        fresh = []
+        for part, fut in futures:
+            out = fut.result() if fut is not None else build_texts([docs[i] for i in part])
+            for i, text in zip(part, out):
+                texts[i] = text
+                if keys[i][1] is not None:
+                    fresh.append((keys[i][0], keys[i][1], text))
+        if self.cache is not None:
+            self.cache.put_many(fresh)
+        self.stats["hits"] += len(docs) - sum(len(p) for p, _ in futures)
+        self.stats["extracted"] += sum(len(p) for p, _ in futures)
+        self._seen.extend(iid for iid, _ in keys)
+        for doc, text in zip(docs, texts):
+            yield doc, text
+
+    def extract(self, lessons: Iterable[Dict]) -> Iterator[Tuple[Dict, str]]:
+        it = iter(lessons)
+        pending = None
+        while True:
+            docs = list(islice(it, self.chunk))
+            job = self._submit(docs) if docs else None
+            if pending is not None:
+                yield from self._collect(pending)
+            if job is None:
+                break
+            pending = job
+        if self.cache is not None:
+            self.cache.retain(self._seen)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self.cache is not None:
+            self.cache.close()
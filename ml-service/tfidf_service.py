@@ -1,69 +1,252 @@
 import os
 import json
-from typing import List, Dict, Optional
-from joblib import dump, load
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.decomposition import TruncatedSVD
-from sklearn.pipeline import make_pipeline
-from sklearn.preprocessing import Normalizer
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from itertools import chain, islice
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 import numpy as np
-from pymongo import MongoClient
+from scipy import sparse
+
+from db import get_async_db, get_db
+from data_loader import iter_lessons, load_lesson, load_user_context, UserContext
+from item_store import ItemStore
+from artifacts import VECTORIZER_NAME, IdIndex, IdList, build_id_maps, has_model, load_model, load_norms, save_model
+from cache import LRUCache
+from ann import ANN_CANDIDATES, AnnIndex, exact_top_k, load_or_build
+from questions import reachable_goal_sets
+from metrics import STAGE_SECONDS, stage
+from scoring import blend, inverse_norms, similarity
+from lean_vectorizer import LeanVectorizer, export as export_lean
+from text_extract import TEXT_CACHE_NAME, TextCache, TextExtractor, build_text as _build_text
+
+PACK_NAME = "model.pkl"            # định dạng cũ (joblib gồm cả doc_matrix), chỉ còn đọc
+META_NAME = "item_meta.json"
+CURRENT_NAME = "CURRENT"          # file trỏ tới thư mục version đang active
 
-from data_loader import load_lessons_events, load_user_recent
+# mode "hashing": HashingVectorizer (không giữ vocab) + TfidfTransformer, transform theo khối TEXT_CHUNK bài;
+# kèm LSA thì chỉ giữ các cột hashing có trong corpus (HashedColumns)
+VECTORIZER_MODES = ("tfidf", "hashing")
+HASH_FEATURES = int(os.environ.get("HASH_FEATURES", str(2 ** 20)))
+TEXT_CHUNK = 1000
 
-PACK_NAME = "model.pkl"
-META_NAME = "item_meta.json"
+# số bài đầu corpus (+ các tập goals) dùng để kiểm bản lean của vectorizer khớp sklearn lúc train
+LEAN_PROBE_DOCS = 200
+
+# fold-in: quá ngưỡng này thì nên train lại toàn bộ
+REFIT_MAX_FOLDED_RATIO = float(os.environ.get("REFIT_MAX_FOLDED_RATIO", "0.1"))
+REFIT_MAX_UNSEEN_RATIO = float(os.environ.get("REFIT_MAX_UNSEEN_RATIO", "0.2"))
+
+# số thư mục version giữ lại trong model_store sau mỗi lần train
+KEEP_VERSIONS = int(os.environ.get("MODEL_KEEP_VERSIONS", "3"))
+
+# số user chấm điểm cùng lúc trong recommend_many (giới hạn RAM của ma trận điểm)
+BATCH_CHUNK = int(os.environ.get("BATCH_CHUNK", "256"))
+
+# cache vector query của goals; đủ chứa mọi tập goals sinh ra từ DEFAULT_QUESTIONS
+GOAL_CACHE_SIZE = int(os.environ.get("GOAL_CACHE_SIZE", "65536"))
+GOAL_WARM_CHUNK = 4096
+# số list goals nạp sẵn (thread nền sau khi swap model), 0 = tắt
+GOAL_WARM_MAX = int(os.environ.get("GOAL_WARM_MAX", str(GOAL_CACHE_SIZE)))
 
 
-def _build_text(doc: Dict) -> str:
+def goal_key(goals: Iterable[str]) -> Tuple[str, ...]:
     """
-    Gom tối đa nội dung để TF-IDF 'hiểu bài':
-    - title, summary, topic, tags
-    - markdown
-    - blocks: text/caption/items/rows/language
-    - prereqs (tên/slug)
-    - quiz_pool.tags
+    Khóa của 1 list goals: bỏ rỗng, giữ nguyên thứ tự và phần tử lặp. Vector được embed từ
+    " ".join(goals) như trước; sort/bỏ trùng sẽ đổi bigram / tf nên đổi luôn kết quả gợi ý.
     """
-    title = doc.get("title") or ""
-    summary = doc.get("summary") or ""
-    topic = doc.get("topic") or ""
-    tags = doc.get("tags") or []
-
-    markdown = doc.get("markdown") or ""
-    prereqs = " ".join(doc.get("prereqs") or [])
-
-    blocks = doc.get("blocks") or []
-    block_texts = []
-    for b in blocks:
-        t = []
-        if b.get("text"): t.append(str(b["text"]))
-        if b.get("caption"): t.append(str(b["caption"]))
-        if b.get("items"):
-            try:
-                t.extend([str(x) for x in b["items"]])
-            except Exception:
-                pass
-        if b.get("rows"):
-            try:
-                for row in b["rows"]:
-                    t.extend([str(x) for x in row])
-            except Exception:
-                pass
-        if b.get("language"): t.append(str(b["language"]))
-        block_texts.append(" ".join(t))
-    blocks_join = " ".join(block_texts)
+    return tuple(g for g in (goals or []) if g)
+
+
+def _iter_corpus(pairs: Iterable[Tuple[Dict, str]], id2idx: Dict[str, int], idx2id: Dict[int, str],
+                 items_meta: Dict[str, dict]) -> Iterator[str]:
+    """
+    Duyệt (lesson, text) đúng 1 lần: ghi id/meta vào các dict truyền vào, yield text từng bài
+    cho vectorizer (không dựng list texts của cả corpus).
+    """
+    for i, (doc, text) in enumerate(pairs):
+        iid = _doc_id(doc)
+        id2idx[iid] = i
+        idx2id[i] = iid
+        items_meta[iid] = _doc_meta(doc)
+        yield text
+
+
+def _keep_head(texts: Iterable[str], out: List[str], n: int) -> Iterator[str]:
+    """ Yield lại texts, giữ n text đầu vào out (probe kiểm bản lean). """
+    for text in texts:
+        if len(out) < n:
+            out.append(text)
+        yield text
+
+
+def _read_items_meta(path: str) -> Dict[str, dict]:
+    try:
+        with open(os.path.join(path, META_NAME), "r", encoding="utf-8") as f:
+            return json.load(f).get("items", {})
+    except Exception:
+        return {}
+
+
+def _doc_id(doc: Dict) -> str:
+    return str(doc.get("_id") or doc.get("id") or doc.get("slug"))
+
 
-    qp = doc.get("quiz_pool") or []
-    quiz_tags = []
-    for it in qp:
-        quiz_tags.extend(it.get("tags") or [])
-    quiz_tags_join = " ".join(quiz_tags)
+def _doc_meta(doc: Dict) -> dict:
+    return {
+        "title": doc.get("title"),
+        "topic": doc.get("topic"),
+        "tags": doc.get("tags") or [],
+        "level": int(doc.get("level", 1)),
+    }
 
-    return " ".join([
-        title, summary, topic, " ".join(tags),
-        prereqs, markdown, blocks_join, quiz_tags_join
-    ])
+
+def _unseen_terms(vectorizer, text: str) -> Tuple[int, Optional[int]]:
+    """ (số term của text, số term không có trong vocab); hashing không có vocab → None. """
+    base = vectorizer.steps[0][1] if hasattr(vectorizer, "steps") else vectorizer
+    terms = base.build_analyzer()(text)
+    vocab = getattr(base, "vocabulary_", None)
+    if vocab is None:
+        return len(terms), None
+    return len(terms), sum(1 for t in terms if t not in vocab)
+
+
+def _unseen_ratio(vectorizer, texts: Iterable[str]) -> Optional[float]:
+    """
+    Tỉ lệ term ngoài vocab trên chính corpus train (term bị max_df/min_df loại, bigram hiếm...).
+    Là mốc cho drift của fold-in: bài giống corpus cũng có tỉ lệ này, không phải term mới.
+    """
+    n_terms, n_unseen = 0, 0
+    for text in texts:
+        t, u = _unseen_terms(vectorizer, text)
+        if u is None:
+            return None
+        n_terms += t
+        n_unseen += u
+    return n_unseen / n_terms if n_terms else None
+
+
+class HashedColumns:
+    """
+    Bước pipeline giữ các cột hashing có xuất hiện trong corpus train (columns, int32 tăng dần).
+    Đặt trước TF-IDF + LSA: components_ của SVD chỉ có số cột bằng số term thật của corpus thay vì
+    HASH_FEATURES. Cột bị bỏ đều = 0 trên mọi bài nên components_ ở đó = 0 → sau Normalizer
+    vector LSA không đổi (chỉ khác hệ số chuẩn hóa trước SVD).
+    """
+    def __init__(self, columns: np.ndarray):
+        self.columns = np.asarray(columns, dtype=np.int32)
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        return sparse.csr_matrix(X)[:, self.columns]
+
+
+def _fit_vectorizer(texts: Iterable[str], use_lsa: bool, mode: str = "tfidf"):
+    """ Fit TF-IDF (hoặc hashing + TF-IDF) rồi LSA tùy chọn; trả (vectorizer, doc_matrix). """
+    # sklearn import tại chỗ: chỉ train/load model mới cần, không làm chậm lúc khởi động service
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import Normalizer
+
+    if mode == "hashing":
+        hv = HashingVectorizer(ngram_range=(1, 2), strip_accents="unicode", n_features=HASH_FEATURES,
+                               alternate_sign=False, norm=None)
+        it = iter(texts)
+        blocks = []
+        while True:
+            chunk = list(islice(it, TEXT_CHUNK))
+            if not chunk:
+                break
+            blocks.append(hv.transform(chunk))
+        X = sparse.vstack(blocks).tocsr()
+        steps = [hv]
+        if use_lsa:
+            # SVD trên cả HASH_FEATURES cột tốn RAM (components_ 2^20 x 256) → chỉ giữ cột có term
+            cols = HashedColumns(np.flatnonzero(X.getnnz(axis=0)))
+            X = cols.transform(X)
+            steps.append(cols)
+        tt = TfidfTransformer()
+        X = tt.fit_transform(X)
+        steps.append(tt)
+    else:
+        tfidf = TfidfVectorizer(ngram_range=(1, 2), min_df=1, max_df=0.9, strip_accents="unicode")
+        X = tfidf.fit_transform(texts)
+        steps = [tfidf]
+
+    if use_lsa:
+        # số component phụ thuộc số bài → chỉ biết sau khi đã stream xong corpus
+        svd = TruncatedSVD(n_components=min(256, max(2, X.shape[0]-1)))
+        norm = Normalizer(copy=False)
+        X = norm.fit_transform(svd.fit_transform(X))
+        steps += [svd, norm]
+    return (steps[0] if len(steps) == 1 else make_pipeline(*steps)), X
+
+
+def top_k_masked(scores: np.ndarray, eligible: np.ndarray, k: int) -> np.ndarray:
+    """
+    Index của k item điểm cao nhất trong số item eligible (argpartition O(n)),
+    sắp xếp điểm giảm dần, hòa điểm thì index nhỏ trước.
+    """
+    cand = np.flatnonzero(eligible)
+    if k <= 0 or cand.size == 0:
+        return cand[:0]
+    s = scores[cand]
+    if cand.size > k:
+        part = np.argpartition(-s, k - 1)[:k]
+    else:
+        part = np.arange(cand.size)
+    return cand[part[np.lexsort((cand[part], -s[part]))]]
+
+
+@dataclass(frozen=True)
+class ModelSnapshot:
+    """
+    Toàn bộ trạng thái model của 1 version. Không sửa tại chỗ: train/load dựng
+    snapshot mới rồi gán 1 lần vào engine → request đang chạy không bị đọc lẫn 2 version.
+    """
+    version: Optional[str] = None
+    vectorizer: object = None            # TF-IDF hoặc pipeline LSA
+    doc_matrix: object = None            # (n_items x d), float32, mmap khi đọc từ đĩa
+    id2idx: IdIndex = field(default_factory=lambda: build_id_maps([])[1])
+    idx2id: IdList = field(default_factory=lambda: build_id_maps([])[0])
+    items_meta: Dict[str, dict] = field(default_factory=dict)
+    store: ItemStore = field(default_factory=lambda: ItemStore([], {}))
+    manifest: Dict = field(default_factory=dict)
+    ann: Optional[AnnIndex] = None       # index ANN trên doc_matrix (LSA), None = brute force
+    inv_norms: Optional[np.ndarray] = None   # 1/norm từng dòng; None = mọi dòng đã chuẩn hóa L2
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.vectorizer is not None and self.doc_matrix is not None and len(self.idx2id) > 0
+
+    @property
+    def doc_matrix_bytes(self) -> int:
+        X = self.doc_matrix
+        if X is None:
+            return 0
+        if sparse.issparse(X):
+            return int(X.data.nbytes + X.indices.nbytes + X.indptr.nbytes)
+        return int(X.nbytes)
+
+    @property
+    def vectorizer_kind(self) -> Optional[str]:
+        if self.vectorizer is None:
+            return None
+        return "lean" if isinstance(self.vectorizer, LeanVectorizer) else "sklearn"
+
+    @property
+    def vectorizer_version(self) -> Optional[str]:
+        # fold-in giữ nguyên vectorizer → goal cache của version gốc vẫn dùng được
+        return self.manifest.get("vectorizer_version") or self.version
+
+
+def _new_version() -> str:
+    return time.strftime("v%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
 
 
 class TfidfReco:
@@ -71,26 +254,31 @@ class TfidfReco:
     Content-based recommender (TF-IDF -> LSA optional -> Cosine)
     - Train từ Mongo (lessons)
     - Personalize: lịch sử gần đây (events) + goals (learning_states)
-    - Save: model_store/model.pkl + item_meta.json
+    - Save: model_store/<version>/model.pkl + item_meta.json, model_store/CURRENT trỏ version active
     """
     def __init__(self, model_dir="model_store", mongo_uri="mongodb://localhost:27017", db_name="yourdb"):
         self.model_dir = model_dir
         self.mongo_uri = mongo_uri
         self.db_name = db_name
 
-        self.vectorizer = None           # TF-IDF hoặc pipeline LSA
-        self.doc_matrix = None           # (n_items x d)
-        self.id2idx: Dict[str, int] = {}
-        self.idx2id: Dict[int, str] = {}
-        self.items_meta: Dict[str, dict] = {}
+        self._snap = ModelSnapshot()
+        self.goal_cache = LRUCache(GOAL_CACHE_SIZE)
+        # tuần tự hóa các thao tác đổi version active (train xong / fold-in); chỉ giữ lúc swap,
+        # đọc version mới + dựng index ANN làm trước, ngoài lock
+        self._model_lock = threading.Lock()
+        # fold-in lần lượt từng bài (mỗi bài dựng trên version của bài trước)
+        self._fold_lock = threading.Lock()
 
         os.makedirs(self.model_dir, exist_ok=True)
 
     # ==== Mongo helpers ====
     def _db(self):
-        cli = MongoClient(self.mongo_uri)
-        # Nếu self.mongo_uri là full (có /db), PyMongo vẫn dùng DB mặc định theo chuỗi.
-        return cli[self.db_name]
+        # Client dùng chung theo URI (pool tạo 1 lần ở startup, xem db.py).
+        return get_db(self.mongo_uri, self.db_name)
+
+    def _adb(self):
+        # bản motor cho endpoint async
+        return get_async_db(self.mongo_uri, self.db_name)
 
     def set_mongo(self, uri: str, db: str):
         self.mongo_uri = uri
@@ -120,205 +308,468 @@ class TfidfReco:
         return st.get("goals", []) if st else []
 
     # ==== Model IO ====
-    def is_loaded(self) -> bool:
-        return self.vectorizer is not None and self.doc_matrix is not None and len(self.idx2id) > 0
+    def snapshot(self) -> ModelSnapshot:
+        """ Snapshot đang active; 1 request nên lấy 1 lần rồi dùng xuyên suốt. """
+        return self._snap
+
+    # đọc nhanh từ snapshot hiện tại (giữ tương thích code cũ)
+    vectorizer = property(lambda self: self._snap.vectorizer)
+    doc_matrix = property(lambda self: self._snap.doc_matrix)
+    id2idx = property(lambda self: self._snap.id2idx)
+    idx2id = property(lambda self: self._snap.idx2id)
+    items_meta = property(lambda self: self._snap.items_meta)
+    store = property(lambda self: self._snap.store)
+    model_version = property(lambda self: self._snap.version)
 
-    def train_and_save(self, use_lsa: bool = True) -> str:
-        lessons, _events = load_lessons_events(self.mongo_uri, self.db_name)
-        if not lessons:
-            # không có dữ liệu — vẫn ghi file rỗng cho an toàn
-            with open(os.path.join(self.model_dir, META_NAME), "w", encoding="utf-8") as f:
-                json.dump({"items": {}}, f, ensure_ascii=False)
-            dump(None, os.path.join(self.model_dir, PACK_NAME))
-            return os.path.join(self.model_dir, PACK_NAME)
-
-        texts = []
-        self.items_meta = {}
-        self.id2idx, self.idx2id = {}, {}
-
-        for i, doc in enumerate(lessons):
-            iid = str(doc.get("_id") or doc.get("id") or doc.get("slug"))
-            self.id2idx[iid] = i
-            self.idx2id[i] = iid
-            self.items_meta[iid] = {
-                "title": doc.get("title"),
-                "topic": doc.get("topic"),
-                "tags": doc.get("tags") or [],
-                "level": int(doc.get("level", 1)),
-            }
-            texts.append(_build_text(doc))
-
-        tfidf = TfidfVectorizer(ngram_range=(1, 2), min_df=1, max_df=0.9, strip_accents="unicode")
-        if use_lsa:
-            svd = TruncatedSVD(n_components=min(256, max(2, len(texts)-1)))
-            lsa = make_pipeline(tfidf, svd, Normalizer(copy=False))
-            self.doc_matrix = lsa.fit_transform(texts)
-            self.vectorizer = lsa
-        else:
-            self.doc_matrix = tfidf.fit_transform(texts)
-            self.vectorizer = tfidf
-
-        dump({
-            "vectorizer": self.vectorizer,
-            "doc_matrix": self.doc_matrix,
-            "id2idx": self.id2idx,
-            "idx2id": self.idx2id
-        }, os.path.join(self.model_dir, PACK_NAME))
+    def is_loaded(self) -> bool:
+        return self._snap.is_loaded
 
-        with open(os.path.join(self.model_dir, META_NAME), "w", encoding="utf-8") as f:
-            json.dump({"items": self.items_meta}, f, ensure_ascii=False)
+    def _read_current(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.model_dir, CURRENT_NAME), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
 
-        return os.path.join(self.model_dir, PACK_NAME)
+    def _write_current(self, version: str):
+        tmp = os.path.join(self.model_dir, CURRENT_NAME + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(tmp, os.path.join(self.model_dir, CURRENT_NAME))
 
-    def load(self):
+    def _prune_versions(self, keep: str):
+        versions = sorted(
+            d for d in os.listdir(self.model_dir)
+            if d.startswith("v") and os.path.isdir(os.path.join(self.model_dir, d))
+        )
+        old = versions[:-KEEP_VERSIONS] if KEEP_VERSIONS > 0 else versions
+        for d in old:
+            if d != keep:
+                shutil.rmtree(os.path.join(self.model_dir, d), ignore_errors=True)
+
+    def train_and_save(self, use_lsa: bool = True, vectorizer_mode: str = "tfidf",
+                       progress: Optional[Callable[[str, float], None]] = None) -> str:
+        """
+        Train vào thư mục version mới (ghi ở .tmp-<version> rồi rename).
+        Lessons được stream qua cursor, không đọc events.
+        Không đụng tới snapshot đang phục vụ — gọi activate() để chuyển sang version mới.
+        """
+        if vectorizer_mode not in VECTORIZER_MODES:
+            raise ValueError(f"vectorizer_mode must be one of {VECTORIZER_MODES}")
+        report = progress or (lambda stage, frac: None)
+        report("load_lessons", 0.05)
+        lessons = iter_lessons(self.mongo_uri, self.db_name)
+        first = next(lessons, None)
+
+        version = _new_version()
+        tmp_dir = os.path.join(self.model_dir, ".tmp-" + version)
+        os.makedirs(tmp_dir)
         try:
-            pack = load(os.path.join(self.model_dir, PACK_NAME))
-        except Exception:
-            pack = None
-        if pack:
-            self.vectorizer = pack.get("vectorizer")
-            self.doc_matrix = pack.get("doc_matrix")
-            self.id2idx = pack.get("id2idx", {})
-            self.idx2id = pack.get("idx2id", {})
+            items_meta: Dict[str, dict] = {}
+            if first is not None:
+                report("fit", 0.2)
+                id2idx: Dict[str, int] = {}
+                idx2id: Dict[int, str] = {}
+                # text trích song song theo khối, bài không đổi (_id + updatedAt) lấy từ cache
+                extractor = TextExtractor(TextCache(os.path.join(self.model_dir, TEXT_CACHE_NAME)))
+                probe: List[str] = []
+                try:
+                    texts = _iter_corpus(extractor.extract(chain([first], lessons)), id2idx, idx2id, items_meta)
+                    vectorizer, doc_matrix = _fit_vectorizer(_keep_head(texts, probe, LEAN_PROBE_DOCS),
+                                                             use_lsa, vectorizer_mode)
+                finally:
+                    extractor.close()
+                report("export", 0.8)
+                unseen_baseline = _unseen_ratio(vectorizer, probe)
+                probe += [" ".join(g) for g in islice(reachable_goal_sets(), LEAN_PROBE_DOCS)]
+                lean, lean_diff = export_lean(vectorizer, probe)
+                report("save", 0.85)
+                save_model(tmp_dir, vectorizer, doc_matrix, [idx2id[i] for i in range(len(idx2id))],
+                           extra={"vectorizer_version": version, "text_extract": extractor.stats,
+                                  "unseen_baseline": unseen_baseline,
+                                  "lean_vectorizer": {"exported": lean is not None, "max_abs_diff": lean_diff,
+                                                      "probe_texts": len(probe)}},
+                           lean=lean)
+
+                # index ANN dựng sẵn trong version → activate chỉ việc đọc file
+                load_or_build(tmp_dir, doc_matrix)
+
+            # không có dữ liệu — vẫn ghi item_meta rỗng, version này không có model (cold-start)
+            with open(os.path.join(tmp_dir, META_NAME), "w", encoding="utf-8") as f:
+                json.dump({"items": items_meta}, f, ensure_ascii=False)
+
+            os.rename(tmp_dir, os.path.join(self.model_dir, version))
+        except BaseException:
+            # train/ghi lỗi giữa chừng: không để lại thư mục model dở trong MODEL_DIR
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return os.path.join(self.model_dir, version)
+
+    def activate(self, version: str) -> Optional[str]:
+        """ Đọc version (ngoài lock), rồi trỏ CURRENT sang nó, swap, dọn version cũ. """
+        snap = self._read_version(version)
+        with self._model_lock:
+            return self._activate(version, snap)
+
+    def _activate(self, version: str, snap: ModelSnapshot) -> Optional[str]:
+        self._write_current(version)
+        loaded = self._swap(snap)
+        self._prune_versions(keep=version)
+        return loaded
+
+    def fold_in(self, lesson_id: str) -> dict:
+        """
+        Thêm/cập nhật 1 bài vào model hiện tại mà không fit lại: transform bằng vectorizer
+        đã fit, upsert dòng doc_matrix + id + meta, ghi thành version mới rồi activate.
+        Kèm drift (số bài fold-in, tỉ lệ term chưa có trong vocab) để biết khi nào cần train lại.
+        Version mới (cả index ANN) dựng ngoài _model_lock; lock chỉ giữ lúc swap.
+        """
+        with self._fold_lock:
+            while True:
+                snap = self._snap
+                if not snap.is_loaded:
+                    raise RuntimeError("no trained model to fold into")
+                doc = load_lesson(self.mongo_uri, self.db_name, lesson_id)
+                if doc is None:
+                    raise KeyError(lesson_id)
+                version, result = self._fold_in_version(snap, doc)
+                new_snap = self._read_version(version)
+                with self._model_lock:
+                    if self._snap.version == snap.version:
+                        self._activate(version, new_snap)
+                        return result
+                # train vừa activate version khác trong lúc dựng → bỏ bản này, fold-in lại trên model mới
+                shutil.rmtree(os.path.join(self.model_dir, version), ignore_errors=True)
+
+    def _fold_in_version(self, snap: ModelSnapshot, doc: Dict) -> Tuple[str, dict]:
+        """ Ghi version = snap + doc (chưa activate); trả (version, kết quả cho fold_in). """
+        iid = _doc_id(doc)
+        text = _build_text(doc)
+        row = snap.vectorizer.transform([text])
+        ids = list(snap.idx2id)
+        X = snap.doc_matrix
+        idx = snap.id2idx.get(iid)
+        if sparse.issparse(X):
+            row = sparse.csr_matrix(row, dtype=np.float32)
+            if idx is None:
+                X = sparse.vstack([X, row], format="csr")
+            else:
+                X = sparse.vstack([X[:idx], row, X[idx + 1:]], format="csr")
         else:
-            self.vectorizer = None
-            self.doc_matrix = None
-            self.id2idx, self.idx2id = {}, {}
-        try:
-            with open(os.path.join(self.model_dir, META_NAME), "r", encoding="utf-8") as f:
-                meta = json.load(f)
-            self.items_meta = meta.get("items", {})
-        except Exception:
-            self.items_meta = {}
-
-    # ==== Recommend ====
-    def _score_by_goals(self, goals: List[str]) -> np.ndarray:
-        if not self.vectorizer or self.doc_matrix is None or not goals:
-            return np.zeros((self.doc_matrix.shape[0],), dtype=float)
-        q = " ".join(goals)
-        qv = self.vectorizer.transform([q])
-        return cosine_similarity(qv, self.doc_matrix)[0]
-
-    def _user_profile_vector(self, recent_ids: List[str]) -> Optional[np.ndarray]:
-        if not self.vectorizer or self.doc_matrix is None or not recent_ids:
-            return None
-        idxs = [self.id2idx[i] for i in recent_ids if i in self.id2idx]
-        if not idxs:
-            return None
-        mat = self.doc_matrix[idxs]
-        prof = mat.mean(axis=0)
-        if hasattr(prof, "A1"):
-            prof = prof.A1
-        return np.asarray(prof).reshape(1, -1)
-
-    def _cold_start_goals(self, k: int, max_level: Optional[int], goals: List[str]):
-        cands = list(self.items_meta.keys())
-        if not cands:
-            return []
-        goals_set = set([g for g in (goals or []) if g])
-
-        def score_goal(iid):
-            meta = self.items_meta.get(iid, {})
-            tags = set(meta.get("tags") or [])
-            topic = meta.get("topic")
-            if topic: tags.add(topic)
-            return len(tags & goals_set)
-
-        # filter level
-        filtered = []
-        for iid in cands:
-            lvl = self.items_meta.get(iid, {}).get("level")
-            if max_level is not None and lvl is not None and int(lvl) > int(max_level):
-                continue
-            filtered.append(iid)
-
-        filtered.sort(
-            key=lambda x: (score_goal(x), -(self.items_meta.get(x, {}).get("level") or 0)),
-            reverse=True
+            row = np.asarray(row, dtype=np.float32)
+            X = np.vstack([X, row]) if idx is None else np.vstack([X[:idx], row, X[idx + 1:]])
+        if idx is None:
+            ids.append(iid)
+
+        items_meta = dict(snap.items_meta)
+        items_meta[iid] = _doc_meta(doc)
+
+        # drift cộng dồn từ lần train đầy đủ gần nhất
+        n_terms, n_unseen = _unseen_terms(snap.vectorizer, text)
+        prev = snap.manifest.get("fold_in") or {}
+        drift = {
+            "items": int(prev.get("items", 0)) + 1,
+            "terms": int(prev.get("terms", 0)) + n_terms,
+            "unseen_terms": None if n_unseen is None else int(prev.get("unseen_terms") or 0) + n_unseen,
+        }
+        drift["unseen_ratio"] = (drift["unseen_terms"] / drift["terms"]
+                                 if drift["unseen_terms"] is not None and drift["terms"] else None)
+        # so với tỉ lệ ngoài vocab của chính corpus train (model cũ không có mốc → 0)
+        baseline = snap.manifest.get("unseen_baseline") or 0.0
+        drift["unseen_baseline"] = baseline
+        drift["unseen_excess"] = (None if drift["unseen_ratio"] is None
+                                  else max(0.0, drift["unseen_ratio"] - baseline))
+        drift["folded_ratio"] = drift["items"] / len(ids)
+        drift["refit_recommended"] = bool(
+            drift["folded_ratio"] > REFIT_MAX_FOLDED_RATIO
+            or (drift["unseen_excess"] or 0.0) > REFIT_MAX_UNSEEN_RATIO
         )
-        out = []
-        for iid in filtered[:k]:
-            meta = self.items_meta.get(iid, {})
-            out.append({
-                "id": iid,
-                "score": 0.4,
-                "title": meta.get("title"),
-                "topic": meta.get("topic"),
-                "level": meta.get("level"),
-            })
-        return out
 
-    def recommend(self, user_id: str, k: int = 5, max_level: Optional[int] = None, goals: List[str] = []):
-        # goals ưu tiên param; nếu rỗng thì đọc từ DB
-        if not goals:
-            goals = self.load_user_goals(user_id)
-
-        # lấy known_topics để lọc ra khỏi gợi ý
-        st = self._db().learning_states.find_one({"userId": user_id}, {"known_topics": 1})
-        known = set(st.get("known_topics", [])) if st else set()
-
-        if not self.is_loaded():
-            recs = self._cold_start_goals(k, max_level, goals)
-            # lọc known trong cold-start
-            clean = []
-            for r in recs:
-                meta = self.items_meta.get(r["id"], {})
-                tags = set(meta.get("tags") or []) | {meta.get("topic")}
-                if not (tags & known):
-                    clean.append(r)
-            return clean
-
-        recent = load_user_recent(self.mongo_uri, self.db_name, user_id, limit=20)
-        seen = set(recent)
-        prof = self._user_profile_vector(recent)
-        goal_scores = self._score_by_goals(goals)
-
-        if prof is not None:
-            sims = cosine_similarity(prof, self.doc_matrix)[0]
-            sims = 0.8 * sims + 0.2 * goal_scores
+        version = _new_version()
+        base_dir = os.path.join(self.model_dir, snap.version)
+        tmp_dir = os.path.join(self.model_dir, ".tmp-" + version)
+        os.makedirs(tmp_dir)
+        try:
+            save_model(tmp_dir, snap.vectorizer, X, ids,
+                       extra={"vectorizer_version": snap.vectorizer_version,
+                              "unseen_baseline": snap.manifest.get("unseen_baseline"),
+                              "base_version": snap.version, "fold_in": drift},
+                       vectorizer_from=base_dir if os.path.exists(os.path.join(base_dir, VECTORIZER_NAME)) else None)
+            with open(os.path.join(tmp_dir, META_NAME), "w", encoding="utf-8") as f:
+                json.dump({"items": items_meta}, f, ensure_ascii=False)
+            # index ANN của version mới dựng ở đây (ngoài _model_lock), activate chỉ đọc file
+            load_or_build(tmp_dir, X)
+            os.rename(tmp_dir, os.path.join(self.model_dir, version))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return version, {"id": iid, "action": "insert" if idx is None else "update",
+                         "version": version, "drift": drift}
+
+    def drift(self) -> dict:
+        return self._snap.manifest.get("fold_in") or {"items": 0}
+
+    def _read_snapshot(self, path: str, version: str) -> ModelSnapshot:
+        items_meta = _read_items_meta(path)
+
+        vectorizer, doc_matrix, manifest = None, None, {}
+        if has_model(path):
+            vectorizer, doc_matrix, idx2id, id2idx, manifest = load_model(path)
         else:
-            sims = goal_scores
+            # định dạng cũ: model.pkl chứa cả doc_matrix + dict id
+            try:
+                from joblib import load
+                pack = load(os.path.join(path, PACK_NAME))
+            except Exception:
+                pack = None
+            pack = pack or {}
+            old = pack.get("idx2id", {})
+            vectorizer, doc_matrix = pack.get("vectorizer"), pack.get("doc_matrix")
+            idx2id, id2idx = build_id_maps([old[i] for i in range(len(old))])
+
+        # thứ tự dòng store = idx của doc_matrix; chưa có model thì theo items_meta
+        ids = idx2id if len(idx2id) else list(items_meta.keys())
+        return ModelSnapshot(
+            version=version,
+            vectorizer=vectorizer,
+            doc_matrix=doc_matrix,
+            id2idx=id2idx,
+            idx2id=idx2id,
+            items_meta=items_meta,
+            store=ItemStore(ids, items_meta),
+            manifest=manifest,
+            ann=load_or_build(path, doc_matrix),
+            inv_norms=inverse_norms(load_norms(path, doc_matrix)) if doc_matrix is not None else None,
+        )
 
-        order = np.argsort(-sims)
-        recs = []
-        for idx in order:
-            iid = self.idx2id.get(int(idx))
-            if not iid or iid in seen:
-                continue
-            meta = self.items_meta.get(iid, {})
-            lvl = meta.get("level")
-            if max_level is not None and lvl is not None and int(lvl) > int(max_level):
-                continue
-            recs.append({
-                "id": iid,
-                "score": float(sims[idx]),
-                "title": meta.get("title"),
-                "topic": meta.get("topic"),
-                "level": meta.get("level"),
-            })
-            if len(recs) >= k * 2:  # build over then filter known
-                break
+    def load_meta(self) -> int:
+        """
+        Chỉ đọc item_meta.json của version CURRENT (không sklearn, không doc_matrix):
+        snapshot tạm chưa có model → recommend trả cold-start trong lúc load đầy đủ chạy nền.
+        """
+        version = self._read_current()
+        items_meta = _read_items_meta(os.path.join(self.model_dir, version) if version else self.model_dir)
+        with self._model_lock:
+            if not self._snap.is_loaded and not self._snap.items_meta:
+                self._snap = ModelSnapshot(items_meta=items_meta, store=ItemStore(list(items_meta), items_meta))
+        return len(items_meta)
+
+    def load_current(self) -> Optional[str]:
+        """ load() version CURRENT, tuần tự với train/fold-in (không đè version mới hơn vừa activate). """
+        with self._model_lock:
+            if self._snap.is_loaded:
+                return self._snap.version
+            return self.load()
+
+    def load(self, version: Optional[str] = None) -> Optional[str]:
+        """
+        Đọc version (mặc định theo CURRENT; chưa có CURRENT thì đọc file phẳng kiểu cũ
+        trong model_store), swap snapshot 1 lần rồi nạp goal cache ở thread nền.
+        """
+        return self._swap(self._read_version(version))
+
+    def _read_version(self, version: Optional[str] = None) -> ModelSnapshot:
+        version = version or self._read_current()
+        if version:
+            return self._read_snapshot(os.path.join(self.model_dir, version), version)
+        try:
+            mtime = os.stat(os.path.join(self.model_dir, PACK_NAME)).st_mtime_ns
+        except OSError:
+            mtime = 0
+        return self._read_snapshot(self.model_dir, "legacy-%d" % mtime)
+
+    def _swap(self, snap: ModelSnapshot) -> Optional[str]:
+        # cùng vectorizer với snapshot đang chạy (fold-in) → cache đã nóng sẵn
+        warm = snap.is_loaded and snap.vectorizer_version != self._snap.vectorizer_version
+        self._snap = snap
+        if warm and GOAL_WARM_MAX > 0:
+            # không chặn load / swap: request trước khi warm xong tự embed goals của mình (cache miss)
+            threading.Thread(target=self.warm_goal_cache, args=(snap, reachable_goal_sets()),
+                             name="goal-warm", daemon=True).start()
+        return snap.version
 
-        # lọc bỏ bài user đã biết (known_topics)
-        clean = []
-        for r in recs:
-            meta = self.items_meta.get(r["id"], {})
-            tags = set(meta.get("tags") or []) | {meta.get("topic")}
-            if not (tags & known):
-                clean.append(r)
-            if len(clean) >= k:
+    # ==== Recommend ====
+    def _embed_goal_keys(self, snap: ModelSnapshot, keys: List[Tuple[str, ...]]) -> list:
+        X = snap.vectorizer.transform([" ".join(k) for k in keys])
+        if sparse.issparse(X):
+            X = X.tocsr()
+            return [X[i] for i in range(X.shape[0])]
+        return list(np.asarray(X, dtype=np.float32))
+
+    def warm_goal_cache(self, snap: ModelSnapshot, goal_sets: Iterable[List[str]]) -> int:
+        """
+        Nạp sẵn vector cho các list goals (tối đa GOAL_WARM_MAX / GOAL_CACHE_SIZE), transform theo khối;
+        dừng khi vectorizer của snap không còn active (đã load model khác; fold-in giữ vectorizer nên không dừng).
+        """
+        keys, n = [], 0
+        limit = min(GOAL_WARM_MAX, self.goal_cache.maxsize)
+        for g in goal_sets:
+            if n >= limit:
                 break
+            keys.append(goal_key(g))
+            n += 1
+            if len(keys) == GOAL_WARM_CHUNK:
+                if self._snap.vectorizer_version != snap.vectorizer_version:
+                    return n - len(keys)
+                for k, v in zip(keys, self._embed_goal_keys(snap, keys)):
+                    self.goal_cache.put((snap.vectorizer_version, k), v)
+                keys = []
+        if keys and self._snap.vectorizer_version == snap.vectorizer_version:
+            for k, v in zip(keys, self._embed_goal_keys(snap, keys)):
+                self.goal_cache.put((snap.vectorizer_version, k), v)
+        return n
+
+    def _goal_vectors(self, snap: ModelSnapshot, goal_lists: List[List[str]]):
+        """
+        Vector query cho từng list goals (list rỗng → dòng 0). Lấy từ goal_cache
+        theo (vectorizer_version, goal_key); chỉ các tập chưa có mới qua vectorizer (1 lần cho cả batch).
+        """
+        keys = [goal_key(g) for g in goal_lists]
+        rows = [self.goal_cache.get((snap.vectorizer_version, k)) for k in keys]
+        missing = sorted({k for k, r in zip(keys, rows) if r is None})
+        if missing:
+            fresh = dict(zip(missing, self._embed_goal_keys(snap, missing)))
+            for k, v in fresh.items():
+                self.goal_cache.put((snap.vectorizer_version, k), v)
+            rows = [fresh[k] if r is None else r for k, r in zip(keys, rows)]
+        if sparse.issparse(rows[0]):
+            return sparse.vstack(rows).tocsr()
+        return np.vstack(rows)
+
+    def _profile_matrix(self, snap: ModelSnapshot, recent_lists: List[List[str]]):
+        """
+        Profile = trung bình vector các bài gần đây, dựng cho cả batch bằng
+        1 ma trận trung bình thưa A (n_users x n_items): P = A @ doc_matrix.
+        """
+        rows, cols, vals = [], [], []
+        has_prof = np.zeros(len(recent_lists), dtype=bool)
+        for u, recent in enumerate(recent_lists):
+            idxs = [snap.id2idx[i] for i in recent if i in snap.id2idx]
+            if not idxs:
+                continue
+            has_prof[u] = True
+            rows.extend([u] * len(idxs))
+            cols.extend(idxs)
+            vals.extend([1.0 / len(idxs)] * len(idxs))
+        A = sparse.csr_matrix((vals, (rows, cols)), shape=(len(recent_lists), snap.doc_matrix.shape[0]),
+                              dtype=np.float32)
+        return A @ snap.doc_matrix, has_prof
+
+    def _item_out(self, snap: ModelSnapshot, idx: int, score: float) -> dict:
+        iid = snap.store.ids[idx]
+        meta = snap.items_meta.get(iid, {})
+        return {
+            "id": iid,
+            "score": score,
+            "title": meta.get("title"),
+            "topic": meta.get("topic"),
+            "level": meta.get("level"),
+        }
+
+    def _cold_start_goals(self, snap: ModelSnapshot, k: int, max_level: Optional[int], goals: List[str],
+                          exclude: Optional[np.ndarray] = None):
+        # điểm = số tag/topic trùng goals (giảm dần), hòa thì level thấp trước, rồi theo thứ tự gốc;
+        # thứ tự theo level dựng sẵn trong ItemStore → không sort cả catalog mỗi lần
+        order = snap.store.cold_start([g for g in (goals or []) if g], max_level, k, exclude=exclude)
+        return [self._item_out(snap, int(i), 0.4) for i in order]
+
+    def load_context(self, user_id: str) -> UserContext:
+        with stage("context_fetch"):
+            return load_user_context(self._db(), user_id)
+
+    def recommend(self, user_id: str, k: int = 5, max_level: Optional[int] = None, goals: List[str] = [],
+                  ctx: Optional[UserContext] = None):
+        # ctx do endpoint truyền vào (đã đọc sẵn) → không query Mongo lần nữa
+        if ctx is None:
+            ctx = self.load_context(user_id)
+        return self.recommend_many([ctx], [k], [max_level], [goals])[0]
+
+    def recommend_many(self, ctxs: List[UserContext], ks: List[int],
+                       max_levels: List[Optional[int]], goal_lists: List[List[str]]) -> List[List[dict]]:
+        """
+        Gợi ý cho nhiều user: profile + goals xếp thành ma trận, chấm điểm với
+        doc_matrix bằng 1 phép nhân ma trận mỗi khối BATCH_CHUNK user.
+        """
+        snap = self._snap
+        store = snap.store
+
+        # goals ưu tiên param; nếu rỗng thì lấy từ learning_states
+        goal_lists = [list(g or c.goals) for g, c in zip(goal_lists, ctxs)]
+
+        if not snap.is_loaded:
+            with stage("cold_start"):
+                return [
+                    self._cold_start_goals(snap, k, lv, g, exclude=store.mask_any(c.known_topics))
+                    for c, k, lv, g in zip(ctxs, ks, max_levels, goal_lists)
+                ]
+
+        out: List[List[dict]] = []
+        for lo in range(0, len(ctxs), BATCH_CHUNK):
+            hi = lo + BATCH_CHUNK
+            chunk = ctxs[lo:hi]
+            with stage("profile"):
+                prof, has_prof = self._profile_matrix(snap, [c.recent_ids for c in chunk])
+            with stage("goal_vectorize"):
+                goals = self._goal_vectors(snap, goal_lists[lo:hi])
+            # doc đã chuẩn hóa → 0.8*cos(profile) + 0.2*cos(goals) = doc · query gộp (scoring.blend)
+            Q = blend(prof, goals, has_prof)
+            if snap.ann is not None:
+                out.extend(self._recommend_ann(snap, chunk, ks[lo:hi], max_levels[lo:hi], Q))
+                continue
+            with stage("similarity"):
+                sims = similarity(snap.doc_matrix, Q, snap.inv_norms)
+
+            t_filter = t_rank = 0.0
+            for u, ctx in enumerate(chunk):
+                t0 = time.perf_counter()
+                # 1 mask duy nhất: chưa xem, đúng level, không thuộc known_topics
+                eligible = self._eligible(snap, ctx, max_levels[lo + u])
+                t1 = time.perf_counter()
+                row = sims[u]
+                out.append([self._item_out(snap, int(i), float(row[i]))
+                            for i in top_k_masked(row, eligible, ks[lo + u])])
+                t_filter += t1 - t0
+                t_rank += time.perf_counter() - t1
+            STAGE_SECONDS.observe(t_filter, "known_filter")
+            STAGE_SECONDS.observe(t_rank, "ranking")
+        return out
 
-        # nếu chưa đủ k, bổ sung cold-start (cũng lọc known)
-        if len(clean) < k:
-            needed = k - len(clean)
-            cold = self._cold_start_goals(needed, max_level, goals)
-            for r in cold:
-                meta = self.items_meta.get(r["id"], {})
-                tags = set(meta.get("tags") or []) | {meta.get("topic")}
-                if not (tags & known):
-                    clean.append(r)
-                    if len(clean) >= k:
-                        break
-
-        return clean
+    def _eligible(self, snap: ModelSnapshot, ctx: UserContext, max_level: Optional[int]) -> np.ndarray:
+        store = snap.store
+        eligible = store.level_mask(max_level) & ~store.mask_any(ctx.known_topics)
+        seen_idx = [snap.id2idx[i] for i in set(ctx.recent_ids) if i in snap.id2idx]
+        if seen_idx:
+            eligible[seen_idx] = False
+        return eligible
+
+    def _recommend_ann(self, snap: ModelSnapshot, ctxs: List[UserContext], ks: List[int],
+                       max_levels: List[Optional[int]], Q: np.ndarray) -> List[List[dict]]:
+        """
+        Q = query gộp (scoring.blend), 1 dòng inner product mỗi user → ANN lấy ứng viên,
+        lọc eligible rồi tính lại điểm chính xác. Không đủ k ứng viên hợp lệ → brute force user đó.
+        """
+        X = snap.doc_matrix
+        with stage("similarity"):
+            cands = snap.ann.search(Q, max(ANN_CANDIDATES, 4 * max(ks)))
+
+        out: List[List[dict]] = []
+        t_filter = t_rank = 0.0
+        for u, ctx in enumerate(ctxs):
+            t0 = time.perf_counter()
+            eligible = self._eligible(snap, ctx, max_levels[u])
+            t1 = time.perf_counter()
+            cand = cands[u][cands[u] >= 0]
+            cand = cand[eligible[cand]]
+            # query 0 (không profile, không goals): mọi điểm bằng nhau → để brute force giữ thứ tự idx
+            if Q[u].any() and (len(cand) >= ks[u] or len(cand) == int(eligible.sum())):
+                idx, scores = exact_top_k(X, Q[u], cand, ks[u])
+            else:
+                row = X @ Q[u]
+                idx = top_k_masked(row, eligible, ks[u])
+                scores = row[idx]
+            out.append([self._item_out(snap, int(i), float(sc)) for i, sc in zip(idx, scores)])
+            t_filter += t1 - t0
+            t_rank += time.perf_counter() - t1
+        STAGE_SECONDS.observe(t_filter, "known_filter")
+        STAGE_SECONDS.observe(t_rank, "ranking")
+        return out
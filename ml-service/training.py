@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Tuple
+
+# Train chạy nền trên 1 worker riêng: request /train trả về job_id ngay,
+# engine chỉ swap snapshot khi model mới đã ghi xong (xem TfidfReco.activate).
+
+JOB_HISTORY = 20
+
+
+@dataclass
+class TrainJob:
+    job_id: str
+    params: dict = field(default_factory=dict)
+    state: str = "queued"            # queued → running → done | failed
+    stage: str = "queued"
+    progress: float = 0.0
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    version: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in ("queued", "running")
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d["duration"] = self.duration
+        return d
+
+
+class TrainManager:
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="train")
+        self._jobs: "OrderedDict[str, TrainJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, engine, use_lsa: bool = True, vectorizer_mode: str = "tfidf") -> Tuple[TrainJob, bool]:
+        """ Tạo job mới; nếu đang có job chạy thì trả job đó (created=False). """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.active:
+                    return job, False
+            job = TrainJob(job_id=uuid.uuid4().hex[:12], params={"use_lsa": use_lsa, "vectorizer_mode": vectorizer_mode})
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > JOB_HISTORY:
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, engine, job)
+        return job, True
+
+    def get(self, job_id: Optional[str] = None) -> Optional[TrainJob]:
+        with self._lock:
+            if job_id:
+                return self._jobs.get(job_id)
+            return next(reversed(self._jobs.values()), None)
+
+    def _run(self, engine, job: TrainJob):
+        job.state = "running"
+        job.started_at = time.time()
+
+        def progress(stage: str, frac: float):
+            job.stage = stage
+            job.progress = frac
+
+        try:
+            path = engine.train_and_save(progress=progress, **job.params)
+            progress("swap", 0.95)
+            job.version = engine.activate(os.path.basename(path))
+            progress("done", 1.0)
+            job.state = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.state = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 import json
+import sys
 from pathlib import Path
 from typing import Dict, List
-import numpy as np
 import pandas as pd
 from scipy import sparse
 
@@ -13,6 +13,14 @@ DATA   = ROOT.parent / "data" / "processed"
 STORE  = RECO / "model_store"                     # dùng chung store với model A
 STORE.mkdir(parents=True, exist_ok=True)
 
+# feature dựng chung với item (recommender/features.py)
+if str(RECO) not in sys.path:
+    sys.path.insert(0, str(RECO))
+try:
+    from ml.recommender.features import build_features
+except ImportError:
+    from features import build_features
+
 def _load_items() -> pd.DataFrame:
     rows = [json.loads(l) for l in (DATA / "items.jsonl").read_text(encoding="utf-8").splitlines() if l.strip()]
     df = pd.DataFrame(rows)
@@ -48,25 +56,7 @@ def _load_vocab() -> Dict[str, List[str]]:
     return {"tags": v["tags"], "skills": v["skills"], "dim": len(v["tags"]) + len(v["skills"]) + 1}
 
 def _build_features(df: pd.DataFrame, vocab: Dict[str, List[str]]) -> sparse.csr_matrix:
-    dim = vocab["dim"]
-    tag2i = {t:i for i,t in enumerate(vocab["tags"])}
-    skill2i = {s:i for i,s in enumerate(vocab["skills"])}
-    off = len(vocab["tags"])
-
-    rows, cols, data = [], [], []
-    for r, row in enumerate(df.itertuples(index=False)):
-        for t in getattr(row, "tags"):
-            i = tag2i.get(t)
-            if i is not None: rows.append(r); cols.append(i); data.append(1.0)
-        for s in getattr(row, "skills"):
-            j = skill2i.get(s)
-            if j is not None: rows.append(r); cols.append(off + j); data.append(1.0)
-        rows.append(r); cols.append(dim-1); data.append(float(getattr(row, "difficulty", 3))/5.0)
-
-    X = sparse.csr_matrix((np.array(data, dtype=np.float32), (np.array(rows), np.array(cols))),
-                          shape=(len(df), dim))
-    n = np.sqrt(X.multiply(X).sum(1)).A.ravel() + 1e-8
-    return X.multiply(1.0/n[:,None]).tocsr()
+    return build_features(df, vocab)
 
 def main():
     items   = _load_items()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Feature tags/skills/difficulty dùng chung cho item (vectorize.py) và quiz (quiz_selector/vectorize_quizz.py).
+
+Cột: [tags vocab | skills vocab | difficulty/5], mỗi dòng chuẩn hóa L2.
+Dựng không lặp theo dòng: trải list tags/skills thành 1 mảng, đổi sang mã categorical
+bằng pd.Index.get_indexer, ghép thẳng CSR (indices int32, data float32).
+"""
+from __future__ import annotations
+from itertools import chain
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def _explode_codes(col: Sequence, categories: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """ (row, code) cho mọi phần tử trong list từng dòng có trong categories (bỏ phần tử lạ). """
+    lengths = np.fromiter(map(len, col), dtype=np.int64, count=len(col))
+    rows = np.repeat(np.arange(len(col), dtype=np.int32), lengths)
+    if not len(rows):
+        return rows, np.zeros(0, dtype=np.int32)
+    codes = pd.Index(categories).get_indexer(list(chain.from_iterable(col)))
+    keep = codes >= 0
+    return rows[keep], codes[keep].astype(np.int32)
+
+
+def l2_normalize_rows(X: sparse.csr_matrix, eps: float = 1e-8) -> sparse.csr_matrix:
+    """ Chia từng dòng cho (norm L2 + eps), tại chỗ trên X.data. """
+    counts = np.diff(X.indptr)
+    row_of = np.repeat(np.arange(X.shape[0]), counts)
+    sq = np.bincount(row_of, weights=X.data.astype(np.float64) ** 2, minlength=X.shape[0])
+    X.data /= (np.sqrt(sq) + eps)[row_of].astype(X.data.dtype)
+    return X
+
+
+def build_features(df: pd.DataFrame, vocab: Dict[str, List[str]]) -> sparse.csr_matrix:
+    """ CSR (len(df) x vocab["dim"]) float32; tag/skill lặp trong 1 dòng được cộng dồn như trước. """
+    n = len(df)
+    dim = vocab["dim"]
+    off = len(vocab["tags"])
+
+    rt, ct = _explode_codes(df["tags"].tolist(), vocab["tags"])
+    rs, cs = _explode_codes(df["skills"].tolist(), vocab["skills"])
+    diff = pd.to_numeric(df["difficulty"], errors="coerce").fillna(3).to_numpy(dtype=np.float32) / 5.0 \
+        if "difficulty" in df.columns else np.full(n, 3 / 5.0, dtype=np.float32)
+
+    # mỗi dòng: [tags..., skills..., difficulty] → vị trí trong CSR tính thẳng từ số phần tử từng dòng
+    nt = np.bincount(rt, minlength=n)
+    ns = np.bincount(rs, minlength=n)
+    indptr = np.zeros(n + 1, dtype=np.int32)
+    np.cumsum(nt + ns + 1, out=indptr[1:])
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    data = np.ones(indptr[-1], dtype=np.float32)
+
+    def _within_row(r, counts):
+        return np.arange(len(r)) - (np.cumsum(counts) - counts)[r]
+
+    pos = indptr[rt] + _within_row(rt, nt)
+    indices[pos] = ct
+    pos = indptr[rs] + nt[rs] + _within_row(rs, ns)
+    indices[pos] = cs + off
+    indices[indptr[1:] - 1] = dim - 1
+    data[indptr[1:] - 1] = diff
+
+    X = sparse.csr_matrix((data, indices, indptr), shape=(n, dim))
+    X.sum_duplicates()
+    return l2_normalize_rows(X)
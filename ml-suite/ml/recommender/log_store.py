@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+Log tương tác dạng segment append-only, lưu theo cột (thay cho logs.csv ghi lại toàn bộ mỗi lần).
+
+ml/data/processed/logs/seg-<first>-<last>/
+- user.npy, item.npy, event.npy : mã int32 (dictionary encoding, mỗi segment 1 từ điển riêng)
+- ts.npy                        : thời điểm event, int64 epoch ms
+- dict.json                     : {"user_id": [...], "theory_id": [...], "event": [...]}
+- meta.json                     : rows, ts_min, ts_max, first/last seq, replaces_through
+Ghi: dựng ở .tmp-* rồi rename sang seq kế tiếp (rename lỗi nếu seq đã có → thử seq sau),
+nên nhiều request ghi cùng lúc không đè nhau.
+Compaction gộp các segment nhỏ liền nhau thành seg-<first>-<last>; reader bỏ qua segment
+đã nằm trong 1 khoảng compacted (nếu compaction dừng giữa chừng trước khi xóa bản cũ).
+replace: segment mới mang replaces_through = seq cũ lớn nhất → reader bỏ mọi segment cũ hơn.
+Replace nhiều batch (NDJSON stream): ghi vào .staging-*, chỉ publish khi cả luồng thành công.
+
+    python recommender/log_store.py import-csv    # chuyển logs.csv sang segment
+    python recommender/log_store.py compact
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+ROOT = Path(__file__).resolve().parent
+DATA = ROOT.parent / "data" / "processed"
+LOG_DIR = DATA / "logs"
+
+ID_COLUMNS = ("user_id", "theory_id", "event")
+FILES = {"user_id": "user.npy", "theory_id": "item.npy", "event": "event.npy"}
+
+# compaction: gộp segment nhỏ hơn COMPACT_TARGET_ROWS, cần ít nhất COMPACT_MIN_SEGMENTS segment liền nhau
+COMPACT_TARGET_ROWS = int(os.environ.get("LOG_COMPACT_TARGET_ROWS", "1000000"))
+COMPACT_MIN_SEGMENTS = int(os.environ.get("LOG_COMPACT_MIN_SEGMENTS", "4"))
+COMPACT_LOCK_TTL = 3600      # lock compaction cũ hơn ngần này giây coi như bị bỏ lại (process chết)
+
+_EPOCH = pd.Timestamp(0, tz="UTC")
+
+
+def to_epoch_ms(values, default_ms: int) -> np.ndarray:
+    """ ts/timestamp/createdAt dạng ISO, datetime hoặc epoch (giây/ms) → int64 epoch ms; thiếu → default_ms. """
+    s = pd.Series(values)
+    out = np.full(len(s), default_ms, dtype=np.int64)
+    num = pd.to_numeric(s, errors="coerce")
+    is_num = num.notna().to_numpy()
+    if is_num.any():
+        v = num.to_numpy(dtype=np.float64)[is_num]
+        out[is_num] = np.where(v < 1e11, v * 1000, v).astype(np.int64)      # < 1e11 → giây
+    rest = ~is_num & s.notna().to_numpy()
+    if rest.any():
+        dt = pd.to_datetime(s[rest], errors="coerce", utc=True)
+        ok = dt.notna().to_numpy()
+        idx = np.flatnonzero(rest)[ok]
+        out[idx] = ((dt[ok] - _EPOCH) // pd.Timedelta(milliseconds=1)).to_numpy(dtype=np.int64)
+    return out
+
+
+def normalize_logs(df: pd.DataFrame, default_ms: Optional[int] = None) -> pd.DataFrame:
+    """ DataFrame log bất kỳ → cột user_id, theory_id, event (str, đã strip, bỏ dòng thiếu id) + ts (ms). """
+    default_ms = int(time.time() * 1000) if default_ms is None else default_ms
+    out = pd.DataFrame(index=df.index)
+    for c in ID_COLUMNS:
+        out[c] = df[c].fillna("").astype(str).str.strip() if c in df.columns else ""
+    ts_col = next((c for c in ("ts", "timestamp", "createdAt", "created_at") if c in df.columns), None)
+    out["ts"] = to_epoch_ms(df[ts_col], default_ms) if ts_col else default_ms
+    out = out[(out["user_id"] != "") & (out["theory_id"] != "")]
+    return out.reset_index(drop=True)
+
+
+@dataclass
+class Segment:
+    path: Path
+    first: int
+    last: int
+    meta: dict
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    @property
+    def rows(self) -> int:
+        return int(self.meta["rows"])
+
+    def overlaps(self, since_ms: Optional[int], until_ms: Optional[int]) -> bool:
+        if not self.rows:
+            return False
+        if since_ms is not None and self.meta["ts_max"] < since_ms:
+            return False
+        return not (until_ms is not None and self.meta["ts_min"] >= until_ms)
+
+    def read(self, since_ms: Optional[int] = None, until_ms: Optional[int] = None) -> pd.DataFrame:
+        """ Cột mở bằng mmap, id trả về dạng Categorical (mã + từ điển của segment, không dựng chuỗi từng dòng). """
+        dicts = json.loads((self.path / "dict.json").read_text(encoding="utf-8"))
+        ts = np.load(self.path / "ts.npy", mmap_mode="r")
+        mask = None
+        if since_ms is not None and self.meta["ts_min"] < since_ms:
+            mask = ts >= since_ms
+        if until_ms is not None and self.meta["ts_max"] >= until_ms:
+            mask = (ts < until_ms) if mask is None else (mask & (ts < until_ms))
+        cols = {}
+        for c, fname in FILES.items():
+            codes = np.load(self.path / fname, mmap_mode="r")
+            codes = np.asarray(codes if mask is None else codes[mask])
+            cols[c] = pd.Categorical.from_codes(codes, categories=dicts[c])
+        cols["ts"] = np.asarray(ts if mask is None else ts[mask])
+        return pd.DataFrame(cols)
+
+
+class LogStore:
+    def __init__(self, root: Path = LOG_DIR):
+        self.root = Path(root)
+
+    # ==== đọc ====
+    def _all_segments(self) -> List[Segment]:
+        if not self.root.exists():
+            return []
+        out = []
+        for p in self.root.iterdir():
+            if not p.name.startswith("seg-") or not (p / "meta.json").exists():
+                continue
+            try:
+                first, last = (int(x) for x in p.name[4:].split("-"))
+                out.append(Segment(p, first, last, json.loads((p / "meta.json").read_text(encoding="utf-8"))))
+            except (ValueError, OSError):
+                continue
+        return sorted(out, key=lambda s: (s.first, -s.last))
+
+    def segments(self) -> List[Segment]:
+        """ Segment đang hiệu lực theo thứ tự seq (bỏ bản đã được compaction/replace phủ). """
+        segs = self._all_segments()
+        base = max((s.meta.get("replaces_through") or -1 for s in segs), default=-1)
+        out: List[Segment] = []
+        covered = -1
+        for s in segs:
+            if s.last <= base or s.last <= covered:
+                continue
+            out.append(s)
+            covered = s.last
+        return out
+
+    def max_seq(self) -> int:
+        return max((s.last for s in self._all_segments()), default=0)
+
+    def rows(self) -> int:
+        return sum(s.rows for s in self.segments())
+
+    def __bool__(self) -> bool:
+        return bool(self.segments())
+
+    def iter_frames(self, since=None, until=None, chunksize: int = 1000000,
+                    segments: Optional[Sequence[Segment]] = None) -> Iterator[pd.DataFrame]:
+        """ Log trong [since, until) theo từng segment (cắt khối chunksize dòng); chỉ mở segment có giao khoảng. """
+        since_ms = _ms(since)
+        until_ms = _ms(until)
+        for seg in (self.segments() if segments is None else segments):
+            if not seg.overlaps(since_ms, until_ms):
+                continue
+            df = seg.read(since_ms, until_ms)
+            for lo in range(0, len(df), chunksize):
+                yield df.iloc[lo:lo + chunksize]
+
+    # ==== ghi ====
+    def _write(self, df: pd.DataFrame, first: Optional[int] = None, replaces_through: Optional[int] = None,
+               seq_from: Optional[int] = None) -> Segment:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / (".tmp-" + uuid.uuid4().hex)
+        tmp.mkdir()
+        try:
+            dicts = {}
+            for c, fname in FILES.items():
+                cat = df[c] if isinstance(df[c].dtype, pd.CategoricalDtype) else df[c].astype("category")
+                cat = cat.cat.remove_unused_categories()
+                np.save(tmp / fname, cat.cat.codes.to_numpy().astype(np.int32))
+                dicts[c] = [str(x) for x in cat.cat.categories]
+            ts = df["ts"].to_numpy(dtype=np.int64)
+            np.save(tmp / "ts.npy", ts)
+            (tmp / "dict.json").write_text(json.dumps(dicts, ensure_ascii=False), encoding="utf-8")
+            meta = {"rows": int(len(df)), "ts_min": int(ts.min()) if len(ts) else None,
+                    "ts_max": int(ts.max()) if len(ts) else None, "replaces_through": replaces_through,
+                    "created_at": int(time.time() * 1000)}
+            return self._commit(tmp, meta, first=first, seq_from=seq_from)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def _commit(self, src: Path, meta: dict, first: Optional[int] = None, seq_from: Optional[int] = None,
+                replaces_previous: bool = False) -> Segment:
+        """ Rename thư mục đã ghi đủ cột thành seg-<first>-<seq>; replaces_previous: phủ mọi seq trước nó. """
+        # seq: rename thất bại nếu thư mục đích đã có (request khác vừa ghi) → thử seq tiếp theo
+        seq = seq_from if seq_from is not None else self.max_seq() + 1
+        while True:
+            lo = seq if first is None else first
+            meta.update(first=lo, last=seq)
+            if replaces_previous:
+                meta["replaces_through"] = lo - 1
+            (src / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+            target = self.root / ("seg-%010d-%010d" % (lo, seq))
+            try:
+                os.rename(src, target)
+                return Segment(target, lo, seq, meta)
+            except OSError:
+                if first is not None:
+                    raise
+                seq = max(seq + 1, self.max_seq() + 1)
+
+    def append(self, df: pd.DataFrame) -> Optional[Segment]:
+        """ Ghi 1 segment mới từ df (đã normalize_logs); None nếu không có dòng hợp lệ. """
+        if not len(df):
+            return None
+        return self._write(df)
+
+    def replace(self, df: pd.DataFrame) -> Segment:
+        """ Segment mới thay toàn bộ log cũ (reader bỏ segment cũ ngay khi rename xong), rồi xóa bản cũ. """
+        old = self._all_segments()
+        seg = self._write(df, replaces_through=max((s.last for s in old), default=0))
+        for s in old:
+            shutil.rmtree(s.path, ignore_errors=True)
+        return seg
+
+    def staging(self) -> "LogStore":
+        """ Store tạm trong .staging-* (reader/compaction bỏ qua) để dựng log thay thế qua nhiều batch. """
+        self.root.mkdir(parents=True, exist_ok=True)
+        return LogStore(self.root / (".staging-" + uuid.uuid4().hex))
+
+    def publish(self, staged: "LogStore") -> List[Segment]:
+        """
+        Đưa các segment của staged vào store, thay toàn bộ log cũ (như replace) rồi xóa staging.
+        Segment đầu mang replaces_through = seq ngay trước nó nên log cũ chỉ biến mất khi bản mới đã vào.
+        """
+        try:
+            segs = staged.segments()
+            if not segs:
+                return [self.replace(normalize_logs(pd.DataFrame()))]
+            out = [self._commit(segs[0].path, dict(segs[0].meta), replaces_previous=True)]
+            out += [self._commit(s.path, dict(s.meta)) for s in segs[1:]]
+            for s in self._all_segments():
+                if s.last < out[0].first:
+                    shutil.rmtree(s.path, ignore_errors=True)
+            return out
+        finally:
+            staged.discard()
+
+    def discard(self) -> None:
+        """ Xóa cả thư mục store (dùng cho staging bị hủy). """
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def import_csv(self, path: Path) -> Optional[Segment]:
+        """ logs.csv kiểu cũ → 1 segment (ts = thời điểm import nếu csv không có cột thời gian). """
+        df = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[])
+        return self.append(normalize_logs(df))
+
+    def migrate_csv(self, path: Path, wait: float = 600.0) -> Optional[Segment]:
+        """
+        logs.csv kiểu cũ → segment đúng 1 lần rồi đổi tên thành logs.csv.imported.
+        Kiểm tra + import + đổi tên dưới lock: nhiều request/process cùng gọi không import trùng.
+        """
+        path = Path(path)
+        if not path.exists():
+            return None
+        with self.locked(wait=wait) as ok:
+            if not ok:
+                raise TimeoutError("log store is locked")
+            if not path.exists() or self:       # process khác vừa chuyển xong
+                return None
+            seg = self.import_csv(path)
+            path.rename(path.with_suffix(".csv.imported"))
+            return seg
+
+    # ==== compaction ====
+    @contextmanager
+    def locked(self, wait: float = 0.0):
+        """ Lock file O_EXCL cho compaction (vectorize cũng giữ khi đọc segment); yield False nếu quá wait giây. """
+        self.root.mkdir(parents=True, exist_ok=True)
+        lock = self.root / ".compact.lock"
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                if time.time() - lock.stat().st_mtime > COMPACT_LOCK_TTL:
+                    lock.unlink()
+            except OSError:
+                pass
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                if time.monotonic() >= deadline:
+                    yield False
+                    return
+                time.sleep(0.2)
+        try:
+            yield True
+        finally:
+            lock.unlink(missing_ok=True)
+
+    def compact(self, boundary: Optional[int] = None, target_rows: int = COMPACT_TARGET_ROWS,
+                min_segments: int = COMPACT_MIN_SEGMENTS) -> List[Segment]:
+        """
+        Gộp các segment nhỏ liền nhau (sắp theo ts). Không gộp vắt qua seq boundary
+        (watermark của vectorize tăng dần) để phần log đã xử lý và chưa xử lý không lẫn vào nhau.
+        """
+        min_segments = max(2, min_segments)
+        with self.locked() as ok:
+            if not ok:
+                return []
+            self._drop_stale_staging()
+            groups: List[List[Segment]] = []
+            cur: List[Segment] = []
+            rows = 0
+            for s in self.segments():
+                crosses = boundary is not None and cur and (cur[-1].last <= boundary < s.first)
+                if s.rows >= target_rows or crosses or rows + s.rows > target_rows:
+                    if len(cur) >= min_segments:
+                        groups.append(cur)
+                    cur, rows = [], 0
+                if s.rows < target_rows:
+                    cur.append(s)
+                    rows += s.rows
+            if len(cur) >= min_segments:
+                groups.append(cur)
+
+            done = []
+            for g in groups:
+                parts = [s.read() for s in g]
+                merged = pd.DataFrame({c: union_categoricals([p[c] for p in parts]) for c in FILES})
+                merged["ts"] = np.concatenate([p["ts"].to_numpy() for p in parts])
+                merged = merged.iloc[np.argsort(merged["ts"].to_numpy(), kind="stable")].reset_index(drop=True)
+                rt = [s.meta["replaces_through"] for s in g if s.meta.get("replaces_through") is not None]
+                seg = self._write(merged, first=g[0].first, seq_from=g[-1].last, replaces_through=max(rt, default=None))
+                for s in g:
+                    shutil.rmtree(s.path, ignore_errors=True)
+                done.append(seg)
+            return done
+
+
+    def _drop_stale_staging(self) -> None:
+        # staging của request chết giữa chừng (process bị kill) không bao giờ được publish/discard
+        for p in self.root.glob(".staging-*"):
+            try:
+                if time.time() - p.stat().st_mtime > COMPACT_LOCK_TTL:
+                    shutil.rmtree(p, ignore_errors=True)
+            except OSError:
+                continue
+
+
+def _ms(value) -> Optional[int]:
+    """ since/until: None, epoch ms hoặc chuỗi/datetime (không có múi giờ → UTC). """
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts
+    return int((ts - _EPOCH) // pd.Timedelta(milliseconds=1))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Log store dạng segment (recommender/log_store.py)")
+    ap.add_argument("command", choices=["import-csv", "compact", "info"])
+    ap.add_argument("--root", default=str(LOG_DIR))
+    ap.add_argument("--csv", default=str(DATA / "logs.csv"))
+    args = ap.parse_args(argv)
+    store = LogStore(Path(args.root))
+    if args.command == "import-csv":
+        seg = store.import_csv(Path(args.csv))
+        print(f"[log_store] imported {seg.rows if seg else 0} rows → {seg.name if seg else '-'}")
+    elif args.command == "compact":
+        for seg in store.compact():
+            print(f"[log_store] compacted → {seg.name} ({seg.rows} rows)")
+    segs = store.segments()
+    print(f"[log_store] segments={len(segs)} rows={sum(s.rows for s in segs)}")
+
+
+if __name__ == "__main__":
+    main()
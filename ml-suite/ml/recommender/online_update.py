@@ -4,15 +4,44 @@ import json
 import numpy as np
 from pathlib import Path
 
+try:
+    from ml.recommender.ann import ANN_CANDIDATES, exact_top_k, load_or_build
+except ImportError:  # chạy trực tiếp trong thư mục recommender/
+    from ann import ANN_CANDIDATES, exact_top_k, load_or_build
+
 ROOT  = Path(__file__).resolve().parent
 STORE = ROOT / "model_store"
 
+
+def orient_factors(U: np.ndarray, V: np.ndarray, n_users: int, n_items: int):
+    """
+    (U: users x factors, V: items x factors). implicit đổi quy ước fit (item-user ↔ user-item) giữa
+    các version nên user_factors/item_factors có thể bị đảo → đổi lại theo số user/item trong mappings.
+    """
+    if U.shape[0] == n_items and V.shape[0] == n_users:
+        return V, U
+    return U, V
+
+
+def load_ann(V: np.ndarray):
+    """
+    Index ANN cho item factors: đọc model_store/ann-<kind>.index (train_als.py dựng sẵn),
+    chưa có thì dựng 1 lần rồi ghi lại. Index cũ hơn als_model.npz (train lần trước) bị bỏ.
+    """
+    model_mtime = (STORE / "als_model.npz").stat().st_mtime_ns
+    for p in STORE.glob("ann-*.index"):
+        if p.stat().st_mtime_ns < model_mtime:
+            p.unlink(missing_ok=True)
+    return load_or_build(str(STORE), V)
+
+
 class Recommender:
     def __init__(self):
         self.U = self.V = None
         self.item2idx = {}; self.idx2item = {}
         self.user2idx = {}; self.idx2user = {}
         self.popularity = {}
+        self.ann = None
 
     def load(self):
         # mappings
@@ -32,13 +61,12 @@ class Recommender:
         self.U = z["U"]  # expected: users x factors
         self.V = z["V"]  # expected: items x factors
 
-        # 🔧 Auto-fix nếu bị đảo (như log U=(5,64), V=(1,64))
-        n_users = len(self.user2idx)
-        n_items = len(self.item2idx)
-        if self.U.shape[0] == n_items and self.V.shape[0] == n_users:
-            self.U, self.V = self.V, self.U  # swap back
+        # 🔧 Auto-fix nếu bị đảo (như log U=(5,64), V=(1,64)); model cũ train trước khi train_als tự sửa
+        self.U, self.V = orient_factors(self.U, self.V, len(self.user2idx), len(self.item2idx))
 
-        print(f"[load] U={self.U.shape}, V={self.V.shape}")
+        # ANN trên item factors (None nếu tắt / catalog nhỏ → brute force)
+        self.ann = load_ann(self.V)
+        print(f"[load] U={self.U.shape}, V={self.V.shape}, ann={self.ann.kind if self.ann else None}")
         return self
 
     
@@ -54,8 +82,16 @@ class Recommender:
             return picks, {i: ["cold-start"] for i in picks}
 
         # score = U[u] · V^T  -> (items,)
-        scores = (self.V @ self.U[uidx].astype(np.float32)).ravel()
-        order  = np.argsort(-scores)
+        u = self.U[uidx].astype(np.float32)
+        if self.ann is not None:
+            # ANN lấy ứng viên rồi re-rank chính xác; thiếu thì phần bù bên dưới lấy từ brute force
+            cand = self.ann.search(u[None, :], max(ANN_CANDIDATES, 4 * k))[0]
+            order, _ = exact_top_k(self.V, u, cand[cand >= 0], len(cand))
+            if len(order) < min(k, item_count):
+                order = np.argsort(-(self.V @ u).ravel())
+        else:
+            scores = (self.V @ u).ravel()
+            order  = np.argsort(-scores)
 
         # (tuỳ chọn) lọc theo candidate_filter ở đây nếu muốn – hiện bỏ qua để chắc chắn ra đủ k
         picks = [self.idx2item[int(i)] for i in order[:min(k, item_count)]]
@@ -15,6 +15,11 @@ try:
 except Exception as e:
     raise RuntimeError("Thiếu thư viện 'implicit'. Cài: pip install implicit") from e
 
+try:
+    from ml.recommender.online_update import load_ann, orient_factors
+except ImportError:  # chạy trực tiếp trong thư mục recommender/
+    from online_update import load_ann, orient_factors
+
 ROOT  = Path(__file__).resolve().parent
 STORE = ROOT / "model_store"
 
@@ -47,9 +52,9 @@ def main():
     )
     model.fit(R.T)  # implicit yêu cầu item-user
 
-    # 3️⃣ Lưu lại model thật
-    U = model.user_factors.astype(np.float32)
-    V = model.item_factors.astype(np.float32)
+    # 3️⃣ Lưu lại model thật (U: users x factors, V: items x factors, sửa chiều nếu implicit trả đảo)
+    U, V = orient_factors(model.user_factors.astype(np.float32), model.item_factors.astype(np.float32),
+                          R.shape[0], R.shape[1])
     np.savez_compressed(
         STORE / "als_model.npz",
         U=U,
@@ -57,7 +62,10 @@ def main():
         meta=np.array([args.factors, args.iterations, args.reg], dtype=float)
     )
 
-    print("[ALS] trained & saved.")
+    # dựng + ghi sẵn index ANN trên item factors (nếu ANN_INDEX bật) để service chỉ việc đọc file
+    ann = load_ann(V)
+
+    print(f"[ALS] trained & saved. ann={ann.kind if ann else None}")
     print({
         "factors": args.factors,
         "iterations": args.iterations,
@@ -4,7 +4,7 @@ Vector hóa item & interactions (Model A).
 
 Input:
 - ml/data/processed/items.jsonl
-- ml/data/processed/logs.csv
+- ml/data/processed/logs/       (log store dạng segment, xem log_store.py; chưa có thì đọc logs.csv)
 
 Artifacts:
 - ml/recommender/model_store/vocab.json
@@ -13,22 +13,52 @@ Artifacts:
 - ml/recommender/model_store/interactions.npz
 - ml/recommender/model_store/popularity.json
 - ml/recommender/model_store/vectorize_meta.json
+- ml/recommender/model_store/item_counts.npy      (số event mỗi item, cho popularity tăng dần)
+- ml/recommender/model_store/vectorize_state.json (watermark log cho lần chạy tăng dần)
+
+Mặc định chạy tăng dần: chỉ đọc segment mới (seq > watermark) hoặc phần logs.csv ghi thêm
+sau watermark, user/item mới được nối vào cuối mapping cũ, ma trận delta cộng vào interactions.npz.
+--full: build lại toàn bộ (compaction, user sort lại theo id, tính lại cả event của item mới thêm sau này).
 """
 from __future__ import annotations
+import argparse
+import io
 import json
+import os
+import zlib
 from pathlib import Path
 from collections import Counter
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import numpy as np
 import pandas as pd
 from scipy import sparse
 
+try:
+    from ml.recommender.features import build_features
+    from ml.recommender.log_store import LogStore, Segment
+except ImportError:  # chạy trực tiếp trong thư mục recommender/
+    from features import build_features
+    from log_store import LogStore, Segment
+
 # --- PATH ---
 ROOT = Path(__file__).resolve().parent
 DATA = ROOT.parent / "data" / "processed"
 STORE = ROOT / "model_store"
 STORE.mkdir(parents=True, exist_ok=True)
 
+# logs.csv đọc theo khối LOG_CHUNK_ROWS dòng; RAM ~ số cặp (user, item) khác nhau, không ~ số event
+LOG_CHUNK_ROWS = int(os.environ.get("LOG_CHUNK_ROWS", "1000000"))
+LOG_COLUMNS = ("user_id", "theory_id", "event")
+LOG_DIR = DATA / "logs"
+# chờ compaction đang chạy (giây) trước khi đọc segment
+LOG_LOCK_WAIT = float(os.environ.get("LOG_LOCK_WAIT", "600"))
+
+STATE_NAME = "vectorize_state.json"
+COUNTS_NAME = "item_counts.npy"
+STATE_VERSION = 1
+# số byte ngay trước watermark dùng để nhận ra logs.csv bị ghi lại (replace) → build lại toàn bộ
+WATERMARK_PROBE = 4096
+
 # ---------------- IO ----------------
 def load_items(path: Path = DATA / "items.jsonl") -> pd.DataFrame:
     rows = []
@@ -61,18 +91,93 @@ def load_items(path: Path = DATA / "items.jsonl") -> pd.DataFrame:
     return df
 
 
-def load_logs(path: Path = DATA / "logs.csv") -> pd.DataFrame:
-    df = pd.read_csv(
+def _clean_logs(df: pd.DataFrame) -> pd.DataFrame:
+    for c in LOG_COLUMNS:
+        df[c] = df[c].astype(str).str.strip()
+    return df[(df["user_id"] != "") & (df["theory_id"] != "")]
+
+
+def _read_logs(path: Path, **kw):
+    return pd.read_csv(
         path,
-        dtype={"user_id": str, "theory_id": str, "event": str},
+        dtype={c: str for c in LOG_COLUMNS},
+        usecols=lambda c: c in LOG_COLUMNS,
         keep_default_na=False,
         na_values=[],
-        low_memory=False,
+        **kw,
     )
-    for c in ("user_id", "theory_id", "event"):
-        df[c] = df[c].astype(str).str.strip()
-    df = df[(df["user_id"] != "") & (df["theory_id"] != "")]
-    return df
+
+
+def load_logs(path: Path = DATA / "logs.csv", since=None, until=None) -> pd.DataFrame:
+    """
+    Toàn bộ log trong [since, until) (epoch ms, chuỗi ngày hoặc datetime) từ log store;
+    chưa có segment nào thì đọc logs.csv (không có thời gian → since/until bỏ qua).
+    Đọc từng khối mà không gom lại: dùng iter_logs.
+    """
+    store = LogStore(LOG_DIR)
+    if path == DATA / "logs.csv" and store:
+        frames = list(store.iter_frames(since, until))
+        if not frames:
+            return pd.DataFrame({c: pd.Series(dtype=str) for c in LOG_COLUMNS})
+        return pd.concat([f[list(LOG_COLUMNS)].astype(str) for f in frames], ignore_index=True)
+    return _clean_logs(_read_logs(path, low_memory=False))
+
+
+class _ByteRange(io.RawIOBase):
+    """ Đọc file từ vị trí hiện tại tới byte end (không đọc phần ghi thêm sau lúc bắt đầu). """
+    def __init__(self, f, end: int):
+        self._f = f
+        self._end = end
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), self._end - self._f.tell())
+        if n <= 0:
+            return 0
+        data = self._f.read(n)
+        b[:len(data)] = data
+        return len(data)
+
+
+def _header(path: Path) -> str:
+    with open(path, "rb") as f:
+        return f.readline().decode("utf-8").strip()
+
+
+def iter_logs(since=None, until=None, chunksize: int = LOG_CHUNK_ROWS,
+              segments: Optional[List[Segment]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Như load_logs nhưng trả từng khối (≤ chunksize dòng): segment chỉ được mở (mmap) khi khoảng
+    ts_min..ts_max của nó giao [since, until); id là Categorical theo từ điển segment.
+    """
+    store = LogStore(LOG_DIR)
+    if segments is None and not store:
+        yield from iter_csv_logs(chunksize=chunksize)
+        return
+    yield from store.iter_frames(since, until, chunksize, segments=segments)
+
+
+def iter_csv_logs(path: Path = DATA / "logs.csv", chunksize: int = LOG_CHUNK_ROWS,
+                  start: int = 0, end: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    logs.csv kiểu cũ theo khối chunksize dòng.
+    start/end: khoảng byte [start, end) của file (start ở đầu 1 dòng, 0 = từ header).
+    """
+    end = os.path.getsize(path) if end is None else end
+    with open(path, "rb") as f:
+        kw = {}
+        if start > 0:
+            # đọc giữa file: lấy tên cột từ header
+            kw = {"header": None, "names": list(pd.read_csv(io.StringIO(_header(path)), nrows=0).columns)}
+            f.seek(start)
+        if f.tell() >= end:
+            return
+        text = io.TextIOWrapper(io.BufferedReader(_ByteRange(f, end)), encoding="utf-8", newline="")
+        with _read_logs(text, chunksize=chunksize, **kw) as reader:
+            for chunk in reader:
+                yield _clean_logs(chunk)
 
 
 # ---------------- Build ----------------
@@ -93,65 +198,118 @@ def build_mappings(items: pd.DataFrame, logs: pd.DataFrame):
 
 
 def build_item_features(items: pd.DataFrame, vocab: Dict[str, List[str]]) -> sparse.csr_matrix:
-    dim = vocab["dim"]
-    tag2i = {t: i for i, t in enumerate(vocab["tags"])}
-    skill2i = {s: i for i, s in enumerate(vocab["skills"])}
-    off = len(vocab["tags"])
-
-    rows, cols, data = [], [], []
-    for r, row in enumerate(items.itertuples(index=False)):
-        for t in getattr(row, "tags"):
-            i = tag2i.get(t)
-            if i is not None:
-                rows.append(r)
-                cols.append(i)
-                data.append(1.0)
-        for s in getattr(row, "skills"):
-            j = skill2i.get(s)
-            if j is not None:
-                rows.append(r)
-                cols.append(off + j)
-                data.append(1.0)
-        rows.append(r)
-        cols.append(dim - 1)
-        data.append(float(getattr(row, "difficulty", 3)) / 5.0)
-
-    X = sparse.csr_matrix(
-        (np.array(data, dtype=np.float32), (np.array(rows), np.array(cols))),
-        shape=(len(items), dim),
-    )
-    n = np.sqrt(X.multiply(X).sum(1)).A.ravel() + 1e-8
-    X = X.multiply(1.0 / n[:, None]).tocsr()
-    return X
-
-
-def build_interactions(logs: pd.DataFrame, item2idx: dict[str, int], user2idx: dict[str, int]):
-    rows, cols, data = [], [], []
+    return build_features(items, vocab)
+
+
+def _merge_pairs(keys: List[np.ndarray], vals: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    k = np.concatenate(keys)
+    uk, inv = np.unique(k, return_inverse=True)
+    return uk, np.bincount(inv, weights=np.concatenate(vals)).astype(np.float32)
+
+
+def build_interactions_chunked(chunks: Iterable[pd.DataFrame], item2idx: Dict[str, int],
+                               user2idx: Optional[Dict[str, int]] = None, grow_users: bool = False):
+    """
+    Ma trận user x item (số lượt) từ các khối log, không giữ log thô:
+    - item/user → index bằng pd.Index.get_indexer / pd.factorize trên từng khối
+    - mỗi khối gộp thành các cặp (user, item) khác nhau (key = u * n_items + i) kèm số lượt,
+      các khối được cộng dồn (sum duplicates) khi phần chờ gộp lớn bằng phần đã gộp
+    user2idx = None → user lấy từ log (sort theo id như build_mappings); có user2idx → user lạ bị bỏ, đếm missing;
+    grow_users → user lạ được nối vào sau user2idx (chạy tăng dần).
+    Trả (coo, user_ids theo index, số lượt mỗi item, stats: rows / valid / missing_* / pairs).
+    """
+    item_keys = pd.Index(list(item2idx.keys()))
+    item_pos = np.fromiter(item2idx.values(), dtype=np.int64, count=len(item2idx))
+    n_items = max(len(item2idx), 1)
+    seen_users: Dict[str, int] = dict(user2idx or {})     # user cũ + user mới theo thứ tự gặp
+    item_counts = np.zeros(n_items, dtype=np.int64)
     missing_items, missing_users = set(), set()
+    stats = {"rows": 0, "valid": 0, "missing_item_rows": 0, "missing_user_rows": 0}
 
-    for u, i in zip(logs["user_id"], logs["theory_id"]):
-        iu = user2idx.get(u)
-        ii = item2idx.get(i)
-        if iu is None:
-            missing_users.add(u)
+    merged_k, merged_v = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    pend_k: List[np.ndarray] = []
+    pend_v: List[np.ndarray] = []
+    pending = 0
+
+    for chunk in chunks:
+        stats["rows"] += len(chunk)
+        if not len(chunk):
             continue
-        if ii is None:
-            missing_items.add(i)
+        tid = chunk["theory_id"]
+        if isinstance(tid.dtype, pd.CategoricalDtype):
+            # khối từ log store: tra từ điển 1 lần rồi lấy theo mã, không tra chuỗi từng dòng
+            tcodes = tid.cat.codes.to_numpy()
+            ii = item_keys.get_indexer(tid.cat.categories)[tcodes]
+        else:
+            ii = item_keys.get_indexer(tid.to_numpy())
+        miss = ii < 0
+        if miss.any():
+            stats["missing_item_rows"] += int(miss.sum())
+            missing_items.update(pd.unique(tid.to_numpy()[miss]))
+        ii = item_pos[ii[~miss]]
+        uid = chunk["user_id"]
+        if isinstance(uid.dtype, pd.CategoricalDtype):
+            # chỉ giữ user có dòng hợp lệ (như factorize), thứ tự theo từ điển
+            ucodes = uid.cat.codes.to_numpy()[~miss]
+            used = np.bincount(ucodes, minlength=len(uid.cat.categories)) > 0
+            remap = np.cumsum(used) - 1
+            codes, uniq = remap[ucodes], uid.cat.categories.to_numpy()[used]
+        else:
+            codes, uniq = pd.factorize(uid.to_numpy()[~miss])
+        if user2idx is None or grow_users:
+            umap = np.fromiter((seen_users.setdefault(u, len(seen_users)) for u in uniq),
+                               dtype=np.int64, count=len(uniq))
+        else:
+            umap = np.fromiter((user2idx.get(u, -1) for u in uniq), dtype=np.int64, count=len(uniq))
+            missing_users.update(u for u, m in zip(uniq, umap) if m < 0)
+        uu = umap[codes] if len(codes) else np.zeros(0, dtype=np.int64)
+        ok = uu >= 0
+        stats["missing_user_rows"] += int((~ok).sum())
+        uu, ii = uu[ok], ii[ok]
+        stats["valid"] += len(uu)
+        if not len(uu):
             continue
-        rows.append(iu)
-        cols.append(ii)
-        data.append(1.0)
 
-    n_users = max(len(user2idx), 1)
-    n_items = max(len(item2idx), 1)
+        item_counts += np.bincount(ii, minlength=n_items)
+        k, c = np.unique(uu * n_items + ii, return_counts=True)
+        pend_k.append(k)
+        pend_v.append(c.astype(np.float32))
+        pending += len(k)
+        if pending >= max(len(merged_k), LOG_CHUNK_ROWS):
+            merged_k, merged_v = _merge_pairs([merged_k] + pend_k, [merged_v] + pend_v)
+            pend_k, pend_v, pending = [], [], 0
+
+    if pend_k:
+        merged_k, merged_v = _merge_pairs([merged_k] + pend_k, [merged_v] + pend_v)
+
+    if user2idx is None:
+        user_ids = sorted(seen_users)
+        rank = np.empty(len(seen_users), dtype=np.int64)
+        rank[[seen_users[u] for u in user_ids]] = np.arange(len(user_ids))
+        rows = rank[merged_k // n_items]
+    else:
+        user_ids = [u for u, _ in sorted(seen_users.items(), key=lambda kv: kv[1])]
+        rows = merged_k // n_items
+    n_users = max(len(user_ids), 1)
+
+    stats.update(missing_items=len(missing_items), missing_users=len(missing_users), pairs=int(len(merged_k)))
+    coo = sparse.coo_matrix((merged_v, (rows, merged_k % n_items)), shape=(n_users, n_items), dtype=np.float32)
+    coo.sum_duplicates()
+    return coo, user_ids, item_counts, stats
 
-    if not rows:
-        print(f"⚠️ Không có tương tác hợp lệ. missing_users={len(missing_users)} missing_items={len(missing_items)}")
-        return sparse.coo_matrix((n_users, n_items), dtype=np.float32)
 
-    coo = sparse.coo_matrix((data, (rows, cols)), shape=(n_users, n_items), dtype=np.float32)
-    coo.sum_duplicates()
-    return coo.tocoo()
+def build_interactions(logs: pd.DataFrame, item2idx: dict[str, int], user2idx: dict[str, int]):
+    R, _, _, stats = build_interactions_chunked([logs], item2idx, user2idx)
+    if not stats["valid"]:
+        print(f"⚠️ Không có tương tác hợp lệ. missing_users={stats['missing_users']} missing_items={stats['missing_items']}")
+    return R
+
+
+def popularity_from_counts(item_counts: np.ndarray, idx2item: Dict[str, str]) -> Dict[str, float]:
+    mx = int(item_counts.max()) if len(item_counts) else 0
+    if mx == 0:
+        return {}
+    return {idx2item[str(i)]: float(item_counts[i]) / mx for i in np.flatnonzero(item_counts)}
 
 
 def compute_popularity(logs: pd.DataFrame) -> Dict[str, float]:
@@ -164,29 +322,155 @@ def compute_popularity(logs: pd.DataFrame) -> Dict[str, float]:
     return {k: v / mx for k, v in ctr.items()}
 
 
-def main():
+def _tail_crc(path: Path, offset: int) -> int:
+    with open(path, "rb") as f:
+        f.seek(max(0, offset - WATERMARK_PROBE))
+        return zlib.crc32(f.read(min(offset, WATERMARK_PROBE)))
+
+
+def _watermark(path: Path, offset: int) -> dict:
+    return {"kind": "csv", "offset": offset, "header": _header(path), "tail_crc": _tail_crc(path, offset)}
+
+
+def _segment_watermark(segs: List[Segment]) -> dict:
+    # rows: tổng dòng đã xử lý, để nhận ra log store bị replace/xóa (compaction giữ nguyên số dòng)
+    return {"kind": "segments", "seq": max((s.last for s in segs), default=0), "rows": sum(s.rows for s in segs)}
+
+
+def _check_segments(wm: dict, segs: List[Segment]):
+    """ (segment mới sau watermark, None) hoặc (None, lý do build lại toàn bộ). """
+    if wm.get("kind") != "segments":
+        return None, "nguồn log đã chuyển từ logs.csv sang log store"
+    seq = int(wm["seq"])
+    done = [s for s in segs if s.last <= seq]
+    new = [s for s in segs if s.first > seq]
+    if len(done) + len(new) != len(segs):
+        return None, "có segment compacted vắt qua watermark"
+    if sum(s.rows for s in done) != wm["rows"] or any(s.meta.get("replaces_through") is not None for s in new):
+        return None, "log store đã bị replace"
+    return new, None
+
+
+def _check_csv(wm: dict, logs_path: Path):
+    """ (offset watermark, None) hoặc (None, lý do build lại toàn bộ). """
+    if wm.get("kind", "csv") != "csv":
+        return None, "nguồn log đã chuyển từ log store sang logs.csv"
+    offset = int(wm["offset"])
+    if (os.path.getsize(logs_path) < offset or _header(logs_path) != wm["header"]
+            or _tail_crc(logs_path, offset) != wm["tail_crc"]):
+        return None, "logs.csv đã bị ghi lại"
+    return offset, None
+
+
+def _load_previous(items: pd.DataFrame, logs_path: Path, segs: Optional[List[Segment]] = None):
+    """
+    (trạng thái lần chạy trước, None) nếu chạy tăng dần được, ngược lại (None, lý do build lại toàn bộ).
+    Trạng thái: item2idx, user2idx, R (coo), item_counts và phần log chưa xử lý:
+    segments (log store, segs != None) hoặc offset (watermark logs.csv).
+    """
+    try:
+        state = json.loads((STORE / STATE_NAME).read_text(encoding="utf-8"))
+        m = json.loads((STORE / "mappings.json").read_text(encoding="utf-8"))
+        R = sparse.load_npz(STORE / "interactions.npz").tocoo()
+        counts = np.load(STORE / COUNTS_NAME)
+    except (OSError, ValueError):
+        return None, "chưa có trạng thái lần chạy trước"
+    if state.get("version") != STATE_VERSION:
+        return None, "trạng thái khác version"
+
+    if segs is not None:
+        pending, reason = _check_segments(state["logs"], segs)
+    else:
+        pending, reason = _check_csv(state["logs"], logs_path)
+    if reason:
+        return None, reason
+
+    item2idx = {k: int(v) for k, v in m["item2idx"].items()}
+    ids = items["_id"].astype(str)
+    if not ids.is_unique:
+        return None, "items.jsonl có _id trùng"
+    if not set(item2idx) <= set(ids):
+        return None, "có item trong mapping cũ không còn trong items.jsonl"
+    if len(counts) != max(len(item2idx), 1) or R.shape[1] != max(len(item2idx), 1):
+        return None, "interactions.npz / item_counts.npy không khớp mapping"
+    return {"item2idx": item2idx, "user2idx": {k: int(v) for k, v in m["user2idx"].items()},
+            "R": R, "counts": counts,
+            "segments" if segs is not None else "offset": pending}, None
+
+
+def _pad(R: sparse.coo_matrix, shape) -> sparse.coo_matrix:
+    return sparse.coo_matrix((R.data, (R.row, R.col)), shape=shape, dtype=np.float32)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Vector hóa item & interactions (Model A)")
+    ap.add_argument("--full", action="store_true", help="build lại toàn bộ (compaction), bỏ qua watermark")
+    args = ap.parse_args(argv)
+
+    # giữ lock compaction tới khi ghi xong watermark: segment không bị gộp/xóa giữa lúc đọc
+    store = LogStore(LOG_DIR)
+    with store.locked(wait=LOG_LOCK_WAIT) as locked:
+        if not locked:
+            print("⚠️ [vectorize] compaction đang chạy quá lâu, vẫn tiếp tục đọc log")
+        _vectorize(args, store)
+
+
+def _vectorize(args, store: LogStore):
     items = load_items()
-    logs = load_logs()
-
-    valid_ids = set(items["_id"].astype(str))
-    logs = logs[logs["theory_id"].isin(valid_ids)]
+    logs_path = DATA / "logs.csv"
+    # chỉ đọc tới đây (danh sách segment / kích thước logs.csv); phần ghi thêm trong lúc chạy để lần sau
+    segs = store.segments() or None
+    end = None if segs else os.path.getsize(logs_path)
+
+    prev, reason = (None, "--full") if args.full else _load_previous(items, logs_path, segs)
+    if prev is None:
+        print(f"[vectorize] full rebuild: {reason}")
+        item2idx, idx2item, _, _ = build_mappings(items, pd.DataFrame(columns=["user_id"]))
+        # log đọc theo khối; event của item không có trong items.jsonl bị bỏ (đếm trong stats)
+        chunks = iter_logs(segments=segs) if segs else iter_csv_logs(logs_path, end=end)
+        R_ui, user_ids, item_counts, log_stats = build_interactions_chunked(chunks, item2idx)
+    else:
+        # item cũ giữ index, item mới nối vào cuối; items sắp lại theo đúng thứ tự đó
+        item2idx = dict(prev["item2idx"])
+        for it in items["_id"].astype(str):
+            item2idx.setdefault(it, len(item2idx))
+        idx2item = {str(i): it for it, i in item2idx.items()}
+        order = pd.Index(items["_id"].astype(str)).get_indexer([idx2item[str(i)] for i in range(len(item2idx))])
+        items = items.iloc[order].reset_index(drop=True)
+
+        if segs:
+            chunks, since = iter_logs(segments=prev["segments"]), f"{len(prev['segments'])} new segments"
+        else:
+            chunks, since = iter_csv_logs(logs_path, start=prev["offset"], end=end), f"byte {prev['offset']}"
+        R_delta, user_ids, delta_counts, log_stats = build_interactions_chunked(
+            chunks, item2idx, prev["user2idx"], grow_users=True)
+        R_ui = _pad(prev["R"], R_delta.shape) + R_delta
+        R_ui = R_ui.tocoo()
+        item_counts = delta_counts
+        item_counts[:len(prev["counts"])] += prev["counts"][:len(item_counts)]
+        print(f"[vectorize] incremental from {since}: +{len(item2idx) - len(prev['item2idx'])} items, "
+              f"+{len(user_ids) - len(prev['user2idx'])} users")
+    log_stats["mode"] = "full" if prev is None else "incremental"
 
     vocab = build_vocab(items)
-    item2idx, idx2item, user2idx, idx2user = build_mappings(items, logs)
     X_items = build_item_features(items, vocab)
-
-    R_ui = build_interactions(logs, item2idx, user2idx)
-    if R_ui is None or R_ui.shape[0] == 0 or R_ui.shape[1] == 0:
+    user2idx = {u: i for i, u in enumerate(user_ids)}
+    idx2user = {str(i): u for u, i in user2idx.items()}
+    print(f"[vectorize] logs rows={log_stats['rows']} valid={log_stats['valid']} pairs={log_stats['pairs']} "
+          f"missing_items={log_stats['missing_items']} ({log_stats['missing_item_rows']} rows)")
+    if not R_ui.nnz:
         print("⚠️ Không có tương tác hợp lệ giữa user và item! Tạo ma trận rỗng.")
-        R_ui = sparse.coo_matrix((len(user2idx), len(item2idx)), dtype=np.float32)
 
-    popularity = compute_popularity(logs)
+    popularity = popularity_from_counts(item_counts, idx2item)
 
+    # xóa watermark trước khi ghi: chạy hỏng giữa chừng thì lần sau build lại toàn bộ (không cộng delta 2 lần)
+    (STORE / STATE_NAME).unlink(missing_ok=True)
     for p in ("item_features.npz", "interactions.npz"):
         (STORE / p).unlink(missing_ok=True)
 
     sparse.save_npz(STORE / "item_features.npz", X_items)
     sparse.save_npz(STORE / "interactions.npz", R_ui.tocoo())
+    np.save(STORE / COUNTS_NAME, item_counts)
 
     (STORE / "vocab.json").write_text(
         json.dumps({"tags": vocab["tags"], "skills": vocab["skills"]}, ensure_ascii=False, indent=2),
@@ -205,13 +489,21 @@ def main():
 
     (STORE / "vectorize_meta.json").write_text(
         json.dumps(
-            {"items": int(X_items.shape[0]), "dim": int(X_items.shape[1]), "users": int(R_ui.shape[0])},
+            {"items": int(X_items.shape[0]), "dim": int(X_items.shape[1]), "users": int(R_ui.shape[0]),
+             "logs": log_stats},
             ensure_ascii=False,
             indent=2,
         ),
         encoding="utf-8",
     )
 
+    # watermark ghi sau cùng, khi mọi artifact đã khớp với nó
+    (STORE / STATE_NAME).write_text(
+        json.dumps({"version": STATE_VERSION,
+                    "logs": _segment_watermark(segs) if segs else _watermark(logs_path, end)}, ensure_ascii=False),
+        encoding="utf-8",
+    )
+
     print(f"[vectorize] items={X_items.shape}, interactions={R_ui.shape}, dim={X_items.shape[1]}")
 
 
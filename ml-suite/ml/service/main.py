@@ -3,12 +3,16 @@
 
 from __future__ import annotations
 
-from fastapi import FastAPI, Body, Query
+from fastapi import FastAPI, Body, Query, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional, Dict, Any
 from pathlib import Path
-import os, sys, json, subprocess
+import os, sys, json, subprocess, threading, time, uuid
 
 from ml.recommender.online_update import Recommender
+from ml.recommender.log_store import LogStore, normalize_logs
+from ml.service.ndjson import IngestReport, iter_batches, is_gzip
 
 # Giới hạn thread BLAS để tránh treo máy khi train
 os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
@@ -23,6 +27,11 @@ DATA_P = ROOT / "data" / "processed"
 STORE.mkdir(parents=True, exist_ok=True)
 DATA_P.mkdir(parents=True, exist_ok=True)
 
+# log tương tác: segment append-only trong data/processed/logs (recommender/log_store.py)
+LOGS = LogStore(DATA_P / "logs")
+# chu kỳ compaction nền (giây), 0 = tắt
+LOG_COMPACT_INTERVAL = float(os.environ.get("LOG_COMPACT_INTERVAL", "600"))
+
 def run_py(script: Path, *args: str):
     cmd = [sys.executable, str(script), *args]
     r = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8")
@@ -43,6 +52,37 @@ def run_py(script: Path, *args: str):
 
     
 
+# Recommender đã load (kèm index ANN) dùng lại giữa các request, load lại khi file model đổi (train/vectorize)
+_MODEL_FILES = ("als_model.npz", "mappings.json", "popularity.json")
+_QUIZZ_FILES = _MODEL_FILES + ("item_features.npz", "quiz_features.npz", "mappings_quizz.json")
+_RECS: Dict[str, Any] = {}
+_RECS_LOCK = threading.Lock()
+
+def _files_version(names) -> tuple:
+    out = []
+    for n in names:
+        try:
+            out.append((STORE / n).stat().st_mtime_ns)
+        except OSError:
+            out.append(None)
+    return tuple(out)
+
+def get_recommender(quizz: bool = False) -> Recommender:
+    kind, files = ("quizz", _QUIZZ_FILES) if quizz else ("als", _MODEL_FILES)
+    version = _files_version(files)
+    cached = _RECS.get(kind)
+    if cached and cached[0] == version:
+        return cached[1]
+    with _RECS_LOCK:
+        cached = _RECS.get(kind)
+        if cached and cached[0] == version:
+            return cached[1]
+        rec = Recommender().load()
+        if quizz:
+            rec.load_quizz()
+        _RECS[kind] = (version, rec)
+        return rec
+
 def write_jsonl(path: Path, rows: List[dict]) -> None:
     with open(path, "w", encoding="utf-8") as f:
         for r in rows:
@@ -60,23 +100,151 @@ def post_items(items: List[dict] = Body(...)):
     write_jsonl(DATA_P / "items.jsonl", items)
     return {"ok": True, "count": len(items)}
 
+def _migrate_csv_logs() -> None:
+    # logs.csv kiểu cũ → 1 segment (1 lần, dưới lock của log store), đổi tên để vectorize không đọc lại
+    LOGS.migrate_csv(DATA_P / "logs.csv")
+
+def _vectorize_watermark() -> Optional[int]:
+    # seq segment vectorize đã xử lý tới; compaction không gộp vắt qua mốc này
+    try:
+        wm = json.loads((STORE / "vectorize_state.json").read_text(encoding="utf-8"))["logs"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return int(wm["seq"]) if wm.get("kind") == "segments" else None
+
+def _compact_loop():
+    while True:
+        time.sleep(LOG_COMPACT_INTERVAL)
+        try:
+            for seg in LOGS.compact(boundary=_vectorize_watermark()):
+                print(f"[log_store] compacted → {seg.name} ({seg.rows} rows)")
+        except Exception as e:
+            print(f"[log_store] compaction failed: {e!r}")
+
+@APP.on_event("startup")
+def start_log_compaction():
+    _migrate_csv_logs()
+    if LOG_COMPACT_INTERVAL > 0:
+        threading.Thread(target=_compact_loop, name="log-compaction", daemon=True).start()
+
 @APP.post("/data/logs")
 def post_logs(
     logs: List[dict] = Body(...),
     mode: str = Query("replace", enum=["replace", "append"])
 ):
+    # mỗi request ghi 1 segment mới, không đọc lại / ghi lại log cũ
     import pandas as pd
-    path = DATA_P / "logs.csv"
-    df = pd.DataFrame(logs)
-    if mode == "append" and path.exists():
-        old = pd.read_csv(path)
-        df = pd.concat([old, df], ignore_index=True)
-    df.to_csv(path, index=False)
-    return {"ok": True, "count": int(len(df)), "mode": mode}
+    _migrate_csv_logs()
+    df = normalize_logs(pd.DataFrame(logs))
+    seg = LOGS.append(df) if mode == "append" else LOGS.replace(df)
+    return {"ok": True, "count": LOGS.rows(), "appended": int(len(df)), "mode": mode,
+            "segment": seg.name if seg else None}
+
+@APP.post("/pipeline/compact_logs")
+def pipeline_compact_logs():
+    segs = LOGS.compact(boundary=_vectorize_watermark())
+    return {"ok": True, "compacted": [s.name for s in segs], "segments": len(LOGS.segments()), "rows": LOGS.rows()}
+
+# ==== nạp dữ liệu dạng NDJSON theo luồng (application/x-ndjson, gzip tùy chọn) ====
+# body không parse cả khối: từng dòng được validate, batch ghi thẳng xuống file/segment rồi mới đọc tiếp
+def _item_record(obj):
+    if not isinstance(obj, dict):
+        return None, "record is not a JSON object"
+    if "_id" not in obj:
+        obj["_id"] = obj.get("theory_id") or obj.get("name") or str(len(obj))
+    return obj, None
+
+def _quiz_record(obj):
+    if not isinstance(obj, dict):
+        return None, "record is not a JSON object"
+    for key in ("_id", "theory_id"):
+        if key not in obj:
+            return None, f"missing {key}"
+    return obj, None
+
+def _log_record(obj):
+    if not isinstance(obj, dict):
+        return None, "record is not a JSON object"
+    for key in ("user_id", "theory_id"):
+        if obj.get(key) is None or not str(obj[key]).strip():
+            return None, f"missing {key}"
+    ts = next((obj[k] for k in ("ts", "timestamp", "createdAt", "created_at") if k in obj), None)
+    if ts is not None and (isinstance(ts, bool) or not isinstance(ts, (int, float, str))):
+        return None, "invalid ts"
+    return obj, None
+
+async def _ingest(request: Request, validate, write_batch, report: IngestReport) -> Optional[str]:
+    # lỗi giữa luồng (gzip hỏng, client ngắt) → trả lý do; các batch đã ghi có trong report
+    gz = is_gzip(request.headers.get("content-encoding"), request.headers.get("content-type"))
+    try:
+        async for batch in iter_batches(request.stream(), validate, report, gzip=gz):
+            info = await run_in_threadpool(write_batch, batch.records)
+            report.accepted += len(batch.records)
+            report.batches.append({"batch": batch.index, "accepted": len(batch.records),
+                                   "rejected": batch.rejected, **(info or {})})
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+def _stream_response(report: IngestReport, error: Optional[str], **extra):
+    body = {"ok": error is None, "count": report.accepted, **extra, **report.as_dict()}
+    if error:
+        return JSONResponse({**body, "error": error}, status_code=400)
+    return body
+
+async def _stream_jsonl(request: Request, path: Path, validate):
+    # ghi ra file tạm, đủ luồng mới thay file cũ (replace như POST /data/items, /data/quizzes)
+    report = IngestReport()
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    f = open(tmp, "w", encoding="utf-8")
+
+    def write(records):
+        f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+    try:
+        error = await _ingest(request, validate, write, report)
+    finally:
+        f.close()
+    if error:
+        tmp.unlink(missing_ok=True)
+    else:
+        os.replace(tmp, path)
+    return _stream_response(report, error)
+
+@APP.post("/data/items/stream")
+async def post_items_stream(request: Request):
+    return await _stream_jsonl(request, DATA_P / "items.jsonl", _item_record)
+
+@APP.post("/data/quizzes/stream")
+async def post_quizzes_stream(request: Request):
+    return await _stream_jsonl(request, DATA_P / "quizzes.jsonl", _quiz_record)
+
+@APP.post("/data/logs/stream")
+async def post_logs_stream(request: Request, mode: str = Query("append", enum=["replace", "append"])):
+    # mỗi batch = 1 segment; replace: batch ghi vào staging, đủ luồng mới thay log cũ (lỗi giữa chừng → log cũ giữ nguyên)
+    import pandas as pd
+    await run_in_threadpool(_migrate_csv_logs)
+    report = IngestReport()
+    staging = LOGS.staging() if mode == "replace" else None
+    target = LOGS if staging is None else staging
+
+    def write(records):
+        seg = target.append(normalize_logs(pd.DataFrame(records)))
+        return {"segment": seg.name if seg else None}
+
+    error = await _ingest(request, _log_record, write, report)
+    extra = {}
+    if staging is not None:
+        if error:
+            await run_in_threadpool(staging.discard)
+        else:
+            segs = await run_in_threadpool(LOGS.publish, staging)
+            extra["segments"] = [s.name for s in segs]
+    return _stream_response(report, error, mode=mode, total=LOGS.rows(), **extra)
 
 @APP.post("/pipeline/vectorize")
-def pipeline_vectorize():
-    return run_py(RECO / "vectorize.py")
+def pipeline_vectorize(full: bool = Query(False, description="build lại toàn bộ thay vì chỉ phần log mới")):
+    return run_py(RECO / "vectorize.py", *(["--full"] if full else []))
 
 @APP.post("/pipeline/train")
 def pipeline_train(
@@ -101,7 +269,7 @@ def pipeline_train(
 @APP.get("/recommend")
 def http_recommend(user_id: str, k: int = 6, section: Optional[str] = None, level: Optional[int] = None):
     # Model load và recommend
-    rec = Recommender().load()
+    rec = get_recommender()
     filt: Dict[str, Any] = {}
     if section:
         filt["section"] = section
@@ -136,7 +304,7 @@ def pipeline_vectorize_quizz():
 
 @APP.get("/recommend/quizz")
 def http_recommend_quizz(theory_id: str, k: int = 5):
-    rec = Recommender().load().load_quizz()
+    rec = get_recommender(quizz=True)
     ids, reasons = rec.recommend_quizz(theory_id=theory_id, k=k)
     return {
         "theory_id": theory_id,
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Đọc body NDJSON (application/x-ndjson, có thể gzip) theo luồng cho các endpoint /data/*/stream.
+
+Body được kéo từng chunk từ request.stream(), tách dòng, parse + validate từng bản ghi,
+gom thành batch batch_size bản ghi. Bên gọi ghi xong batch rồi mới đọc tiếp (await), nên
+client bị chặn theo TCP khi ghi chậm (backpressure) và RAM chỉ ~ 1 batch.
+"""
+from __future__ import annotations
+import json
+import os
+import zlib
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+NDJSON_BATCH = int(os.environ.get("NDJSON_BATCH", "5000"))
+# dòng dài hơn ngần này byte bị từ chối (không giữ cả dòng trong RAM)
+NDJSON_MAX_LINE = int(os.environ.get("NDJSON_MAX_LINE", str(1 << 20)))
+# số lý do từ chối tối đa trả về trong response (vẫn đếm đủ)
+NDJSON_MAX_ERRORS = int(os.environ.get("NDJSON_MAX_ERRORS", "100"))
+
+# validate(obj) → (bản ghi đã chuẩn hóa, None) hoặc (None, lý do từ chối)
+Validator = Callable[[object], Tuple[Optional[dict], Optional[str]]]
+
+
+@dataclass
+class Batch:
+    index: int
+    records: List[dict]
+    rejected: int
+
+
+@dataclass
+class IngestReport:
+    accepted: int = 0
+    rejected: int = 0
+    lines: int = 0
+    batches: List[dict] = field(default_factory=list)
+    errors: List[dict] = field(default_factory=list)
+
+    def reject(self, line: int, reason: str):
+        self.rejected += 1
+        if len(self.errors) < NDJSON_MAX_ERRORS:
+            self.errors.append({"line": line, "reason": reason})
+
+    def as_dict(self) -> dict:
+        return {"accepted": self.accepted, "rejected": self.rejected, "lines": self.lines,
+                "batches": self.batches, "errors": self.errors,
+                "errors_truncated": self.rejected > len(self.errors)}
+
+
+def is_gzip(content_encoding: Optional[str], content_type: Optional[str]) -> bool:
+    return "gzip" in (content_encoding or "").lower() or "gzip" in (content_type or "").lower()
+
+
+async def _inflated(chunks: AsyncIterator[bytes], gzip: bool) -> AsyncIterator[bytes]:
+    """ Giải nén gzip theo từng bước ≤ NDJSON_MAX_LINE byte (chunk nén nhỏ không bung ra cả trăm MB 1 lần). """
+    if not gzip:
+        async for chunk in chunks:
+            yield chunk
+        return
+    inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        while chunk:
+            yield inflate.decompress(chunk, NDJSON_MAX_LINE)
+            chunk = inflate.unconsumed_tail
+    yield inflate.flush()
+    if not inflate.eof:
+        raise ValueError("gzip body is truncated")
+
+
+async def _lines(chunks: AsyncIterator[bytes], gzip: bool) -> AsyncIterator[Optional[bytes]]:
+    """ Từng dòng (bytes); None thay cho dòng quá NDJSON_MAX_LINE (phần dư bị bỏ tới hết dòng). """
+    buf = bytearray()
+    skipping = False
+    async for chunk in _inflated(chunks, gzip):
+        parts = chunk.split(b"\n")
+        if len(parts) > 1:
+            if skipping:
+                skipping = False
+            else:
+                buf += parts[0]
+                yield bytes(buf) if len(buf) <= NDJSON_MAX_LINE else None
+            for line in parts[1:-1]:
+                yield line if len(line) <= NDJSON_MAX_LINE else None
+            buf = bytearray(parts[-1])
+        elif not skipping:
+            buf += parts[0]
+        if len(buf) > NDJSON_MAX_LINE:
+            yield None
+            buf, skipping = bytearray(), True
+    if buf.strip() and not skipping:
+        yield bytes(buf)
+
+
+async def iter_batches(chunks: AsyncIterator[bytes], validate: Validator, report: IngestReport,
+                       gzip: bool = False, batch_size: int = NDJSON_BATCH) -> AsyncIterator[Batch]:
+    """ Batch bản ghi hợp lệ; bản ghi lỗi được ghi vào report theo số dòng (từ 1, tính cả dòng trống). """
+    records: List[dict] = []
+    rejected = 0
+    index = 0
+    async for raw in _lines(chunks, gzip):
+        report.lines += 1
+        if raw is None:
+            report.reject(report.lines, f"line longer than {NDJSON_MAX_LINE} bytes")
+            rejected += 1
+            continue
+        if not raw.strip():
+            continue
+        try:
+            obj = json.loads(raw)
+        except ValueError as e:
+            report.reject(report.lines, f"invalid JSON: {e}")
+            rejected += 1
+            continue
+        rec, reason = validate(obj)
+        if reason:
+            report.reject(report.lines, reason)
+            rejected += 1
+            continue
+        records.append(rec)
+        if len(records) >= batch_size:
+            yield Batch(index, records, rejected)
+            index += 1
+            records, rejected = [], 0
+    if records or rejected:
+        yield Batch(index, records, rejected)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# import dạng package (ml.recommender..., ml.service...) như khi chạy uvicorn ml.service.main:APP từ ml-suite/
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from ml.recommender.features import build_features
+from ml.recommender.vectorize import build_vocab
+
+
+def _loop_features(df, vocab):
+    # builder cũ (itertuples) làm chuẩn so sánh
+    dim = vocab["dim"]
+    tag2i = {t: i for i, t in enumerate(vocab["tags"])}
+    skill2i = {s: i for i, s in enumerate(vocab["skills"])}
+    off = len(vocab["tags"])
+    rows, cols, data = [], [], []
+    for r, row in enumerate(df.itertuples(index=False)):
+        for t in row.tags:
+            if t in tag2i:
+                rows.append(r), cols.append(tag2i[t]), data.append(1.0)
+        for s in row.skills:
+            if s in skill2i:
+                rows.append(r), cols.append(off + skill2i[s]), data.append(1.0)
+        rows.append(r), cols.append(dim - 1), data.append(float(getattr(row, "difficulty", 3)) / 5.0)
+    X = sparse.csr_matrix((np.array(data, dtype=np.float32), (np.array(rows), np.array(cols))), shape=(len(df), dim))
+    n = np.sqrt(X.multiply(X).sum(1)).A.ravel() + 1e-8
+    return X.multiply(1.0 / n[:, None]).tocsr()
+
+
+def _items(n, seed=0):
+    rng = np.random.default_rng(seed)
+    tags = [f"t{i}" for i in range(30)]
+    skills = [f"s{i}" for i in range(12)]
+    return pd.DataFrame({
+        "_id": [f"i{i}" for i in range(n)],
+        # có dòng rỗng, nhãn lặp trong 1 dòng và nhãn ngoài vocab
+        "tags": [list(rng.choice(tags + ["lạ"], rng.integers(0, 5))) for _ in range(n)],
+        "skills": [list(rng.choice(skills, rng.integers(0, 4))) for _ in range(n)],
+        "difficulty": rng.integers(1, 6, n).astype(float),
+    })
+
+
+def test_matches_loop_builder():
+    df = _items(500)
+    vocab = build_vocab(df.assign(tags=df["tags"].map(lambda ts: [t for t in ts if t != "lạ"])))
+    X = build_features(df, vocab)
+    assert X.shape == (500, vocab["dim"])
+    assert X.dtype == np.float32 and X.indices.dtype == np.int32
+    np.testing.assert_allclose(X.toarray(), _loop_features(df, vocab).toarray(), atol=1e-6)
+    np.testing.assert_allclose(sparse.linalg.norm(X, axis=1), 1.0, atol=1e-5)
+
+
+def test_without_difficulty_column():
+    df = _items(20).drop(columns=["difficulty"])
+    vocab = build_vocab(df)
+    np.testing.assert_allclose(build_features(df, vocab).toarray(), _loop_features(df, vocab).toarray(), atol=1e-6)
+
+
+def test_empty_frame():
+    df = pd.DataFrame({"tags": [], "skills": [], "difficulty": []})
+    X = build_features(df, {"tags": ["a"], "skills": [], "dim": 2})
+    assert X.shape == (0, 2) and X.nnz == 0
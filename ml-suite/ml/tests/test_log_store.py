@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+from ml.recommender.log_store import LogStore, normalize_logs
+
+
+def _df(users, ts0=0):
+    return normalize_logs(pd.DataFrame({"user_id": users, "theory_id": ["t"] * len(users),
+                                        "ts": [ts0 + i for i in range(len(users))]}))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LogStore(tmp_path / "logs")
+
+
+def _users(store):
+    return sorted(u for df in store.iter_frames() for u in df["user_id"].astype(str))
+
+
+def test_compaction_respects_boundary(store):
+    for i in range(6):
+        store.append(_df([f"u{i}"], ts0=i * 10))
+    done = store.compact(boundary=3, target_rows=100, min_segments=2)
+    assert sorted((s.first, s.last) for s in done) == [(1, 3), (4, 6)]
+    assert [(s.first, s.last) for s in store.segments()] == [(1, 3), (4, 6)]
+    assert _users(store) == [f"u{i}" for i in range(6)]
+
+
+def test_compaction_skips_short_runs_and_big_segments(store):
+    store.append(_df(["a"]))
+    store.append(_df(["b"] * 5))
+    store.append(_df(["c"]))
+    assert store.compact(target_rows=5, min_segments=2) == []
+    assert len(store.segments()) == 3
+
+
+def test_compaction_keeps_replace(store):
+    store.append(_df(["old"]))
+    store.replace(_df(["n1"]))
+    store.append(_df(["n2"]))
+    store.compact(target_rows=100, min_segments=2)
+    assert _users(store) == ["n1", "n2"]
+
+
+def test_staged_replace_publishes_only_on_success(store):
+    store.append(_df(["old1", "old2"]))
+    staging = store.staging()
+    staging.append(_df(["n1"]))
+    staging.append(_df(["n2"]))
+    # chưa publish: reader vẫn thấy log cũ
+    assert _users(store) == ["old1", "old2"]
+    segs = store.publish(staging)
+    assert len(segs) == 2 and not staging.root.exists()
+    assert _users(store) == ["n1", "n2"]
+    assert [s.name for s in store.segments()] == [s.name for s in store._all_segments()]
+
+
+def test_staged_replace_discard_keeps_old(store):
+    store.append(_df(["old"]))
+    staging = store.staging()
+    staging.append(_df(["partial"]))
+    staging.discard()
+    assert _users(store) == ["old"] and not staging.root.exists()
+
+
+def test_publish_empty_staging_clears_log(store):
+    store.append(_df(["old"]))
+    store.publish(store.staging())
+    assert store.rows() == 0
+
+
+def test_migrate_csv_once(tmp_path, store):
+    csv = tmp_path / "logs.csv"
+    pd.DataFrame({"user_id": ["u1", "u2"], "theory_id": ["t", "t"]}).to_csv(csv, index=False)
+    assert store.migrate_csv(csv).rows == 2
+    assert store.migrate_csv(csv) is None
+    assert not csv.exists() and (tmp_path / "logs.csv.imported").exists()
+    assert store.rows() == 2
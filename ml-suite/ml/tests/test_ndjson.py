@@ -0,0 +1,65 @@
+import asyncio
+import gzip
+import json
+
+from ml.service import ndjson
+from ml.service.ndjson import IngestReport, is_gzip, iter_batches
+
+
+def _valid(obj):
+    if not isinstance(obj, dict):
+        return None, "record is not a JSON object"
+    return obj, None
+
+
+async def _chunks(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def _run(data: bytes, gz: bool = False, batch_size: int = 2):
+    report = IngestReport()
+
+    async def go():
+        return [b async for b in iter_batches(_chunks(data), _valid, report, gzip=gz, batch_size=batch_size)]
+    return asyncio.run(go()), report
+
+
+BODY = b'{"a": 1}\n\nnot json\n[1, 2]\n{"a": 2}\n{"a": 3}'
+
+
+def test_batches_and_rejections():
+    batches, report = _run(BODY)
+    assert [[r["a"] for r in b.records] for b in batches] == [[1, 2], [3]]
+    assert report.lines == 6
+    assert [e["line"] for e in report.errors] == [3, 4]
+    assert report.rejected == 2 and sum(b.rejected for b in batches) == 2
+
+
+def test_gzip_body():
+    batches, report = _run(gzip.compress(BODY), gz=True)
+    assert [r["a"] for b in batches for r in b.records] == [1, 2, 3]
+    assert report.rejected == 2
+
+
+def test_truncated_gzip_raises():
+    body = gzip.compress(b"\n".join(json.dumps({"a": i}).encode() for i in range(1000)))
+    try:
+        _run(body[:-20], gz=True, batch_size=100)
+    except ValueError as e:
+        assert "truncated" in str(e)
+    else:
+        raise AssertionError("truncated gzip accepted")
+
+
+def test_long_line_rejected(monkeypatch):
+    monkeypatch.setattr(ndjson, "NDJSON_MAX_LINE", 16)
+    body = b'{"a": 1}\n{"a": "' + b"x" * 100 + b'"}\n{"a": 2}\n'
+    batches, report = _run(body, batch_size=10)
+    assert [r["a"] for b in batches for r in b.records] == [1, 2]
+    assert report.errors[0]["line"] == 2 and "longer" in report.errors[0]["reason"]
+
+
+def test_is_gzip():
+    assert is_gzip("gzip", None) and is_gzip(None, "application/x-ndjson+gzip")
+    assert not is_gzip(None, "application/x-ndjson")
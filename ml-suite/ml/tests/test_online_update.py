@@ -0,0 +1,11 @@
+import numpy as np
+
+from ml.recommender.online_update import orient_factors
+
+
+def test_orient_factors_swaps_transposed_fit():
+    users, items = np.ones((5, 4)), np.zeros((3, 4))
+    U, V = orient_factors(items, users, n_users=5, n_items=3)
+    assert U is users and V is items
+    U, V = orient_factors(users, items, n_users=5, n_items=3)
+    assert U is users and V is items
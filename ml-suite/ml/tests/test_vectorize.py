@@ -0,0 +1,88 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from ml.recommender import vectorize
+from ml.recommender.log_store import LogStore, normalize_logs
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    data, store = tmp_path / "data", tmp_path / "store"
+    data.mkdir(), store.mkdir()
+    monkeypatch.setattr(vectorize, "DATA", data)
+    monkeypatch.setattr(vectorize, "STORE", store)
+    monkeypatch.setattr(vectorize, "LOG_DIR", data / "logs")
+    load_items = vectorize.load_items
+    monkeypatch.setattr(vectorize, "load_items", lambda: load_items(data / "items.jsonl"))
+    return data, store
+
+
+def _write_items(data, ids):
+    with open(data / "items.jsonl", "w", encoding="utf-8") as f:
+        for i, it in enumerate(ids):
+            f.write(json.dumps({"_id": it, "tags": [f"t{i % 3}"], "skills": [f"s{i % 2}"], "difficulty": 1 + i % 5}) + "\n")
+
+
+def _append_logs(data, n, items, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"user_id": [f"u{x}" for x in rng.integers(0, 40, n)],
+                       "theory_id": rng.choice(items, n),
+                       "event": rng.choice(["view", "complete"], n)})
+    LogStore(data / "logs").append(normalize_logs(df))
+
+
+def _snapshot(store):
+    # so theo id (full build sắp user theo id, incremental nối user mới vào cuối)
+    m = json.loads((store / "mappings.json").read_text(encoding="utf-8"))
+    R = sparse.load_npz(store / "interactions.npz").tocoo()
+    cells = {(m["idx2user"][str(r)], m["idx2item"][str(c)]): float(v) for r, c, v in zip(R.row, R.col, R.data) if v}
+    X = sparse.load_npz(store / "item_features.npz").toarray()
+    feats = {m["idx2item"][str(i)]: X[i] for i in range(X.shape[0])}
+    pop = json.loads((store / "popularity.json").read_text(encoding="utf-8"))
+    meta = json.loads((store / "vectorize_meta.json").read_text(encoding="utf-8"))
+    return cells, feats, pop, meta["logs"]["mode"]
+
+
+def test_incremental_matches_full(env):
+    data, store = env
+    old = [f"i{i}" for i in range(20)]
+    _write_items(data, old)
+    _append_logs(data, 500, old, seed=1)
+    vectorize.main(["--full"])
+
+    # item mới + log mới (event của item mới chỉ nằm trong segment mới)
+    new = old + ["i20", "i21"]
+    _write_items(data, new)
+    _append_logs(data, 300, new, seed=2)
+    _append_logs(data, 200, new, seed=3)
+    vectorize.main([])
+    cells, feats, pop, mode = _snapshot(store)
+    assert mode == "incremental"
+
+    vectorize.main(["--full"])
+    full_cells, full_feats, full_pop, full_mode = _snapshot(store)
+    assert full_mode == "full"
+
+    assert cells.keys() == full_cells.keys()
+    for key, v in full_cells.items():
+        assert cells[key] == pytest.approx(v, rel=1e-6)
+    assert feats.keys() == full_feats.keys()
+    for it, row in full_feats.items():
+        np.testing.assert_allclose(feats[it], row, atol=1e-6)
+    assert pop == pytest.approx(full_pop, rel=1e-6)
+
+
+def test_replace_forces_full_rebuild(env):
+    data, store = env
+    items = [f"i{i}" for i in range(5)]
+    _write_items(data, items)
+    _append_logs(data, 50, items, seed=1)
+    vectorize.main([])
+    LogStore(data / "logs").replace(normalize_logs(pd.DataFrame({"user_id": ["x"], "theory_id": ["i0"]})))
+    vectorize.main([])
+    cells, _, _, mode = _snapshot(store)
+    assert mode == "full" and list(cells) == [("x", "i0")]